@@ -1,15 +1,19 @@
-import pythoncom
-pythoncom.CoInitialize()
+try:
+    import pythoncom
+    pythoncom.CoInitialize()
+except ImportError:
+    # not on Windows, only the simulated sensors ('sim') can be used
+    pythoncom = None
 import yaml
 import sys
 from PyQt5 import QtWidgets
 from ScopeFoundry import BaseMicroscopeApp
-from HW_MetaMotionRL import MetaMotionRLHW
 from HW_USB_TTL import USBTTLHardware
 from UI_USB_TTL import USBTTLMonitorUI
 from UI_MetaMotionRL import MetaWearUI
 from UI_Mobile_Control import MobileControllerUI
 from UI_Experiment_Control import ExperimentControllerUI
+from app_scheduler import TimerService
 
 class AgencySensor(BaseMicroscopeApp):
 
@@ -35,6 +39,10 @@ class AgencySensor(BaseMicroscopeApp):
             'hebrew': {'min': 5000, 'max': 5999, 'initial': 5000}
         })
         
+        # every configured sensor set, to show which of them are in BLE range
+        self.configured_macs = {set_name: {item['name']: item['MAC'] for item in config.get(f'hardware_{set_name}', [])}
+                                for set_name in ('shiba', 'hebrew')}
+
         if len(argv) > 1:
             if argv[1] == 'shiba':
                 hardware_configs = {item['name']: item['MAC'] for item in config['hardware_shiba']}
@@ -42,11 +50,21 @@ class AgencySensor(BaseMicroscopeApp):
             elif argv[1] == 'hebrew':
                 hardware_configs = {item['name']: item['MAC'] for item in config['hardware_hebrew']}
                 self.hardware_type = 'hebrew'
+            elif argv[1] == 'sim':
+                # simulated sensors, no BLE needed: python Agency_Sensor_MAIN.py sim [recorded.sensor.h5]
+                hardware_configs = {name: f"SIM:00:00:00:00:0{i}" for i, name in
+                                    enumerate(['LeftHandMeta', 'RightHandMeta', 'LeftLegMeta', 'RightLegMeta'])}
+                self.hardware_type = 'sim'
+                self.configured_macs = {'sim': hardware_configs}
             
         self.left_hand_mac = hardware_configs['LeftHandMeta']
         self.right_hand_mac = hardware_configs['RightHandMeta']
         self.left_leg_mac = hardware_configs['LeftLegMeta']
         self.right_leg_mac = hardware_configs['RightLegMeta']
+        self.replay_file = argv[2] if len(argv) > 2 else ''
+        # one timer thread for the whole app: battery polls, step timers, mobile dead times
+        self.timers = TimerService()
+        self.timers.start()
         # run the BaseMicroscopeApp __init__ function
         BaseMicroscopeApp.__init__(self, argv, dark_mode=dark_mode)
 
@@ -63,10 +81,18 @@ class AgencySensor(BaseMicroscopeApp):
         #Add hardware components
         print("Adding Hardware Components")
         
-        self.add_hardware(MetaMotionRLHW(self, name='LeftHandMeta', MAC=self.left_hand_mac))
-        self.add_hardware(MetaMotionRLHW(self, name='RightHandMeta', MAC=self.right_hand_mac))
-        self.add_hardware(MetaMotionRLHW(self, name='LeftLegMeta', MAC=self.left_leg_mac))
-        self.add_hardware(MetaMotionRLHW(self, name='RightLegMeta', MAC=self.right_leg_mac))
+        if self.hardware_type == 'sim':
+            from HW_MetaMotionRL_Sim import MetaMotionRLSimHW
+            sensor_args = dict(replay_file=self.replay_file)
+            SensorHW = MetaMotionRLSimHW
+        else:
+            from HW_MetaMotionRL import MetaMotionRLHW
+            sensor_args = dict()
+            SensorHW = MetaMotionRLHW
+        self.add_hardware(SensorHW(self, name='LeftHandMeta', MAC=self.left_hand_mac, **sensor_args))
+        self.add_hardware(SensorHW(self, name='RightHandMeta', MAC=self.right_hand_mac, **sensor_args))
+        self.add_hardware(SensorHW(self, name='LeftLegMeta', MAC=self.left_leg_mac, **sensor_args))
+        self.add_hardware(SensorHW(self, name='RightLegMeta', MAC=self.right_leg_mac, **sensor_args))
         
         # Add USB TTL Module
         self.add_hardware(USBTTLHardware(self, port=self.ttl_port))
@@ -12,26 +12,32 @@ import pdb
 from time import sleep
 e = Event()
 import threading
-from apscheduler.schedulers.background import BackgroundScheduler
 from datetime import datetime
+from sensor_data import AccelerationData
+from fusion_parse import FusionBatcher
+from clock_sync import ClockAligner
+from ble_registry import BleScannerService
+from stream_watchdog import StreamWatchdog
+from sensor_telemetry import SensorTelemetry
 
-class AccelerationData:
-    def __init__(self, acc_x, acc_y, acc_z, time):
-        self.acc_x = acc_x
-        self.acc_y = acc_y
-        self.acc_z = acc_z
-        self.time = time  # QTime object for time
-        self.acceleration = np.sqrt(acc_x**2 + acc_y**2 + acc_z**2)
+# bounded waits for board responses, so a silent device cannot block connect/disconnect forever
+PROCESSOR_TIMEOUT = 10.0 # seconds to wait for the time processor to be created
+DISCONNECT_TIMEOUT = 5.0 # seconds to wait for the board to drop the connection after a reset
+SCAN_DURATION = 10.0 # seconds of a scan started from the scan_for_devices operation
+
+# one scanner and device registry shared by all sensors, warble supports a single scan at a time
+SCANNER = BleScannerService(BleScanner, service_uuid=MetaWear.GATT_SERVICE)
 
-    def __repr__(self):
-        return f"AccelerationData(acc_x={self.acc_x}, acc_y={self.acc_y}, acc_z={self.acc_z}, time={self.time.toString('HH:mm:ss')})"
-    
 
 class MetaMotionRLHW(HardwareComponent):
     
     ## Define name of this hardware plug-in
     name = 'MetaMotionRL'
     acc_data_updated = pyqtSignal(AccelerationData)
+    # (n, 7) float64 blocks in sensor_buffers.BLOCK_COLUMNS order, see sensor_buffers.SampleBatcher
+    acc_block_updated = pyqtSignal(object)
+    # stream_watchdog.StreamGap, emitted when a stalled stream delivers samples again
+    stream_gap = pyqtSignal(object)
 
     def __init__(self, app, name=None, debug=False, MAC="F3:F1:E2:D3:6E:A7"):
         self.debug = debug
@@ -40,7 +46,7 @@ class MetaMotionRLHW(HardwareComponent):
         self.data_fusion_is_running = False
         HardwareComponent.__init__(self, app, name=name)
         self.callback = FnVoid_VoidP_DataP(self.data_handler)
-        self.call_count = 0
+        self.samples_per_second = 0
         #self.e = Event()
 
     def setup(self):
@@ -55,18 +61,85 @@ class MetaMotionRLHW(HardwareComponent):
         self.settings.New(name='data_read_samples_per_second', initial=0, dtype=int, ro=True)
         self.settings.New(name='battery_charge', initial=0, dtype=int, ro=True)
         self.settings.New(name='battery_voltage', initial=0, dtype=int, ro=True)
+        # samples are delivered in blocks collected over this window, 0 delivers every sample on its own
+        self.settings.New(name='delivery_window_ms', initial=10.0, dtype=float, unit='ms', ro=False, vmin=0, vmax=100)
+        # device clock relative to the host clock, estimated from the sample timestamps
+        self.settings.New(name='clock_offset_ms', initial=0.0, dtype=float, unit='ms', ro=True)
+        self.settings.New(name='clock_drift_ppm', initial=0.0, dtype=float, ro=True)
+        # sample times come from the device clock, mapped onto the host clock by the aligner
+        self.batcher = FusionBatcher(self.deliver_block, DataTypeId.CARTESIAN_FLOAT,
+                                     window=self.settings['delivery_window_ms'] / 1000, aligner=ClockAligner())
+        self.settings.delivery_window_ms.add_listener(self.set_delivery_window)
+        # reconnect a stream that stalls for stall_periods sample periods (at least a second)
+        self.settings.New(name='watchdog_enabled', initial=True, dtype=bool, ro=False)
+        self.settings.New(name='stall_periods', initial=100, dtype=int, unit='samples', ro=False, vmin=10)
+        self.settings.New(name='stream_state', initial='idle', dtype=str, ro=True)
+        self.settings.New(name='stream_reconnects', initial=0, dtype=int, ro=True)
+        self.watchdog = StreamWatchdog(self.reconnect_stream, on_gap=self.report_gap, name=f"{self.name}_watchdog")
+        # rate, interval, loss and callback time statistics, updated off the callback thread by update_telemetry
+        self.telemetry = SensorTelemetry(self.name)
         self.add_operation(name='start_stream', op_func=self.start_data_fusion_stream_operation)
         self.add_operation(name='stop_stream', op_func=self.stop_data_fusion_stream_operation)
         self.add_operation(name='scan_for_devices', op_func=self.scan_for_devices)
         self.battery_charge = 0 # battery charge in percentage
         self.battery_voltage = 0 # battery voltage in volts
+        # called with (charge, voltage) for every battery response, see battery_monitor.BatteryMonitor
+        self.battery_listener = None
+        # plain callables run on the sensor callback thread, with every block and every AccelerationData
+        # sample; consumers hand the data to a sensor_ingestion.IngestionWorker instead of a Qt slot
+        self.block_listeners = []
+        self.sample_listeners = []
+
+    def update_clock_settings(self):
+        aligner = self.batcher.aligner
+        if aligner.offset is not None:
+            self.settings['clock_offset_ms'] = aligner.offset * 1000
+            self.settings['clock_drift_ppm'] = aligner.drift * 1e6
+
+    def set_delivery_window(self):
+        self.batcher.window = self.settings['delivery_window_ms'] / 1000
+
+    def deliver_block(self, block):
+        self.telemetry.add_block(block)
+        self.watchdog.feed(block[:, 0])
+        for listener in self.block_listeners:
+            listener(block)
+        self.acc_block_updated.emit(block)
+
+    def report_gap(self, gap):
+        print(f"{self.name}: streaming again after a {gap.duration:.1f} s gap and {gap.reconnects} reconnect attempts")
+        self.settings['stream_state'] = 'streaming'
+        self.stream_gap.emit(gap)
+
+    def reconnect_stream(self):
+        """
+        Called by the watchdog when the stream stalled: links the existing board again,
+        re-subscribes its fusion time processor and restarts streaming. The board keeps its
+        fusion configuration and the processor over a dropped link, so no processor is created,
+        and the clock alignment and telemetry carry on across the gap. The battery job keeps running.
+        """
+        self.settings['stream_state'] = 'reconnecting'
+        self.settings['stream_reconnects'] += 1
+        try:
+            self.device.disconnect()
+        except Exception as err:
+            print(f"{self.name}: closing the stalled connection failed: {err}")
+        # samples received before the stall go out before the ones of the new link
+        self.batcher.flush()
+        self.device.connect()
+        libmetawear.mbl_mw_settings_set_connection_parameters(self.device.board, 7.5, 7.5, 0, 6000)
+        libmetawear.mbl_mw_datasignal_subscribe(self.processor, None, self.callback)
+        libmetawear.mbl_mw_datasignal_subscribe(self.battery_signal, None, self.bat_wrapper)
+        self.start_data_fusion_stream(True)
+
+    @property
+    def registry(self):
+        return SCANNER.registry
 
     def scan_for_devices(self):
+        # runs in the background, the results show up in the registry
         print("Scanning for devices")
-        BleScanner.start()
-        sleep(10)
-        BleScanner.stop()
-        print("Scanning for devices complete")
+        SCANNER.scan(SCAN_DURATION)
 
     def data_handler(self, ctx, data):
         """
@@ -75,40 +148,46 @@ class MetaMotionRLHW(HardwareComponent):
             ctx: The context in which the data is received.
             data: The raw data received from the sensor.
         Processes:
-            - Parses the raw data to extract acceleration values.
-            - Computes the magnitude of the acceleration vector.
-            - Emits the updated acceleration data with a timestamp.
-            - Calculates and prints the number of times this function is called per second.
-        Attributes:
-            last_time (float): The timestamp of the last function call.
-            call_count (int): The number of times the function has been called in the current second.
+            - Copies the CartesianFloat payload and device epoch into the batcher records
+              (parse_value is only used for other payload types).
+            - Emits blocks of samples with their magnitudes once per delivery window.
+            - Passes per-sample acceleration data to the sample listeners (and emits it when a
+              slot is connected).
+            - Records its own execution time for the telemetry, rates and intervals are
+              computed from the delivered blocks by update_telemetry.
         """
-        acc_data = parse_value(data)
-        #acc_data = np.sqrt(acc_data.x**2 + acc_data.y**2 + acc_data.z**2)
-        # insert a breakpoint here to debug the data
-        #print(acc_data.x, acc_data.y, acc_data.z)
-        x = acc_data.x
-        y = acc_data.y
-        z = acc_data.z
-        self.acc_data_updated.emit(AccelerationData(x, y, z, time.time()))
+        t0 = time.perf_counter()
+        current_time = time.time()
+        # batched delivery, one acc_block_updated signal per delivery window
+        # fast path: the LINEAR_ACC payload is copied straight into the batcher records
+        if not self.batcher.add_data(data, current_time):
+            acc_data = parse_value(data)
+            self.batcher.add(current_time, acc_data.x, acc_data.y, acc_data.z, device_time=data.contents.epoch / 1000)
+        # per-sample delivery only when a latency sensitive consumer (e.g. the mobile model) is connected
+        if self.sample_listeners or self.receivers(self.acc_data_updated) > 0:
+            x, y, z = self.batcher.last_sample()
+            sample = AccelerationData(x, y, z, current_time)
+            for listener in self.sample_listeners:
+                listener(sample)
+            if self.receivers(self.acc_data_updated) > 0:
+                self.acc_data_updated.emit(sample)
         
         #print("Linear Acceleration: ({0}, {1}, {2})".format(data.x, data.y, data.z))
         #print(parse_value(data), data.contents.epoch)
-        # construct code to calculate the times per second this function is called
-        current_time = time.time()
-        if not hasattr(self, 'last_time'):
-            self.last_time = current_time
-            self.call_count = 0
-        self.call_count += 1
-        elapsed_time = current_time - self.last_time
-        if elapsed_time >= 1.0:
-            #self.settings.data_read_samples_per_second.value = self.call_count
-            self.settings.data_read_samples_per_second.read_from_hardware()
-            print(f"{self.name} called {self.call_count} times in the last second")
-            self.call_count = 0
-            self.last_time = current_time
-        
-        
+        self.telemetry.record_callback(time.perf_counter() - t0)
+
+    def update_telemetry(self):
+        """
+        Called about once a second from the app timer thread: updates the
+        telemetry and the rate and clock settings. Returns the SensorTelemetry.
+        """
+        # the time processor period is a whole number of ms, so this is the rate the sensor really streams at
+        self.telemetry.data_rate = 1000 / int(1000 / self.settings['data_rate'])
+        stats = self.telemetry.update()
+        self.samples_per_second = int(round(stats['rate']))
+        self.settings.data_read_samples_per_second.read_from_hardware()
+        self.update_clock_settings()
+        return self.telemetry
 
     def start_data_fusion_stream(self, start):
         self.data_fusion_is_running = start
@@ -116,9 +195,17 @@ class MetaMotionRLHW(HardwareComponent):
             print("start Streaming")
             libmetawear.mbl_mw_sensor_fusion_enable_data(self.device.board, SensorFusionData.LINEAR_ACC)
             libmetawear.mbl_mw_sensor_fusion_start(self.device.board)
+            if self.settings['watchdog_enabled']:
+                self.watchdog.data_rate = self.settings['data_rate']
+                self.watchdog.stall_periods = self.settings['stall_periods']
+                self.watchdog.arm()
+                self.settings['stream_state'] = 'streaming'
         else:
             print("stop Streaming via button press")
+            self.watchdog.disarm()
+            self.settings['stream_state'] = 'idle'
             libmetawear.mbl_mw_sensor_fusion_stop(self.device.board)
+            self.batcher.flush()
 
     def start_data_fusion_stream_operation(self):
         print("start Streaming")
@@ -158,7 +245,7 @@ class MetaMotionRLHW(HardwareComponent):
         libmetawear.mbl_mw_dataprocessor_time_modify_period(self.processor, period)    
 
     def read_call_count(self):
-        return self.call_count
+        return self.samples_per_second
     
     def read_battery_charge_thread(self):
         # read battery state
@@ -170,15 +257,22 @@ class MetaMotionRLHW(HardwareComponent):
         self.battery_voltage = value.voltage # battery voltage in volts
         self.settings.battery_charge.read_from_hardware()
         self.settings.battery_voltage.read_from_hardware()
+        if self.battery_listener is not None:
+            self.battery_listener(self.battery_charge, self.battery_voltage)
         #print("Battery charge: ", self.battery_charge)
         #print("Battery voltage: ", self.battery_voltage)
         
     def connect(self):
-        # Open connection to the device:
-        #BleScanner.start()
-
-        #sleep(10.0)
-        #BleScanner.stop()
+        # new device session, start the clock alignment and the loss count from scratch
+        self.batcher.aligner = ClockAligner()
+        self.telemetry.reset()
+        # Open connection to the device, the registry is only looked up (a scan here would block
+        # every connect and reconnect), a device without a recent sighting is connected by MAC directly
+        sighting = SCANNER.registry.get(self.settings['MAC'])
+        if sighting is None:
+            print(f"{self.name}: {self.settings['MAC']} not seen in a recent scan, connecting by MAC")
+        else:
+            print(f"{self.name}: {self.settings['MAC']} in range, rssi {sighting.rssi} dBm")
         self.device = MetaWear(self.settings['MAC'])
         self.device.connect()
 
@@ -209,7 +303,8 @@ class MetaMotionRLHW(HardwareComponent):
         #libmetawear.mbl_mw_dataprocessor_time_create(self.signal, TimeMode.ABSOLUTE, 1000, None, FnVoid_VoidP_VoidP(self.processor_created))
         period = int(1000/self.settings.data_rate.value)
         libmetawear.mbl_mw_dataprocessor_time_create(self.signal, TimeMode.ABSOLUTE, period, None, fn_wrapper)
-        e.wait()
+        if not e.wait(PROCESSOR_TIMEOUT):
+            raise TimeoutError(f"{self.name}: time processor was not created within {PROCESSOR_TIMEOUT} s")
 
         libmetawear.mbl_mw_datasignal_subscribe(self.processor, None, self.callback)
         #self.e.wait()
@@ -229,15 +324,15 @@ class MetaMotionRLHW(HardwareComponent):
         libmetawear.mbl_mw_datasignal_read(self.battery_signal)
         
         #libmetawear.mbl_mw_datasignal_read(self.battery_signal)
-        self.scheduler = BackgroundScheduler()
-        self.scheduler.add_job(self.read_battery_charge_thread, 'interval', seconds=1)
-        self.scheduler.start()
+        # further reads are made by the battery monitor of the MetaWear measurement, rarely while streaming
         
     def disconnect(self):
+        # a disconnect on purpose is not a stall
+        self.watchdog.disarm()
+        self.settings['stream_state'] = 'idle'
 
         try:
             # disconnect from hardware
-            self.scheduler.shutdown()
 
             #libmetawear.mbl_mw_sensor_fusion_start(self.device.board)
             if self.data_fusion_is_running:
@@ -260,7 +355,8 @@ class MetaMotionRLHW(HardwareComponent):
             e = Event()
             self.device.on_disconnect = lambda s: e.set()
             libmetawear.mbl_mw_debug_reset(self.device.board)
-            e.wait()
+            if not e.wait(DISCONNECT_TIMEOUT):
+                print(f"{self.name}: no disconnect event within {DISCONNECT_TIMEOUT} s, continuing")
         
         except AttributeError:
             print("called before device was connected")
@@ -0,0 +1,321 @@
+from ScopeFoundry import HardwareComponent
+import numpy as np
+from PyQt5.QtCore import pyqtSignal
+import time
+import threading
+import h5py
+from sensor_data import AccelerationData
+from sensor_buffers import SampleBatcher
+from clock_sync import ClockAligner
+from h5_storage import read_samples, SENSOR_GROUP, LIMB_DATASETS
+from ble_registry import DeviceRegistry
+from stream_watchdog import StreamWatchdog
+from sensor_telemetry import SensorTelemetry
+
+# simulated sensors are always in range, they show up in the registry when scanned for
+REGISTRY = DeviceRegistry()
+
+
+class SyntheticSource(object):
+    """
+    Synthetic linear acceleration stream: slow limb movements plus sensor noise,
+    sampled at ``data_rate`` with Gaussian timing jitter and random dropouts.
+
+    Dropouts start with ``dropout_probability`` per sample and last on average
+    ``dropout_length`` samples, the clock keeps running during a dropout like
+    it does when BLE packets are lost.
+    """
+
+    def __init__(self, data_rate=100, jitter=0.0, dropout_probability=0.0, dropout_length=10, seed=None):
+        self.data_rate = data_rate
+        self.jitter = jitter
+        self.dropout_probability = dropout_probability
+        self.dropout_length = dropout_length
+        self.rng = np.random.default_rng(seed)
+        self.phase = self.rng.uniform(0, 2 * np.pi, 3)
+        self.frequency = self.rng.uniform(0.2, 1.5, 3)
+        self.n = 0
+        self.dropout_remaining = 0
+
+    def next_interval(self):
+        """Seconds until the next sample is due."""
+        interval = 1.0 / self.data_rate
+        if self.jitter > 0:
+            interval = max(0.0, interval + self.rng.normal(0, self.jitter))
+        return interval
+
+    def next_sample(self):
+        """(acc_x, acc_y, acc_z) of the next sample, or None when the sample is dropped."""
+        t = self.n / self.data_rate
+        self.n += 1
+        if self.dropout_remaining > 0:
+            self.dropout_remaining -= 1
+            return None
+        if self.dropout_probability > 0 and self.rng.random() < self.dropout_probability:
+            self.dropout_remaining = self.rng.geometric(1.0 / max(1, self.dropout_length)) - 1
+            return None
+        acc = 0.3 * np.sin(2 * np.pi * self.frequency * t + self.phase) + self.rng.normal(0, 0.02, 3)
+        return float(acc[0]), float(acc[1]), float(acc[2])
+
+
+class ReplaySource(object):
+    """
+    Replays one limb of a recorded .sensor.h5 file with its original sample
+    spacing, ``speed`` times faster than real time. Loops at the end of the file.
+    """
+
+    def __init__(self, fname, limb=LIMB_DATASETS[0], speed=1.0):
+        with h5py.File(fname, 'r') as h5file:
+            self.samples = read_samples(h5file[SENSOR_GROUP][limb])
+        if len(self.samples) < 2:
+            raise ValueError(f"{fname} has fewer than 2 samples in {limb}")
+        self.speed = speed
+        intervals = np.diff(self.samples[:, 0])
+        # the loop-around interval is the median spacing
+        self.intervals = np.append(intervals.clip(0), np.median(intervals)) / speed
+        self.n = 0
+
+    def next_interval(self):
+        return self.intervals[(self.n - 1) % len(self.samples)] if self.n else 0.0
+
+    def next_sample(self):
+        row = self.samples[self.n % len(self.samples)]
+        self.n += 1
+        return float(row[1]), float(row[2]), float(row[3])
+
+
+class SimulatedStream(threading.Thread):
+    """
+    Calls ``emit(acc_x, acc_y, acc_z, t, device_time)`` for every sample of
+    ``source`` at the time it is due, from its own thread like the libmetawear
+    callback thread. Samples that are due together (after a late wake-up) are
+    emitted back to back, which reproduces the bursty delivery of BLE
+    connection intervals. ``device_time`` is the due time on a simulated
+    sensor clock that runs ``clock_drift`` (e.g. 50e-6) fast.
+    """
+
+    def __init__(self, source, emit, name='SimulatedStream', clock_drift=0.0):
+        threading.Thread.__init__(self, name=name, daemon=True)
+        self.source = source
+        self.emit = emit
+        self.clock_drift = clock_drift
+        self.streaming = threading.Event()
+        self.stop_event = threading.Event()
+        self.samples_emitted = 0
+
+    def run(self):
+        next_time = start = time.perf_counter()
+        device_start = time.time()
+        while not self.stop_event.is_set():
+            if not self.streaming.wait(0.1):
+                continue
+            now = time.perf_counter()
+            if next_time < now - 1.0:
+                # paused or stalled for a long time, do not replay the backlog at once
+                next_time = now
+            while next_time <= now:
+                sample = self.source.next_sample()
+                device_time = device_start + (next_time - start) * (1 + self.clock_drift)
+                next_time += self.source.next_interval()
+                if sample is not None:
+                    self.emit(sample[0], sample[1], sample[2], time.time(), device_time)
+                    self.samples_emitted += 1
+            time.sleep(max(0.0, min(0.005, next_time - time.perf_counter())))
+
+    def stop(self, timeout=1.0):
+        self.stop_event.set()
+        self.join(timeout)
+
+
+class MetaMotionRLSimHW(HardwareComponent):
+    """
+    Drop-in replacement for MetaMotionRLHW without BLE: same settings, same
+    signals and listeners, samples from a SyntheticSource or a ReplaySource.
+    """
+
+    ## Define name of this hardware plug-in
+    name = 'MetaMotionRLSim'
+    acc_data_updated = pyqtSignal(AccelerationData)
+    # (n, 7) float64 blocks in sensor_buffers.BLOCK_COLUMNS order, see sensor_buffers.SampleBatcher
+    acc_block_updated = pyqtSignal(object)
+    # stream_watchdog.StreamGap, emitted when a stalled stream delivers samples again
+    stream_gap = pyqtSignal(object)
+
+    def __init__(self, app, name=None, debug=False, MAC="SIM:00:00:00:00:00", replay_file=''):
+        self.debug = debug
+        self.MAC = MAC
+        self.name = name
+        self.replay_file = replay_file
+        HardwareComponent.__init__(self, app, name=name)
+        self.samples_per_second = 0
+
+    def setup(self):
+        self.settings.New(name='MAC', initial=self.MAC, dtype=str, ro=False)
+        self.settings.New(name='start_streaming', initial=False, dtype=bool, ro=False)
+        self.settings.New(name='acceleration_range', initial='_8G', dtype=str, ro=False, choices=[('2G', "_2G"), ('4G', "_4G"), ('8G', "_8G"), ('16G', "_16G")])
+        self.settings.New(name='data_rate', initial=101, dtype=int, ro=False, vmin=1, vmax=200)
+        self.settings.New(name='data_read_samples_per_second', initial=0, dtype=int, ro=True)
+        self.settings.New(name='battery_charge', initial=0, dtype=int, ro=True)
+        self.settings.New(name='battery_voltage', initial=0, dtype=int, ro=True)
+        # samples are delivered in blocks collected over this window, 0 delivers every sample on its own
+        self.settings.New(name='delivery_window_ms', initial=10.0, dtype=float, unit='ms', ro=False, vmin=0, vmax=100)
+        # device clock relative to the host clock, estimated from the sample timestamps
+        self.settings.New(name='clock_offset_ms', initial=0.0, dtype=float, unit='ms', ro=True)
+        self.settings.New(name='clock_drift_ppm', initial=0.0, dtype=float, ro=True)
+        self.batcher = SampleBatcher(self.deliver_block, window=self.settings['delivery_window_ms'] / 1000,
+                                     aligner=ClockAligner())
+        self.settings.delivery_window_ms.add_listener(self.set_delivery_window)
+        # simulation settings
+        self.settings.New(name='source', initial='replay' if self.replay_file else 'synthetic', dtype=str,
+                          choices=['synthetic', 'replay'])
+        self.settings.New(name='jitter', initial=0.002, dtype=float, unit='s', vmin=0.0)
+        self.settings.New(name='dropout_probability', initial=0.0, dtype=float, vmin=0.0, vmax=1.0)
+        self.settings.New(name='dropout_length', initial=10, dtype=int, vmin=1)
+        self.settings.New(name='replay_file', initial=self.replay_file, dtype='file')
+        self.settings.New(name='replay_limb', initial=LIMB_DATASETS[0], dtype=str, choices=list(LIMB_DATASETS))
+        self.settings.New(name='replay_speed', initial=1.0, dtype=float, vmin=0.01)
+        # reconnect a stream that stalls for stall_periods sample periods (at least a second)
+        self.settings.New(name='watchdog_enabled', initial=True, dtype=bool, ro=False)
+        self.settings.New(name='stall_periods', initial=100, dtype=int, unit='samples', ro=False, vmin=10)
+        self.settings.New(name='stream_state', initial='idle', dtype=str, ro=True)
+        self.settings.New(name='stream_reconnects', initial=0, dtype=int, ro=True)
+        self.watchdog = StreamWatchdog(self.reconnect_stream, on_gap=self.report_gap, name=f"{self.name}_watchdog")
+        # rate, interval, loss and callback time statistics, updated off the callback thread by update_telemetry
+        self.telemetry = SensorTelemetry(self.name)
+        self.add_operation(name='start_stream', op_func=lambda: self.start_data_fusion_stream(True))
+        self.add_operation(name='stop_stream', op_func=lambda: self.start_data_fusion_stream(False))
+        self.add_operation(name='scan_for_devices', op_func=self.scan_for_devices)
+        self.add_operation(name='simulate_link_loss', op_func=self.simulate_link_loss)
+        self.battery_charge = 100 # battery charge in percentage
+        self.battery_voltage = 4 # battery voltage in volts
+        # called with (charge, voltage) for every battery response, see battery_monitor.BatteryMonitor
+        self.battery_listener = None
+        # plain callables run on the sensor callback thread, with every block and every AccelerationData
+        # sample; consumers hand the data to a sensor_ingestion.IngestionWorker instead of a Qt slot
+        self.block_listeners = []
+        self.sample_listeners = []
+
+    def set_delivery_window(self):
+        self.batcher.window = self.settings['delivery_window_ms'] / 1000
+
+    def deliver_block(self, block):
+        self.telemetry.add_block(block)
+        self.watchdog.feed(block[:, 0])
+        for listener in self.block_listeners:
+            listener(block)
+        self.acc_block_updated.emit(block)
+
+    def report_gap(self, gap):
+        print(f"{self.name}: streaming again after a {gap.duration:.1f} s gap and {gap.reconnects} reconnect attempts")
+        self.settings['stream_state'] = 'streaming'
+        self.stream_gap.emit(gap)
+
+    def simulate_link_loss(self):
+        # the stream thread stops like a sensor that went out of range, the watchdog has to bring it back
+        if hasattr(self, 'stream'):
+            self.stream.stop()
+
+    def reconnect_stream(self):
+        # like the sensor, a new link to the same source: the clock alignment and telemetry carry on
+        self.settings['stream_state'] = 'reconnecting'
+        self.settings['stream_reconnects'] += 1
+        if hasattr(self, 'stream'):
+            self.stream.stop()
+            source = self.stream.source
+        else:
+            source = self.make_source()
+        self.batcher.flush()
+        self.stream = SimulatedStream(source, self.data_handler, name=f"{self.name}_stream")
+        self.stream.start()
+        self.start_data_fusion_stream(True)
+
+    @property
+    def registry(self):
+        return REGISTRY
+
+    def scan_for_devices(self):
+        REGISTRY.update(self.settings['MAC'], 'MetaWear (simulated)', -50)
+
+    def make_source(self):
+        if self.settings['source'] == 'replay':
+            return ReplaySource(self.settings['replay_file'], self.settings['replay_limb'], self.settings['replay_speed'])
+        return SyntheticSource(self.settings['data_rate'], self.settings['jitter'],
+                               self.settings['dropout_probability'], self.settings['dropout_length'])
+
+    def data_handler(self, acc_x, acc_y, acc_z, t, device_time):
+        t0 = time.perf_counter()
+        self.batcher.add(t, acc_x, acc_y, acc_z, device_time=device_time)
+        if self.sample_listeners or self.receivers(self.acc_data_updated) > 0:
+            sample = AccelerationData(acc_x, acc_y, acc_z, t)
+            for listener in self.sample_listeners:
+                listener(sample)
+            if self.receivers(self.acc_data_updated) > 0:
+                self.acc_data_updated.emit(sample)
+        self.telemetry.record_callback(time.perf_counter() - t0)
+
+    def update_telemetry(self):
+        """Called about once a second from the app timer thread, see MetaMotionRLHW.update_telemetry."""
+        self.telemetry.data_rate = self.settings['data_rate']
+        stats = self.telemetry.update()
+        self.samples_per_second = int(round(stats['rate']))
+        self.settings.data_read_samples_per_second.read_from_hardware()
+        if self.batcher.aligner.offset is not None:
+            self.settings['clock_offset_ms'] = self.batcher.aligner.offset * 1000
+            self.settings['clock_drift_ppm'] = self.batcher.aligner.drift * 1e6
+        if hasattr(self, 'stream') and self.stream.streaming.is_set():
+            # slow simulated discharge, about 1% every 3 minutes
+            now = time.time()
+            self.battery_charge = max(0, self.battery_charge - (now - self.last_time) / 180)
+            self.last_time = now
+        return self.telemetry
+
+    def read_battery_charge_thread(self):
+        # the simulated board answers a battery read at once
+        self.settings.battery_charge.read_from_hardware()
+        if self.battery_listener is not None:
+            self.battery_listener(int(self.battery_charge), self.battery_voltage)
+
+    def start_data_fusion_stream(self, start):
+        if start:
+            self.stream.streaming.set()
+            if self.settings['watchdog_enabled']:
+                self.watchdog.data_rate = self.settings['data_rate']
+                self.watchdog.stall_periods = self.settings['stall_periods']
+                self.watchdog.arm()
+                self.settings['stream_state'] = 'streaming'
+        else:
+            self.watchdog.disarm()
+            self.settings['stream_state'] = 'idle'
+            self.stream.streaming.clear()
+            self.batcher.flush()
+
+    def set_data_rate(self, data_rate):
+        if isinstance(self.stream.source, SyntheticSource):
+            self.stream.source.data_rate = data_rate
+
+    def connect(self):
+        REGISTRY.update(self.settings['MAC'], 'MetaWear (simulated)', -50)
+        self.last_time = time.time()
+        self.samples_per_second = 0
+        self.batcher.aligner = ClockAligner()
+        self.telemetry.reset()
+        self.stream = SimulatedStream(self.make_source(), self.data_handler, name=f"{self.name}_stream")
+        self.stream.start()
+
+        self.settings.start_streaming.connect_to_hardware(write_func=self.start_data_fusion_stream)
+        self.settings.data_rate.connect_to_hardware(write_func=self.set_data_rate)
+        self.settings.data_read_samples_per_second.connect_to_hardware(read_func=lambda: self.samples_per_second)
+        self.settings.battery_charge.connect_to_hardware(read_func=lambda: int(self.battery_charge))
+        self.settings.battery_voltage.connect_to_hardware(read_func=lambda: self.battery_voltage)
+        self.settings.battery_charge.read_from_hardware()
+        self.settings.battery_voltage.read_from_hardware()
+
+    def disconnect(self):
+        self.watchdog.disarm()
+        self.settings['stream_state'] = 'idle'
+        if hasattr(self, 'stream'):
+            self.stream.stop()
+            del self.stream
+
+        # remove all hardware connections to settings
+        self.settings.disconnect_all_from_hardware()
@@ -7,8 +7,6 @@ import zmq
 import subprocess
 import yaml
 import pygame
-from apscheduler.schedulers.background import BackgroundScheduler
-from datetime import datetime, timezone, timedelta
 from typing import Optional
 from PyQt5.QtCore import (
     Qt, QAbstractTableModel, QVariant, QModelIndex, QEvent, QRect, QSize, QAbstractItemModel
@@ -21,6 +19,9 @@ from PyQt5.QtWidgets import (
     QStyledItemDelegate, QTableView, QVBoxLayout, QHeaderView, QApplication, QSizePolicy, QStyleOptionViewItem
 )
 import h5py
+from h5_writer import start_swmr, create_latest_format_file
+from h5_storage import create_step_index
+from h5_events import EventLog, create_event_dataset
 
 class ComboBoxDelegate(QStyledItemDelegate):
     def __init__(self, items, parent=None):
@@ -179,9 +180,9 @@ class ExperimentControllerUI(Measurement):
         # initialize pygame
         pygame.mixer.init()
 
-        # Initialize timer
-        self.scheduler = BackgroundScheduler()
-        self.scheduler.start()
+        # step and mobile music timers, run on the app timer service
+        self.step_timer_handle = None
+        self.mobile_music_handle = None
                             
         # Define ui file to be used as a graphical interface
         # This file can be edited graphically with Qt Creator
@@ -197,6 +198,10 @@ class ExperimentControllerUI(Measurement):
         # All settings are automatically added to the Microscope user interface
         self.settings.New('save_h5', dtype=bool, initial=True)
         self.settings.New('sampling_period', dtype=float, unit='s', initial=0.1)
+        # open the task file in SWMR mode so it can be read live while the task runs
+        self.settings.New('live_readable', dtype=bool, initial=True)
+        # events are buffered in memory and written to the task file at most this often
+        self.settings.New('flush_period', dtype=float, unit='s', initial=1.0, vmin=0.0)
         
         # Experiment Specific Settings
         self.settings.New('acceleration_threshold', dtype=float, unit='g', initial=0.6, vmin=0.0, vmax=16.0)
@@ -395,59 +400,40 @@ class ExperimentControllerUI(Measurement):
             
         self.update_ttl_status_label()
 
+    def cancel_timers(self):
+        for handle in (self.step_timer_handle, self.mobile_music_handle):
+            if handle is not None:
+                handle.cancel()
+
     def next_step(self):
-        # Check if there's an active job and we're not paused, and not already expired
-        if self.scheduler.get_job(job_id='step_timer') and self.state != "paused" and not self.timer_expired:
-            # Remove the job first to prevent interval re-triggering
-            self.scheduler.remove_job(job_id='step_timer')
-            # Also remove mobile music timer if it exists
-            if self.scheduler.get_job(job_id='mobile_music_timer'):
-                self.scheduler.remove_job(job_id='mobile_music_timer')
+        # Check if there's an active step timer and we're not paused, and not already expired
+        if self.step_timer_handle is not None and self.step_timer_handle.active and self.state != "paused" \
+                and not self.timer_expired:
+            # cancel the step timer (and the mobile music timer) so it cannot fire for the next step
+            self.cancel_timers()
             self.timer_expired = True
 
     def pause(self):
         if self.state == "running":
-            if self.scheduler.get_job(job_id='step_timer'):
+            if self.step_timer_handle is not None and self.step_timer_handle.active:
                 self.state = "paused"
-                self.scheduler.pause_job(job_id="step_timer")
-                self.pause_time = datetime.now(timezone.utc)
+                # the paused timer keeps the time that is left in the step
+                self.step_timer_handle.pause()
                 self.settings['pause_button_text'] = "Resume Task"
 
                 # save pause time to the h5 file
                 if self.settings['save_h5']:
-                    self.events_h5.resize((self.events_h5.shape[0] + 1, 3))
-                    self.events_h5[-1] = ["Pause", "Start", datetime.now().isoformat()]
+                    self.save_event("Pause", "Start", self.step_number)
 
         elif self.state == "paused":
             self.state = "running"
-            elapsed_pause_time = datetime.now(timezone.utc) - self.pause_time
-            original_next_run_time = self.scheduler.get_job(job_id="step_timer").trigger.get_next_fire_time(self.job_start_time, self.pause_time)
-            self.total_pause_time += elapsed_pause_time.total_seconds()
-            
-            # Handle case where get_next_fire_time returns None
-            if original_next_run_time is None:
-                # Calculate next run time based on when job was originally scheduled
-                job = self.scheduler.get_job(job_id="step_timer")
-                if job and hasattr(job.trigger, 'run_date'):
-                    original_next_run_time = job.trigger.run_date
-            
-            if original_next_run_time:
-                adjusted_next_run_time = original_next_run_time + timedelta(seconds=self.total_pause_time)
-                print(f"original_next_run_time: {original_next_run_time}")
-                print(f"adjusted_next_run_time: {adjusted_next_run_time}")
-                print(f"elapsed_pause_time: {elapsed_pause_time}")
-                print(f"total_pause_time: {self.total_pause_time}")
-                self.scheduler.modify_job(job_id="step_timer", next_run_time=adjusted_next_run_time)
-            else:
-                print("Warning: Could not calculate adjusted next run time, resuming job as-is")
-                self.scheduler.resume_job(job_id="step_timer")
+            self.step_timer_handle.resume()
 
             self.settings['pause_button_text'] = "Pause Task"
 
             # save resume time to the h5 file
             if self.settings['save_h5']:
-                self.events_h5.resize((self.events_h5.shape[0] + 1, 3))
-                self.events_h5[-1] = ["Pause", "End", datetime.now().isoformat()]
+                self.save_event("Pause", "End", self.step_number)
 
 
     
@@ -519,6 +505,20 @@ class ExperimentControllerUI(Measurement):
         else:
             self.ui.step_Label.setText("No step is running")
 
+    def save_event(self, event_name, event_type, step_number=-1):
+        # buffered, the task loop writes pending events to the h5 file at least every flush_period
+        self.event_log.append(event_name, event_type, step_number)
+
+    def save_step_boundary(self, boundary):
+        # record the row offsets of the limb datasets at the start/end of the current step
+        # so the step segment can be sliced directly from the .sensor.h5 file
+        row = self.step_index_h5[self.current_step]
+        row[boundary + '_time'] = time.time()
+        row[boundary + '_row'] = self.metawear_ui.current_row_offsets()
+        self.step_index_h5[self.current_step] = row
+        self.step_index_h5.flush()
+        self.step_open = boundary == 'start'
+
     def step_timer(self):
         self.timer_expired = True
         
@@ -561,6 +561,9 @@ class ExperimentControllerUI(Measurement):
                     self.update_task_ID()
                     fname = self.app.settings['save_dir'] + "/" + self.settings['task_ID'] + ".h5"
 
+            if self.settings['live_readable']:
+                # latest file format from the start, so SWMR does not need to rewrite the file
+                create_latest_format_file(fname)
             self.h5file = h5_io.h5_base_file(app=self.app, measurement=self, fname=fname)
             
             # create a measurement H5 group (folder) within self.h5file
@@ -573,16 +576,11 @@ class ExperimentControllerUI(Measurement):
                                                                       dtype = 'S100')
             
             # create an h5 dataset to save the events in the task, such as start time and end time of each step
-            
-            self.events_h5 = self.h5_group.create_dataset(name='events', shape=(0, 3), maxshape=(None, 3), dtype=h5py.special_dtype(vlen=str))
-
-            # Define column names for the events data
-
-            event_columns = ["Event Name", "Event Type", "Event Time"]
-            self.events_h5.attrs['columns'] = event_columns
+            # compound rows: event code, event type, epoch time, monotonic ns and step number
+            self.events_h5 = create_event_dataset(self.h5_group)
+            self.event_log = EventLog(self.events_h5, flush_period=self.settings['flush_period'])
             # Save the start time of the task
-            self.events_h5.resize((self.events_h5.shape[0] + 1, 3))
-            self.events_h5[-1] = ["Task", "Start", datetime.now().isoformat()]
+            self.save_event("Task", "Start")
             
             # save the step structure data to the h5 file
             # Define column names for the step structure data
@@ -593,6 +591,20 @@ class ExperimentControllerUI(Measurement):
                 for j, value in enumerate(step):
                     self.step_structure_data_h5[i, j] = str(value).encode('utf-8') # convert to bytes before saving
 
+            # step index: row offsets of each limb dataset in the .sensor.h5 file at step start/end
+            self.step_index_h5 = create_step_index(self.h5_group, self.step_structure_data,
+                                                   sensor_file=self.settings['task_ID'] + ".sensor.h5")
+
+            if self.settings['live_readable']:
+                # single-writer/multi-reader mode: the task file can be read while the task runs
+                # everything has to be created before this point, dataset handles are looked up again
+                names = [self.h5_group.name, self.step_structure_data_h5.name, self.events_h5.name,
+                         self.step_index_h5.name]
+                self.h5file = start_swmr(self.h5file)
+                self.h5_group, self.step_structure_data_h5, self.events_h5, self.step_index_h5 = \
+                    [self.h5file[name] for name in names]
+                self.event_log.dataset = self.events_h5
+
         
         # We use a try/finally block, so that if anything goes wrong during a measurement,
         # the finally block can clean things up, e.g. close the data file object.
@@ -603,6 +615,7 @@ class ExperimentControllerUI(Measurement):
             self.current_step = 0
             self.previous_step = -1
             self.timer_expired = False
+            self.step_open = False
 
             # Refresh USB TTL connection
             if self.usb_ttl:
@@ -630,7 +643,13 @@ class ExperimentControllerUI(Measurement):
             if not self.metawear_ui.interrupt_measurement_called:
                 self.metawear_ui.interrupt()
                 time.sleep(0.5)
+            run_count = self.metawear_ui.run_count
             self.metawear_ui.start()
+            # wait until the sensor measurement created this session's buffers,
+            # so step row offsets do not refer to the previous session
+            t0 = time.time()
+            while self.metawear_ui.run_count == run_count and time.time() - t0 < 5:
+                time.sleep(0.01)
 
             # calculate total time of the task:
             self.total_time_seconds = sum([task[2] for task in self.step_structure_data])
@@ -680,8 +699,8 @@ class ExperimentControllerUI(Measurement):
 
                     # save the start time of the step
                     if self.settings['save_h5']:
-                        self.events_h5.resize((self.events_h5.shape[0] + 1, 3))
-                        self.events_h5[-1] = [step_description, "Start", datetime.now().isoformat()]
+                        self.save_event(step_description, "Start", step_number)
+                        self.save_step_boundary('start')
 
                     # Initialize Hardware 
                     if step_description == "Fixation":
@@ -720,10 +739,7 @@ class ExperimentControllerUI(Measurement):
                         pygame.mixer.music.play()
                         
                         # start a timer for the duration of the fixation step
-                        self.job_start_time = datetime.now(timezone.utc)
-                        self.total_pause_time = 0
-                        fire_time = self.job_start_time + timedelta(seconds=step_duration)
-                        self.scheduler.add_job(func = self.step_timer, trigger = 'date', run_date=fire_time, id='step_timer')
+                        self.step_timer_handle = self.app.timers.call_later(step_duration, self.step_timer, name='step timer')
 
                     else:
                         # disconnect all limbs from mobile
@@ -759,24 +775,19 @@ class ExperimentControllerUI(Measurement):
                         # Initialize pygame mixer
                         if background_music:
                             # start a timer to start mobile music after number of seconds
-                            mobile_music_fire_time = datetime.now(timezone.utc) + timedelta(seconds=self.time_to_wait_in_baseline_before_mobile_music_starts)
-                            self.scheduler.add_job(func=self.mobile_start_music, trigger='date', 
-                                                   run_date=mobile_music_fire_time, id='mobile_music_timer')
+                            self.mobile_music_handle = self.app.timers.call_later(
+                                self.time_to_wait_in_baseline_before_mobile_music_starts, self.mobile_start_music,
+                                name='mobile music')
                         
                         # start a timer for the duration of the fixation step
-                        self.job_start_time = datetime.now(timezone.utc)
-                        self.total_pause_time = 0
-                        fire_time = self.job_start_time + timedelta(seconds=step_duration)
-                        self.scheduler.add_job(func = self.step_timer, trigger = 'date', run_date=fire_time, id='step_timer')
+                        self.step_timer_handle = self.app.timers.call_later(step_duration, self.step_timer, name='step timer')
                     
                     self.previous_step = self.current_step
 
-                # I want to know how much time has passed since the start of the task how to query the aps scheduler
-                job = self.scheduler.get_job(job_id='step_timer')
-                if job and job.next_run_time:
-                    now = datetime.now(timezone.utc)  # Get the current time as a timezone-aware datetime
-                    remaining_time = job.next_run_time - now
-                    elapsed_time = step_duration - remaining_time.total_seconds()
+                # time passed in the step, from the time left on the step timer (frozen while paused)
+                handle = self.step_timer_handle
+                if handle is not None and handle.active and not handle.paused:
+                    elapsed_time = step_duration - handle.remaining()
                     if self.total_elapsed_time_seconds + elapsed_time > self.running_elapsed_time:
                         self.running_elapsed_time = self.total_elapsed_time_seconds + elapsed_time
                         self.remaining_time_seconds = self.total_time_seconds - self.running_elapsed_time
@@ -787,13 +798,13 @@ class ExperimentControllerUI(Measurement):
 
                     # save the end time of the step
                     if self.settings['save_h5']:
-                        self.events_h5.resize((self.events_h5.shape[0] + 1, 3))
-                        self.events_h5[-1] = [step_description, "End", datetime.now().isoformat()]
+                        self.save_event(step_description, "End", self.step_number)
+                        self.save_step_boundary('end')
 
                     if self.previous_step != -1:
                         self.total_elapsed_time_seconds += step_duration
                     
-                    self.scheduler.remove_all_jobs()
+                    self.cancel_timers()
                     self.current_step += 1
                     self.timer_expired = False
 
@@ -818,6 +829,9 @@ class ExperimentControllerUI(Measurement):
                         self.interrupt_measurement_called = True
                         # this will break the run
 
+                if self.settings['save_h5']:
+                    self.event_log.flush_if_due()
+
                 if self.interrupt_measurement_called:
                     # Listen for interrupt_measurement_called flag.
                     # This is critical to do, if you don't the measurement will
@@ -832,8 +846,10 @@ class ExperimentControllerUI(Measurement):
 
             # save the end time of the task
             if self.settings['save_h5']:
-                self.events_h5.resize((self.events_h5.shape[0] + 1, 3))
-                self.events_h5[-1] = ["Task", "End", datetime.now().isoformat()]
+                if self.step_open:
+                    # interrupted in the middle of a step, close its row range
+                    self.save_step_boundary('end')
+                self.save_event("Task", "End")
 
             # Send TTL signal for end of experiment (Fixed value 50)
             if self.usb_ttl:
@@ -870,8 +886,8 @@ class ExperimentControllerUI(Measurement):
             # stop background music if it is playing
             pygame.mixer.music.stop()
 
-            # shutdown the scheduler
-            self.scheduler.remove_all_jobs()
+            # cancel the step timers
+            self.cancel_timers()
 
             # initialize time variables
             self.remaining_time_seconds = 0
@@ -884,5 +900,6 @@ class ExperimentControllerUI(Measurement):
             self.settings['pause_button_checked'] = False
 
             if self.settings['save_h5']:
-                # make sure to close the data file
+                # write the remaining events and make sure to close the data file
+                self.event_log.flush()
                 self.h5file.close()
@@ -4,36 +4,70 @@ from ScopeFoundry import h5_io
 import pyqtgraph as pg
 import numpy as np
 from time import sleep
-import time
+import threading
+from PyQt5.QtCore import QTimer
+from PyQt5.QtWidgets import QLabel
+from ble_registry import describe_in_range
+from sensor_connections import ConnectionOrchestrator
+from battery_monitor import BatteryMonitor
+from sensor_ingestion import IngestionWorker
+from sensor_buffers import RingBuffer, SampleQueue, BLOCK_COLUMNS
+from h5_writer import H5SessionWriter, start_swmr, create_latest_format_file, create_row_counter
+from h5_storage import STORAGE_PROFILES, DEFAULT_STORAGE_PROFILE, TIMED_SAMPLE_COLUMNS, GAP_COLUMNS, \
+    create_gap_dataset, encode_gaps, TELEMETRY_COLUMNS, create_telemetry_dataset, BATTERY_COLUMNS, \
+    create_battery_dataset
+
+# columns of the hardware sample blocks that are saved, in TIMED_SAMPLE_COLUMNS order
+SAVED_BLOCK_COLUMNS = [BLOCK_COLUMNS.index(col) for col in TIMED_SAMPLE_COLUMNS]
 
 # this class is used to store the acceleration data buffer and its corresponding time buffer
 class AccelerationDataBuffer(object):
-    def __init__(self, buffer_size):
+    def __init__(self, buffer_size, queue_max_rows=2**17, overflow_policy='drop_oldest'):
         self.buffer_size = buffer_size
-        self.acceleration_data = np.zeros(buffer_size, dtype=float)
-        self.time_data = np.zeros(buffer_size, dtype=float)
-        # fill all self.timedata with time.time() values
-        self.time_data[:] = time.time()
-        self.queue = []
+        # preallocated ring buffer holding (time, acceleration) pairs, appends are O(1)
+        # written by the ingestion worker, the GUI only takes snapshots of it
+        self.history = RingBuffer(buffer_size, width=2)
+        self.lock = threading.Lock()
+        # bounded queue of (time, acc_x, acc_y, acc_z, host_time, device_time) rows waiting to be saved to the h5 file
+        self.queue = SampleQueue(width=len(TIMED_SAMPLE_COLUMNS), max_rows=queue_max_rows, overflow_policy=overflow_policy)
+
+    @property
+    def time_data(self):
+        # zero-copy, chronologically ordered view of the plotted history
+        return self.history.column(0)
+
+    @property
+    def acceleration_data(self):
+        return self.history.column(1)
 
     def add_data(self, acc_data, time_data):
-        self.acceleration_data = np.roll(self.acceleration_data, 1)
-        self.acceleration_data[0] = acc_data
-        self.time_data = np.roll(self.time_data, 1)
-        self.time_data[0] = time_data
+        with self.lock:
+            self.history.append(time_data, acc_data)
 
     def get_data(self):
         return self.acceleration_data, self.time_data
     
+    def add_block(self, block, show_magnitude=False):
+        # block of BLOCK_COLUMNS rows from the hardware SampleBatcher, time is the aligned timeline
+        # plot either the magnitude or the x axis, and queue the sample and raw clock columns for saving
+        plotted = 4 if show_magnitude else 1
+        with self.lock:
+            self.history.extend(block[:, (0, plotted)].T)
+        self.queue.push_block(block[:, SAVED_BLOCK_COLUMNS])
+
+    def snapshot(self):
+        # (time, acceleration) copies of the history, safe to plot while the worker keeps appending
+        with self.lock:
+            history = self.history.view().copy()
+        return history[0], history[1]
+
     def add_to_queue(self, time_data, acc_data_x, acc_data_y, acc_data_z):
-        self.queue.append((time_data, acc_data_x, acc_data_y, acc_data_z))
-        if len(self.queue) > self.buffer_size:
-            self.queue.pop(0)
+        # single sample without a device clock, host time is used for all time columns
+        self.queue.push(time_data, acc_data_x, acc_data_y, acc_data_z, time_data, time_data)
     
     def pop_all_from_queue(self):
-        data = self.queue[:]
-        self.queue.clear()
-        return data
+        # returns a contiguous (n, 4) float64 array
+        return self.queue.drain()
 
 
 class MetaWearUI(Measurement):
@@ -53,7 +87,7 @@ class MetaWearUI(Measurement):
         # This file can be edited graphically with Qt Creator
         # sibling_path function allows python to find a file in the same folder
         # as this python module
-        self.ui_filename = sibling_path(__file__, "Agency.ui")
+        self.ui_filename = sibling_path(__file__, "Agency.UI")
         
         #Load ui file and convert it to a live QWidget of the user interface
         self.ui = load_qt_ui_file(self.ui_filename)
@@ -63,6 +97,22 @@ class MetaWearUI(Measurement):
         # All settings are automatically added to the Microscope user interface
         self.settings.New('save_h5', dtype=bool, initial=True)
         self.settings.New('sampling_period', dtype=float, unit='s', initial=0.1)
+        # bound on the samples waiting to be written to disk per limb, and what to do when it is reached
+        self.settings.New('queue_max_rows', dtype=int, unit='samples', initial=2**17, vmin=1024)
+        self.settings.New('queue_overflow_policy', dtype=str, initial='drop_oldest', choices=SampleQueue.OVERFLOW_POLICIES)
+        self.settings.New('samples_dropped', dtype=int, initial=0, ro=True)
+        # on-disk layout of the limb datasets, see h5_storage.STORAGE_PROFILES
+        self.settings.New('storage_profile', dtype=str, initial=DEFAULT_STORAGE_PROFILE, choices=list(STORAGE_PROFILES.keys()))
+        # open session files in SWMR mode so they can be read live, and flush them periodically
+        self.settings.New('live_readable', dtype=bool, initial=True)
+        self.settings.New('flush_period', dtype=float, unit='s', initial=1.0, vmin=0.1)
+        # h5 writer thread statistics
+        self.settings.New('write_rate', dtype=float, unit='samples/s', initial=0, ro=True)
+        self.settings.New('write_lag', dtype=float, unit='s', initial=0, ro=True)
+        self.settings.New('write_backlog', dtype=int, unit='samples', initial=0, ro=True)
+        # number of samples per limb kept for the live plot, buffers are preallocated so
+        # this can be raised to minutes of history without slowing down the GUI
+        self.settings.New('plot_history_length', dtype=int, unit='samples', initial=500, vmin=10, vmax=200*60*10)
         
         # Define how often to update display during a run
         self.display_update_period = 1/60
@@ -74,24 +124,117 @@ class MetaWearUI(Measurement):
         self.RightLegMeta = self.app.hardware['RightLegMeta']
 
         # data
-        DataLength = 500
-        self.buffer = np.zeros(DataLength)
+        DataLength = self.settings['plot_history_length']
         self.lefthand_data = AccelerationDataBuffer(DataLength)
         self.righthand_data = AccelerationDataBuffer(DataLength)
         self.leftleg_data = AccelerationDataBuffer(DataLength)
         self.rightleg_data = AccelerationDataBuffer(DataLength)
+        # the sample blocks are added to the buffers on the ingestion worker thread, not in Qt slots,
+        # so a busy GUI does not hold up the data path; the display only takes snapshots
+        self.settings.New('show_magnitude', dtype=bool, initial=False)
+        self.settings.New('ingestion_latency', dtype=float, unit='ms', initial=0, ro=True)
+        self.ingestion = IngestionWorker('sensor ingestion')
+        self.ingestion.start()
+        for limb, hw in enumerate([self.LeftHandMeta, self.RightHandMeta, self.LeftLegMeta, self.RightLegMeta]):
+            hw.block_listeners.append(lambda block, limb=limb: self.ingestion.submit(self.add_limb_block, limb, block))
+        # incremented once a run has created its buffers, so other measurements can wait for it
+        self.run_count = 0
+        # stretches a sensor did not stream, (start_time, end_time, limb, reconnects) rows saved to the 'gaps' dataset
+        self.gap_queue = SampleQueue(width=len(GAP_COLUMNS), chunk_rows=16)
+        self.settings.New('stream_gaps', dtype=int, initial=0, ro=True)
+
+        # per-sensor rate, interval, loss and callback time statistics, rows saved to the 'telemetry' dataset
+        self.telemetry_queue = SampleQueue(width=len(TELEMETRY_COLUMNS), chunk_rows=64)
+        self.telemetry_lines = {}
+        sensors = [self.LeftHandMeta, self.RightHandMeta, self.LeftLegMeta, self.RightLegMeta]
+        self.telemetry_timer = self.app.timers.call_every(1.0, self.update_telemetry, name='sensor telemetry')
+
+        # battery reads share the BLE link with the fusion data: rare while streaming, staggered over the sensors
+        self.settings.New('battery_interval_streaming', dtype=float, unit='s', initial=60.0, vmin=5.0)
+        self.settings.New('battery_interval_idle', dtype=float, unit='s', initial=5.0, vmin=1.0)
+        self.settings.New('battery_read_effect', dtype=str, initial='', ro=True)
+        self.battery_queue = SampleQueue(width=len(BATTERY_COLUMNS), chunk_rows=64)
+        self.battery_monitor = BatteryMonitor(self.app.timers, sensors, record=lambda row: self.battery_queue.push(*row),
+                                              streaming_interval=self.settings['battery_interval_streaming'],
+                                              idle_interval=self.settings['battery_interval_idle'])
+        self.settings.battery_interval_streaming.add_listener(self.set_battery_intervals)
+        self.settings.battery_interval_idle.add_listener(self.set_battery_intervals)
+        self.battery_monitor.start()
+
+        # the four sensors are connected and disconnected concurrently
+        self.settings.New('connect_timeout', dtype=float, unit='s', initial=30.0, vmin=1.0)
+        self.settings.New('connection_progress', dtype=str, initial='', ro=True)
+        self.connections = ConnectionOrchestrator(
+            [self.LeftHandMeta, self.RightHandMeta, self.LeftLegMeta, self.RightLegMeta],
+            progress=self.report_connection_progress)
+        self.connection_thread = None
+        # configured sensors seen by the BLE scanner, refreshed every second
+        self.settings.New('sensors_in_range', dtype=str, initial='', ro=True)
+
+    def update_sensors_in_range(self):
+        configured = getattr(self.app, 'configured_macs', {})
+        text = describe_in_range(self.LeftHandMeta.registry, configured)
+        self.settings['sensors_in_range'] = text
+        self.in_range_label.setText(text)
+
+    def update_telemetry(self):
+        # once a second on the app timer thread, limbs in h5_storage.LIMB_DATASETS order
+        sensors = [self.LeftHandMeta, self.RightHandMeta, self.LeftLegMeta, self.RightLegMeta]
+        for limb, hw in enumerate(sensors):
+            telemetry = hw.update_telemetry()
+            self.telemetry_queue.push(*telemetry.row(limb))
+            self.telemetry_lines[limb] = telemetry.summary()
+
+    def set_battery_intervals(self):
+        self.battery_monitor.streaming_interval = self.settings['battery_interval_streaming']
+        self.battery_monitor.idle_interval = self.settings['battery_interval_idle']
+
+    def update_panel_status(self):
+        # once a second in the GUI thread
+        self.update_sensors_in_range()
+        self.settings['battery_read_effect'] = self.battery_monitor.summary()
+        self.settings['ingestion_latency'] = self.ingestion.stats()['latency_p99'] * 1000
+        lines = [self.telemetry_lines[limb] for limb in sorted(self.telemetry_lines)]
+        self.telemetry_label.setText("\n".join(lines + [self.settings['battery_read_effect'], self.ingestion.summary()]))
+
+    def record_gap(self, limb, gap):
+        # called by the sensor watchdogs when a stalled stream is back, limb indexes h5_storage.LIMB_DATASETS
+        self.gap_queue.push(gap.start_time, gap.end_time, limb, gap.reconnects)
+        self.settings['stream_gaps'] += 1
+
+    def current_row_offsets(self):
+        """
+        Row index the next sample of each limb will take in its h5 dataset, in
+        h5_storage.LIMB_DATASETS order. Queued samples are counted, so this is
+        exact even when the writer thread is behind.
+        """
+        return [buf.queue.rows_in - buf.queue.rows_dropped for buf in
+                (self.lefthand_data, self.righthand_data, self.leftleg_data, self.rightleg_data)]
 
     def connect(self):
-        self.LeftHandMeta.settings['connected'] = True
-        self.RightHandMeta.settings['connected'] = True
-        self.LeftLegMeta.settings['connected'] = True
-        self.RightLegMeta.settings['connected'] = True
+        # connect all four sensors concurrently, in the background so the GUI stays responsive
+        return self.run_connections(self.connections.connect_all)
 
     def disconnect(self):
-        self.LeftHandMeta.settings['connected'] = False
-        self.RightHandMeta.settings['connected'] = False
-        self.LeftLegMeta.settings['connected'] = False
-        self.RightLegMeta.settings['connected'] = False
+        return self.run_connections(self.connections.disconnect_all)
+
+    def run_connections(self, func):
+        if self.connection_thread is not None and self.connection_thread.is_alive():
+            print("sensor connections are still being changed, try again when done")
+            return None
+        self.connections.timeout = self.settings['connect_timeout']
+
+        def run():
+            results = func()
+            self.settings['connection_progress'] = (f"done in {self.connections.elapsed:.1f} s: " +
+                ", ".join(f"{name} {state}" for name, state in results.items()))
+
+        self.connection_thread = threading.Thread(target=run, name='SensorConnections', daemon=True)
+        self.connection_thread.start()
+        return self.connection_thread
+
+    def report_connection_progress(self, name, state, done, total):
+        self.settings['connection_progress'] = f"{done}/{total} - {name} {state}"
 
     def setup_figure(self):
         """
@@ -107,6 +250,7 @@ class MetaWearUI(Measurement):
         self.ui.start_stream_pushButton.clicked.connect(self.start)
         self.ui.stop_stream_pushButton.clicked.connect(self.interrupt)
         self.settings.save_h5.connect_to_widget(self.ui.save_h5_checkBox)
+        self.settings.show_magnitude.connect_to_widget(self.ui.show_accel_mag)
        
         # connect settings to hardware operations
         self.LeftHandMeta.settings.battery_charge.connect_to_widget(self.ui.Battery_Left_hand_spinBox)
@@ -135,7 +279,15 @@ class MetaWearUI(Measurement):
         self.LeftLegMeta.settings.data_read_samples_per_second.connect_to_widget(self.ui.left_leg_spinbox)
         self.RightLegMeta.settings.data_read_samples_per_second.connect_to_widget(self.ui.right_leg_spinbox)
 
+        # the scan runs in the background, the in range list fills in as devices are found
         self.ui.Scan_metawear_pushButton.clicked.connect(self.LeftHandMeta.scan_for_devices)
+        self.in_range_label = QLabel()
+        self.ui.plot_groupBox.layout().addWidget(self.in_range_label)
+        self.telemetry_label = QLabel()
+        self.ui.plot_groupBox.layout().addWidget(self.telemetry_label)
+        self.status_timer = QTimer()
+        self.status_timer.timeout.connect(self.update_panel_status)
+        self.status_timer.start(1000)
 
         # Set up pyqtgraph graph_layout in the UI
         self.graph_layout=pg.GraphicsLayoutWidget()
@@ -157,61 +309,27 @@ class MetaWearUI(Measurement):
         self.rightleg_plot = self.plot.plot(pen='y', name = "Right Leg")
 
 
-        # connect to data update signal
-        self.LeftHandMeta.acc_data_updated.connect(self.update_left_hand_data)
-        self.RightHandMeta.acc_data_updated.connect(self.update_right_hand_data)
-        self.LeftLegMeta.acc_data_updated.connect(self.update_left_leg_data)
-        self.RightLegMeta.acc_data_updated.connect(self.update_right_leg_data)
-
-    def update_left_leg_data(self, acc_data):
-        #print(f"Acceleration of {self.LeftLegMeta.MAC}: {acc_data}")
-        # add acc_data to the buffer to left leg data
-        if self.ui.show_accel_mag.isChecked():
-            self.leftleg_data.add_data(acc_data.acceleration, acc_data.time)
-        else:
-            self.leftleg_data.add_data(acc_data.acc_x, acc_data.time)
+        # gaps in the limb streams, in h5_storage.LIMB_DATASETS order
+        for limb, hw in enumerate([self.LeftHandMeta, self.RightHandMeta, self.LeftLegMeta, self.RightLegMeta]):
+            hw.stream_gap.connect(lambda gap, limb=limb: self.record_gap(limb, gap))
 
-        #self.leftleg_data.add_data(acc_data.acceleration, acc_data.time)
-        self.leftleg_data.add_to_queue(acc_data.time, acc_data.acc_x, acc_data.acc_y, acc_data.acc_z)
-        
-    def update_right_leg_data(self, acc_data):
-        #print(f"Acceleration of {self.RightLegMeta.MAC}: {acc_data}")
-        # add acc_data to the buffer to right leg data
-        if self.ui.show_accel_mag.isChecked():
-            self.rightleg_data.add_data(acc_data.acceleration, acc_data.time)
-        else:
-            self.rightleg_data.add_data(acc_data.acc_x, acc_data.time)
-        #self.rightleg_data.add_data(acc_data.acceleration, acc_data.time)
-        self.rightleg_data.add_to_queue(acc_data.time, acc_data.acc_x, acc_data.acc_y, acc_data.acc_z)
-
-    def update_left_hand_data(self, acc_data):
-        #print(f"Acceleration of {self.LeftHandMeta.MAC}: {acc_data}")
-        # add acc_data to the buffer to left hand data
-        if self.ui.show_accel_mag.isChecked():
-            self.lefthand_data.add_data(acc_data.acceleration, acc_data.time)
-        else:
-            self.lefthand_data.add_data(acc_data.acc_x, acc_data.time)
-        self.lefthand_data.add_to_queue(acc_data.time, acc_data.acc_x, acc_data.acc_y, acc_data.acc_z)
-
-    def update_right_hand_data(self, acc_data):
-        #print(f"Acceleration of {self.RightHandMeta.MAC}: {acc_data}")
-        # add acc_data to the buffer to right hand data
-        if self.ui.show_accel_mag.isChecked():
-            self.righthand_data.add_data(acc_data.acceleration, acc_data.time)
-        else:
-            self.righthand_data.add_data(acc_data.acc_x, acc_data.time)
-        self.righthand_data.add_to_queue(acc_data.time, acc_data.acc_x, acc_data.acc_y, acc_data.acc_z)
+    def add_limb_block(self, limb, block):
+        # on the ingestion worker: add a block of samples to the limb buffer and save queue,
+        # limb indexes h5_storage.LIMB_DATASETS
+        buffers = (self.lefthand_data, self.righthand_data, self.leftleg_data, self.rightleg_data)
+        buffers[limb].add_block(block, self.settings['show_magnitude'])
 
     def update_display(self):
         """
-        Displays (plots) the numpy array self.buffer. 
+        Displays (plots) the acceleration histories of the four limbs.
         This function runs repeatedly and automatically during the measurement run.
         its update frequency is defined by self.display_update_period
         """
-        self.lefthand_plot.setData(self.lefthand_data.time_data, self.lefthand_data.acceleration_data)
-        self.righthand_plot.setData(self.righthand_data.time_data, self.righthand_data.acceleration_data) 
-        self.leftleg_plot.setData(self.leftleg_data.time_data, self.leftleg_data.acceleration_data)
-        self.rightleg_plot.setData(self.rightleg_data.time_data, self.rightleg_data.acceleration_data)
+        # snapshots of the buffers the ingestion worker fills
+        self.lefthand_plot.setData(*self.lefthand_data.snapshot())
+        self.righthand_plot.setData(*self.righthand_data.snapshot())
+        self.leftleg_plot.setData(*self.leftleg_data.snapshot())
+        self.rightleg_plot.setData(*self.rightleg_data.snapshot())
 
     def run(self):
         """
@@ -219,6 +337,19 @@ class MetaWearUI(Measurement):
         It should not update the graphical interface directly, and should only
         focus on data acquisition.
         """
+        # fresh buffers for this run, created before streaming starts so no samples are missed
+        DataLength = self.settings['plot_history_length']
+        queue_args = dict(queue_max_rows=self.settings['queue_max_rows'], overflow_policy=self.settings['queue_overflow_policy'])
+        self.lefthand_data = AccelerationDataBuffer(DataLength, **queue_args)
+        self.righthand_data = AccelerationDataBuffer(DataLength, **queue_args)
+        self.leftleg_data = AccelerationDataBuffer(DataLength, **queue_args)
+        self.rightleg_data = AccelerationDataBuffer(DataLength, **queue_args)
+        self.settings['samples_dropped'] = 0
+        self.gap_queue.drain()
+        self.settings['stream_gaps'] = 0
+        self.telemetry_queue.drain()
+        self.battery_queue.drain()
+
         # first, create a data file
         if self.settings['save_h5']:
             # if enabled will create an HDF5 file with the plotted data
@@ -229,6 +360,9 @@ class MetaWearUI(Measurement):
             fname = self.app.settings['save_dir'] + "/" + self.taskUI.settings['task_ID']+ ".sensor.h5"
             try:
                 if self.taskUI.state == 'running':
+                    if self.settings['live_readable']:
+                        # latest file format from the start, so SWMR does not need to rewrite the file
+                        create_latest_format_file(fname)
                     self.h5file = h5_io.h5_base_file(app=self.app, measurement=self, fname=fname)
                 else:
                     self.h5file = h5_io.h5_base_file(app=self.app, measurement=self)
@@ -240,32 +374,54 @@ class MetaWearUI(Measurement):
             # This stores all the measurement meta-data in this group
             self.h5_group = h5_io.h5_create_measurement_group(measurement=self, h5group=self.h5file)
             
-            # create four datasets to store the acceleration data with unlimited size with chunk size 1000
-            # the dataset will hold the acceleratoin data and timestamp data
-            self.lefthand_data_h5 = self.h5_group.create_dataset(name='left_hand_data', 
-                 shape=(0, 4), 
-                 maxshape=(None, 4), 
-                 chunks=(1000, 4),
-                 dtype='f8')  # Use 'f8' for float64, which is a standard double-precision float
-            
+            # create four datasets to store the acceleration data with unlimited size
+            # the dataset will hold the acceleratoin data and timestamp data, its layout,
+            # compression and chunking are defined by the selected storage profile
+            profile = STORAGE_PROFILES[self.settings['storage_profile']]
+            self.lefthand_data_h5 = profile.create_dataset(self.h5_group, 'left_hand_data', TIMED_SAMPLE_COLUMNS)
             # add for the other three limbs
-            self.righthand_data_h5 = self.h5_group.create_dataset(name='right_hand_data', 
-                 shape=(0, 4), 
-                 maxshape=(None, 4), 
-                 chunks=(1000, 4),
-                 dtype='f8')
-            
-            self.leftleg_data_h5 = self.h5_group.create_dataset(name='left_leg_data', 
-                 shape=(0, 4), 
-                 maxshape=(None, 4), 
-                 chunks=(1000, 4),
-                 dtype='f8')
-            
-            self.rightleg_data_h5 = self.h5_group.create_dataset(name='right_leg_data', 
-                 shape=(0, 4), 
-                 maxshape=(None, 4), 
-                 chunks=(1000, 4),
-                 dtype='f8')
+            self.righthand_data_h5 = profile.create_dataset(self.h5_group, 'right_hand_data', TIMED_SAMPLE_COLUMNS)
+            self.leftleg_data_h5 = profile.create_dataset(self.h5_group, 'left_leg_data', TIMED_SAMPLE_COLUMNS)
+            self.rightleg_data_h5 = profile.create_dataset(self.h5_group, 'right_leg_data', TIMED_SAMPLE_COLUMNS)
+            limb_datasets = [self.lefthand_data_h5, self.righthand_data_h5, self.leftleg_data_h5, self.rightleg_data_h5]
+            self.gaps_h5 = create_gap_dataset(self.h5_group)
+            self.telemetry_h5 = create_telemetry_dataset(self.h5_group)
+            self.battery_h5 = create_battery_dataset(self.h5_group)
+            # number of valid rows per limb (and gaps, telemetry, battery), datasets are over-allocated while they grow
+            self.rows_written_h5 = create_row_counter(self.h5_group, limb_datasets + [self.gaps_h5, self.telemetry_h5,
+                                                                                      self.battery_h5])
+
+            if self.settings['live_readable']:
+                # single-writer/multi-reader mode: other processes can read the file while it is written
+                # everything has to be created before this point, dataset handles are looked up again
+                group_name, counter_name = self.h5_group.name, self.rows_written_h5.name
+                limb_names = [ds.name for ds in limb_datasets]
+                gaps_name, telemetry_name, battery_name = self.gaps_h5.name, self.telemetry_h5.name, self.battery_h5.name
+                self.h5file = start_swmr(self.h5file)
+                self.h5_group = self.h5file[group_name]
+                self.lefthand_data_h5, self.righthand_data_h5, self.leftleg_data_h5, self.rightleg_data_h5 = \
+                    [self.h5file[name] for name in limb_names]
+                self.gaps_h5 = self.h5file[gaps_name]
+                self.telemetry_h5 = self.h5file[telemetry_name]
+                self.battery_h5 = self.h5file[battery_name]
+                self.rows_written_h5 = self.h5file[counter_name]
+
+            # the writer thread drains the sample queues into the datasets, growing them in large steps
+            # and flushing at least every flush_period so a crash loses at most that much data
+            self.h5_writer = H5SessionWriter(period=self.settings['sampling_period'], h5file=self.h5file,
+                                             flush_period=self.settings['flush_period'])
+            self.h5_writer.add_stream(self.lefthand_data_h5, self.lefthand_data.queue, profile.encoder(TIMED_SAMPLE_COLUMNS))
+            self.h5_writer.add_stream(self.righthand_data_h5, self.righthand_data.queue, profile.encoder(TIMED_SAMPLE_COLUMNS))
+            self.h5_writer.add_stream(self.leftleg_data_h5, self.leftleg_data.queue, profile.encoder(TIMED_SAMPLE_COLUMNS))
+            self.h5_writer.add_stream(self.rightleg_data_h5, self.rightleg_data.queue, profile.encoder(TIMED_SAMPLE_COLUMNS))
+            self.h5_writer.add_stream(self.gaps_h5, self.gap_queue, encode_gaps)
+            self.h5_writer.add_stream(self.telemetry_h5, self.telemetry_queue)
+            self.h5_writer.add_stream(self.battery_h5, self.battery_queue)
+            self.h5_writer.set_row_counter(self.rows_written_h5)
+            self.h5_writer.start()
+
+        self.run_count += 1
+
         # We use a try/finally block, so that if anything goes wrong during a measurement,
         # the finally block can clean things up, e.g. close the data file object.
         self.LeftHandMeta.settings['start_streaming'] = True
@@ -277,51 +433,20 @@ class MetaWearUI(Measurement):
         #self.LeftLegMeta.operations['start_stream']()
         #self.RightLegMeta.operations['start_stream']()
 
-        DataLength = 500
-        self.lefthand_data = AccelerationDataBuffer(DataLength)
-        self.righthand_data = AccelerationDataBuffer(DataLength)
-        self.leftleg_data = AccelerationDataBuffer(DataLength)
-        self.rightleg_data = AccelerationDataBuffer(DataLength)
-
         try:
-            i = 0
-            
             # Will run forever until interrupt is called.
             while not self.interrupt_measurement_called:
-                i %= len(self.buffer)
-                
-                # Set progress bar percentage complete
-                self.settings['progress'] = i * 100./len(self.buffer)
-                
                 if self.settings['save_h5']:
-                    # resizes the dataset to fit the new data
-                    # pop from lefthand_data queue and save to h5 file
-                    data = self.lefthand_data.pop_all_from_queue()
-                    # add the for the other three limbs
-                    if data:
-                        new_size = self.lefthand_data_h5.shape[0] + len(data)
-                        self.lefthand_data_h5.resize(new_size, axis=0)
-                        self.lefthand_data_h5[-len(data):] = np.array(data)
-
-                    data = self.righthand_data.pop_all_from_queue()
-                    if data:
-                        new_size = self.righthand_data_h5.shape[0] + len(data)
-                        self.righthand_data_h5.resize(new_size, axis=0)
-                        self.righthand_data_h5[-len(data):] = np.array(data)
-
-                    data = self.leftleg_data.pop_all_from_queue()
-                    if data:
-                        new_size = self.leftleg_data_h5.shape[0] + len(data)
-                        self.leftleg_data_h5.resize(new_size, axis=0)
-                        self.leftleg_data_h5[-len(data):] = np.array(data)
-                    
-                    data = self.rightleg_data.pop_all_from_queue()
-                    if data:
-                        new_size = self.rightleg_data_h5.shape[0] + len(data)
-                        self.rightleg_data_h5.resize(new_size, axis=0)
-                        self.rightleg_data_h5[-len(data):] = np.array(data)
-                
-                i += 1
+                    # writing happens on the writer thread, here we only report its progress
+                    if self.h5_writer.error is not None:
+                        raise self.h5_writer.error
+                    self.settings['write_rate'] = self.h5_writer.write_rate
+                    self.settings['write_lag'] = self.h5_writer.lag()
+                    self.settings['write_backlog'] = self.h5_writer.backlog_rows()
+
+                # report samples lost to queue overflow, these are also logged by the queue
+                self.settings['samples_dropped'] = sum(buf.queue.rows_dropped for buf in
+                    (self.lefthand_data, self.righthand_data, self.leftleg_data, self.rightleg_data))
 
                 # wait between readings.
                 # We will use our sampling_period settings to define time
@@ -334,18 +459,23 @@ class MetaWearUI(Measurement):
                     # The interrupt button is a polite request to the 
                     # Measurement thread. We must periodically check for
                     # an interrupt request
-                    self.RightHandMeta.settings['start_streaming'] = False
-                    self.LeftHandMeta.settings['start_streaming'] = False
-                    self.RightLegMeta.settings['start_streaming'] = False
-                    self.LeftLegMeta.settings['start_streaming'] = False
-                    #self.RightHandMeta.operations['stop_stream']()
-                    #self.LeftHandMeta.operations['stop_stream']()
-                    #self.RightLegMeta.operations['stop_stream']()
-                    #self.LeftLegMeta.operations['stop_stream']()
                     break
 
         finally:            
+            # stop the streams also when the loop failed, so the sensors do not keep streaming into a closed run
+            self.RightHandMeta.settings['start_streaming'] = False
+            self.LeftHandMeta.settings['start_streaming'] = False
+            self.RightLegMeta.settings['start_streaming'] = False
+            self.LeftLegMeta.settings['start_streaming'] = False
+            #self.RightHandMeta.operations['stop_stream']()
+            #self.LeftHandMeta.operations['stop_stream']()
+            #self.RightLegMeta.operations['stop_stream']()
+            #self.LeftLegMeta.operations['stop_stream']()
+            # the last blocks of the stopped streams may still be on their way to the save queues
+            self.ingestion.wait_idle()
             if self.settings['save_h5']:
+                # write the remaining samples and trim the datasets to their exact length
+                self.h5_writer.stop()
                 # make sure to close the data file
                 #self.h5file.flush()
                 self.h5file.close()
@@ -7,9 +7,9 @@ import time
 import zmq
 import subprocess
 import atexit
-import threading
 import yaml
 import sys
+from sensor_ingestion import IngestionWorker
 
 class MobileControllerUI(Measurement):
     
@@ -89,6 +89,16 @@ class MobileControllerUI(Measurement):
 
         self.triggable = True
 
+        # the models run on their own worker thread, fed straight from the sensor callbacks, so the
+        # mobile responds without waiting for the GUI event loop; all zmq sends go through this worker
+        self.settings.New('control_latency', dtype=float, unit='ms', initial=0, ro=True)
+        self.control = IngestionWorker('mobile control')
+        self.control.start()
+        self.current_limb_connected_to_mobile = "_left_hand"
+        for limb, hw in [("_left_hand", self.LeftHandMeta), ("_right_hand", self.RightHandMeta),
+                         ("_left_leg", self.LeftLegMeta), ("_right_leg", self.RightLegMeta)]:
+            hw.sample_listeners.append(lambda acc_data, limb=limb: self.on_sample(limb, acc_data))
+
         with open('config.yaml', 'r') as file:
             config = yaml.safe_load(file)
             self.mobile_sound_speed = config['music'].get('mobile_sound_speed', 0.5)
@@ -96,53 +106,33 @@ class MobileControllerUI(Measurement):
         
 
     def set_limb_mobile_connection(self, limb_connected_to_mobile):
+        # the sample listeners of all limbs stay registered, only samples of this limb reach the models
+        self.current_limb_connected_to_mobile = limb_connected_to_mobile
 
-        if self.current_limb_connected_to_mobile == "_left_hand":
-            self.LeftHandMeta.acc_data_updated.disconnect(self.update_mobile_with_acc)
-            self.LeftHandMeta.acc_data_updated.disconnect(self.update_sound_with_acc)
-        elif self.current_limb_connected_to_mobile == "_right_hand":
-            self.RightHandMeta.acc_data_updated.disconnect(self.update_mobile_with_acc)
-            self.RightHandMeta.acc_data_updated.disconnect(self.update_sound_with_acc)
-        elif self.current_limb_connected_to_mobile == "_left_leg":
-            self.LeftLegMeta.acc_data_updated.disconnect(self.update_mobile_with_acc)
-            self.LeftLegMeta.acc_data_updated.disconnect(self.update_sound_with_acc)
-        elif self.current_limb_connected_to_mobile == "_right_leg":
-            self.RightLegMeta.acc_data_updated.disconnect(self.update_mobile_with_acc)
-            self.RightLegMeta.acc_data_updated.disconnect(self.update_sound_with_acc)
-        elif self.current_limb_connected_to_mobile == "_none":
-            pass
-
-        if limb_connected_to_mobile == "_left_hand":
-            self.LeftHandMeta.acc_data_updated.connect(self.update_mobile_with_acc)
-            self.LeftHandMeta.acc_data_updated.connect(self.update_sound_with_acc)
-        elif limb_connected_to_mobile == "_right_hand":
-            self.RightHandMeta.acc_data_updated.connect(self.update_mobile_with_acc)
-            self.RightHandMeta.acc_data_updated.connect(self.update_sound_with_acc)
-        elif limb_connected_to_mobile == "_left_leg":
-            self.LeftLegMeta.acc_data_updated.connect(self.update_mobile_with_acc)
-            self.LeftLegMeta.acc_data_updated.connect(self.update_sound_with_acc)
-        elif limb_connected_to_mobile == "_right_leg":
-            self.RightLegMeta.acc_data_updated.connect(self.update_mobile_with_acc)
-            self.RightLegMeta.acc_data_updated.connect(self.update_sound_with_acc)
-        elif limb_connected_to_mobile == "_none":
-            pass
+    def on_sample(self, limb, acc_data):
+        # on the sensor callback thread
+        if limb == self.current_limb_connected_to_mobile:
+            self.control.submit(self.update_with_acc, acc_data)
 
-        self.current_limb_connected_to_mobile = limb_connected_to_mobile
+    def update_with_acc(self, acc_data):
+        # on the control worker
+        self.update_mobile_with_acc(acc_data)
+        self.update_sound_with_acc(acc_data)
     
     def update_mobile_with_acc(self, acc_data):
         if self.settings['model'] == "_physical":
             
             # control the speed of the movie based on the acceleration of the left hand
             dt = 0.01
-            friction_coef = self.ui.Friction_spinbox.value()
-            mass = self.ui.mass_coef_spin_box.value()
+            friction_coef = self.settings['friction_coef']
+            mass = self.settings['mass_coef']
 
             self.next_movie_velocity = self.movie_velocity + mass * acc_data.acceleration * dt - friction_coef * dt
             if self.next_movie_velocity < 5 and self.next_movie_velocity - self.movie_velocity < 0 or self.next_movie_velocity < 0:
                 self.next_movie_velocity = 0
 
-            if self.next_movie_velocity > self.ui.max_movie_speed_spinBox.value():
-                self.next_movie_velocity = self.ui.max_movie_speed_spinBox.value()
+            if self.next_movie_velocity > self.settings['max_movie_speed']:
+                self.next_movie_velocity = self.settings['max_movie_speed']
             
             self.movie_velocity = self.next_movie_velocity
 
@@ -156,13 +146,14 @@ class MobileControllerUI(Measurement):
                 if acc_data.acceleration > self.settings['acceleration_threshold']:
                     if hasattr(self, 'socket'):
                         try:
-                            self.socket.send_multipart([b"mobile_movie", str(int(self.ui.max_movie_speed_spinBox.value())).encode('utf-8')])
-                            self.movie_velocity = self.ui.max_movie_speed_spinBox.value()
+                            self.socket.send_multipart([b"mobile_movie", str(int(self.settings['max_movie_speed'])).encode('utf-8')])
+                            self.movie_velocity = self.settings['max_movie_speed']
                         except zmq.error.ZMQError as e:
                             pass
-                    # start a timer to stop the movie after a certain time use a threading timer
+                    # start a timer to stop the movie after a certain time, it runs on the control worker
                     self.triggable = False
-                    threading.Timer(self.settings['movie_play_time_when_acceleration_above_threshold']/1000, self.stop_movie).start()
+                    self.app.timers.call_later(self.settings['movie_play_time_when_acceleration_above_threshold']/1000,
+                                               self.control.submit, self.stop_movie, name='mobile stop movie')
             else:
                 pass
 
@@ -175,7 +166,8 @@ class MobileControllerUI(Measurement):
             except zmq.error.ZMQError as e:
                 pass
         # start another to define a dead time
-        threading.Timer(self.settings['sensor_unresponsive_time']/1000, self.make_movie_triggable_again).start()
+        self.app.timers.call_later(self.settings['sensor_unresponsive_time']/1000, self.make_movie_triggable_again,
+                                   name='mobile dead time')
         
     def make_movie_triggable_again(self):
         self.triggable = True
@@ -211,9 +203,6 @@ class MobileControllerUI(Measurement):
 
         # Set up limb connected to mobile
         self.settings.limb_connected_to_mobile.connect_to_widget(self.ui.Limb_connected_to_mobile_ComboBox)
-        self.current_limb_connected_to_mobile = "_left_hand"
-        self.LeftHandMeta.acc_data_updated.connect(self.update_mobile_with_acc)
-        self.LeftHandMeta.acc_data_updated.connect(self.update_sound_with_acc)
 
         # Set up Zaadnoordijk Model
         self.settings.acceleration_threshold.connect_to_widget(self.ui.acceleration_threshold_spinBox)
@@ -241,11 +230,12 @@ class MobileControllerUI(Measurement):
     def update_sound_volume_and_speed(self):
         message = f"{self.ui.sound_speed_spinBox.value()},{self.ui.sound_volume_spinBox.value()}"
         if hasattr(self, 'socket_sound'):
-            self.socket_sound.send_string(message)
+            self.control.submit(self.socket_sound.send_string, message)
 
     def update_fps(self):
          if hasattr(self, 'socket'):
-            self.socket.send_multipart([b"mobile_movie", str(int(self.ui.fps_spinBox.value())).encode('utf-8')])
+            self.control.submit(self.socket.send_multipart,
+                                [b"mobile_movie", str(int(self.ui.fps_spinBox.value())).encode('utf-8')])
 
     def update_display(self):
         """
@@ -334,6 +324,7 @@ class MobileControllerUI(Measurement):
                 # wait between readings.
                 # We will use our sampling_period settings to define time
                 time.sleep(self.settings['sampling_period'])
+                self.settings['control_latency'] = self.control.stats()['latency_p99'] * 1000
                 
                 i += 1
 
@@ -356,6 +347,8 @@ class MobileControllerUI(Measurement):
             #self.LeftHandMeta.acc_data_updated.disconnect(self.update_mobile_with_acc)
             #self.LeftHandMeta.acc_data_updated.disconnect(self.update_sound_with_acc)
             print("Experiment is finished")
+            # let the control worker finish its sends before the sockets close
+            self.control.wait_idle()
             print("close down zmq server visual")
             self.socket.close()
             self.context.term()
@@ -0,0 +1,108 @@
+"""
+Micro-benchmark of the per-sample cost of the fusion data callback.
+
+Feeds ctypes Data/CartesianFloat payloads (the layout libmetawear passes to
+the callback) through three paths and reports the cost per sample:
+
+    parse_value + AccelerationData   the original per-sample signal path
+    parse_value + SampleBatcher      batched delivery with generic parsing
+    FusionBatcher.add_data           memmove into preallocated records
+
+parse_value is taken from mbientlab when it is installed, otherwise an
+equivalent of its type dispatcher is used.
+
+    python Utils/benchmark_fusion_parse.py --samples 200000
+"""
+
+import argparse
+import ctypes
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from fusion_parse import Data, CartesianFloat, FusionBatcher
+from sensor_buffers import SampleBatcher
+from sensor_data import AccelerationData
+
+try:
+    from mbientlab.metawear import parse_value
+    from mbientlab.metawear.cbindings import DataTypeId
+    CARTESIAN_FLOAT = DataTypeId.CARTESIAN_FLOAT
+except ImportError:
+    CARTESIAN_FLOAT = 2  # DataTypeId.CARTESIAN_FLOAT
+
+    def parse_value(pointer):
+        # same dispatch as mbientlab parse_value: compare the type id, cast and copy the payload
+        contents = pointer.contents
+        for type_id in (0, 1):
+            if contents.type_id == type_id:
+                raise NotImplementedError
+        if contents.type_id == CARTESIAN_FLOAT:
+            value = ctypes.cast(contents.value, ctypes.POINTER(CartesianFloat)).contents
+            return CartesianFloat(value.x, value.y, value.z)
+        raise NotImplementedError
+
+
+def make_payloads(n):
+    """n Data pointers with CartesianFloat payloads, kept alive by the returned lists."""
+    rng = np.random.default_rng(0)
+    values = [CartesianFloat(*rng.normal(0, 0.3, 3)) for _ in range(n)]
+    data = [Data(epoch=1700000000000 + i * 10, value=ctypes.addressof(values[i]), type_id=CARTESIAN_FLOAT,
+                 length=ctypes.sizeof(CartesianFloat)) for i in range(n)]
+    pointers = [ctypes.pointer(d) for d in data]
+    return values, data, pointers
+
+
+def per_sample_signal(pointers, emit):
+    for pointer in pointers:
+        acc_data = parse_value(pointer)
+        emit(AccelerationData(acc_data.x, acc_data.y, acc_data.z, time.time()))
+
+
+def batched_generic(pointers, batcher):
+    for pointer in pointers:
+        acc_data = parse_value(pointer)
+        batcher.add(time.time(), acc_data.x, acc_data.y, acc_data.z)
+
+
+def batched_fast(pointers, batcher):
+    for pointer in pointers:
+        batcher.add_data(pointer, time.time())
+
+
+def measure(func, *args):
+    t0 = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--samples', type=int, default=200000)
+    parser.add_argument('--window-ms', type=float, default=10)
+    args = parser.parse_args()
+
+    values, data, pointers = make_payloads(args.samples)
+    sink = []
+    discard = lambda block: None
+    paths = [
+        ('parse_value + AccelerationData', per_sample_signal, (pointers, sink.append)),
+        ('parse_value + SampleBatcher', batched_generic, (pointers, SampleBatcher(discard, args.window_ms / 1000))),
+        ('FusionBatcher.add_data', batched_fast,
+         (pointers, FusionBatcher(discard, CARTESIAN_FLOAT, args.window_ms / 1000))),
+    ]
+    print(f"{args.samples} samples, parse_value from {parse_value.__module__}\n")
+    baseline = None
+    for name, func, func_args in paths:
+        sink.clear()
+        seconds = min(measure(func, *func_args) for _ in range(3))
+        ns = seconds / args.samples * 1e9
+        baseline = baseline or ns
+        print(f"{name:<34}{ns:8.0f} ns/sample{baseline / ns:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
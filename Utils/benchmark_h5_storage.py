@@ -0,0 +1,97 @@
+"""
+Benchmark the .sensor.h5 storage profiles.
+
+Writes a synthetic session (four limbs, BLE-like timestamp jitter) with every
+profile in h5_storage.STORAGE_PROFILES through the same H5SessionWriter path
+and TIMED_SAMPLE_COLUMNS layout used by MetaWearUI, then reports file size and
+write/read throughput.
+
+    python Utils/benchmark_h5_storage.py --minutes 10 --rate 200
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import h5py
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from h5_storage import STORAGE_PROFILES, LIMB_DATASETS, TIMED_SAMPLE_COLUMNS, TIME_COLUMNS, read_samples
+from h5_writer import H5SessionWriter
+from sensor_buffers import SampleQueue
+
+LIMBS = LIMB_DATASETS
+
+
+def synthetic_limb(n, rate, rng):
+    """
+    Rows in the TIMED_SAMPLE_COLUMNS layout the app writes: the aligned time,
+    smooth-ish linear acceleration, the host receive time with BLE
+    connection-interval bursts and the device clock epoch in whole ms.
+    """
+    t0 = time.time()
+    # the sensor clock ticks evenly with a little drift, its epoch has ms resolution
+    device = np.floor((t0 + np.arange(n) / rate * (1 + 20e-6)) * 1000) / 1000
+    intervals = rng.normal(1.0 / rate, 0.2 / rate, n).clip(0)
+    # BLE delivers packets in bursts: every ~4th sample arrives late and the next ones catch up
+    intervals[::4] += 0.5 / rate
+    host = t0 + 0.02 + np.cumsum(intervals)
+    aligned = device + 0.015
+    acc = np.cumsum(rng.normal(0, 0.01, (n, 3)), axis=0) * 0.1 + rng.normal(0, 0.02, (n, 3))
+    return np.column_stack([aligned, acc.astype(np.float32), host, device]).astype(np.float64)
+
+
+def benchmark_profile(profile, limbs, block_rows, folder):
+    fname = os.path.join(folder, f"{profile.name}.sensor.h5")
+    queues = {name: SampleQueue(width=len(TIMED_SAMPLE_COLUMNS)) for name in LIMBS}
+    with h5py.File(fname, 'w') as h5file:
+        writer = H5SessionWriter(period=3600)  # passes are driven below, like the writer thread would
+        for name in LIMBS:
+            writer.add_stream(profile.create_dataset(h5file, name, TIMED_SAMPLE_COLUMNS), queues[name],
+                              profile.encoder(TIMED_SAMPLE_COLUMNS))
+        n = len(limbs[LIMBS[0]])
+        t0 = time.perf_counter()
+        for start in range(0, n, block_rows):
+            for name in LIMBS:
+                queues[name].push_block(limbs[name][start:start + block_rows])
+            writer.write_pending()
+        writer.stop()
+        write_time = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    with h5py.File(fname, 'r') as h5file:
+        for name in LIMBS:
+            data = read_samples(h5file[name])
+            for j, col in enumerate(TIMED_SAMPLE_COLUMNS):
+                if col in TIME_COLUMNS:
+                    np.testing.assert_allclose(data[:, j], limbs[name][:, j], rtol=0, atol=1e-6)
+    read_time = time.perf_counter() - t0
+    return os.path.getsize(fname), write_time, read_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--minutes', type=float, default=10, help='session length per limb')
+    parser.add_argument('--rate', type=float, default=200, help='samples per second per limb')
+    parser.add_argument('--block-rows', type=int, default=20, help='rows per writer pass (0.1 s at 200 Hz)')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    n = int(args.minutes * 60 * args.rate)
+    limbs = {name: synthetic_limb(n, args.rate, rng) for name in LIMBS}
+    total_samples = n * len(LIMBS)
+
+    print(f"{n} samples per limb ({args.minutes} min at {args.rate} Hz), {args.block_rows} rows per write\n")
+    print(f"{'profile':<18}{'size [MB]':>10}{'B/sample':>10}{'write [ks/s]':>14}{'read [ks/s]':>13}")
+    with tempfile.TemporaryDirectory() as folder:
+        for profile in STORAGE_PROFILES.values():
+            size, write_time, read_time = benchmark_profile(profile, limbs, args.block_rows, folder)
+            print(f"{profile.name:<18}{size / 1e6:>10.2f}{size / total_samples:>10.1f}"
+                  f"{total_samples / write_time / 1e3:>14.0f}{total_samples / read_time / 1e3:>13.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""
+Sensor-to-stimulus latency of the mobile control path with a busy GUI.
+
+A producer thread plays the sensor callback and delivers samples at --rate Hz.
+Each sample goes through one of two paths to a consumer that stands in for the
+mobile model and its zmq send:
+
+    qt signal      a pyqtSignal emitted from the producer thread, the slot runs
+                   on the Qt event loop of the main thread (the original path)
+    worker         sensor_ingestion.IngestionWorker, the consumer runs on its
+                   own thread
+
+Meanwhile the main thread plays a GUI under load: a repaint of --paint-ms every
+frame at 60 Hz and a --stall-ms block (a table edit, a file dialog) every
+--stall-period seconds, both busy (holding the GIL like Python-side plotting).
+Latency is the time from the callback to the end of the consumer.
+
+    python Utils/benchmark_ingestion_latency.py --seconds 10 --paint-ms 8 --stall-ms 150
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+from PyQt5.QtCore import QCoreApplication, QObject, QTimer, pyqtSignal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from sensor_ingestion import IngestionWorker
+from sensor_data import AccelerationData
+
+
+class SampleSource(QObject):
+    sample = pyqtSignal(object)
+
+
+class Consumer(object):
+    """Physical mobile model step, records the latency of every sample."""
+
+    def __init__(self):
+        self.velocity = 0.0
+        self.latency = []
+
+    def __call__(self, acc_data):
+        self.velocity = max(0.0, self.velocity + 3000 * acc_data.acceleration * 0.01 - 300 * 0.01)
+        self.latency.append(time.perf_counter() - acc_data.time)
+
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def produce(deliver, rate, seconds, done):
+    rng = np.random.default_rng(0)
+    t_next = time.perf_counter()
+    end = t_next + seconds
+    while t_next < end:
+        t_next += 1 / rate
+        time.sleep(max(0.0, t_next - time.perf_counter()))
+        x, y, z = rng.normal(0, 0.2, 3)
+        # perf_counter instead of time.time, so the latency has sub-ms resolution
+        deliver(AccelerationData(x, y, z, time.perf_counter()))
+    done.set()
+
+
+def run_path(app, path, args):
+    consumer = Consumer()
+    source = SampleSource()
+    worker = None
+    if path == 'qt signal':
+        source.sample.connect(consumer)
+        deliver = source.sample.emit
+    else:
+        worker = IngestionWorker('benchmark')
+        worker.start()
+        deliver = lambda acc_data: worker.submit(consumer, acc_data)
+
+    frames = [0]
+
+    def paint():
+        frames[0] += 1
+        busy(args.paint_ms / 1000)
+        if frames[0] % int(60 * args.stall_period) == 0:
+            busy(args.stall_ms / 1000)
+
+    timer = QTimer()
+    timer.timeout.connect(paint)
+    timer.start(int(1000 / 60))
+    done = threading.Event()
+    producer = threading.Thread(target=produce, args=(deliver, args.rate, args.seconds, done), daemon=True)
+    producer.start()
+    while not done.is_set():
+        app.processEvents()
+        time.sleep(0.0005)
+    timer.stop()
+    # the queued slots and calls of the last samples
+    end = time.perf_counter() + 1.0
+    while time.perf_counter() < end:
+        app.processEvents()
+    if worker is not None:
+        worker.stop()
+    return np.array(consumer.latency) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=10, help='duration per path')
+    parser.add_argument('--rate', type=float, default=100, help='samples per second')
+    parser.add_argument('--paint-ms', type=float, default=8, help='busy time of every 60 Hz frame')
+    parser.add_argument('--stall-ms', type=float, default=150, help='busy time of the periodic GUI stall')
+    parser.add_argument('--stall-period', type=float, default=1.0, help='seconds between GUI stalls')
+    args = parser.parse_args()
+
+    app = QCoreApplication.instance() or QCoreApplication(sys.argv)
+    print(f"{args.rate:.0f} Hz for {args.seconds:.0f} s, GUI frames {args.paint_ms:.0f} ms at 60 Hz, "
+          f"{args.stall_ms:.0f} ms stall every {args.stall_period:.1f} s\n")
+    print(f"{'path':<12}{'samples':>9}{'p50 [ms]':>10}{'p99 [ms]':>10}{'max [ms]':>10}")
+    for path in ('qt signal', 'worker'):
+        latency = run_path(app, path, args)
+        print(f"{path:<12}{len(latency):>9}{np.percentile(latency, 50):>10.2f}{np.percentile(latency, 99):>10.2f}"
+              f"{latency.max():>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
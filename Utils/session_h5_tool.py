@@ -0,0 +1,142 @@
+"""
+Live tail and crash recovery for session h5 files (.sensor.h5 and task .h5).
+
+Session files are written in SWMR mode, so they can be read while the
+experiment is running, and whatever was flushed before a crash is still
+readable afterwards.
+
+    python Utils/session_h5_tool.py tail Mobile.2025.09.30.5025.04.001.sensor.h5
+    python Utils/session_h5_tool.py recover Mobile.2025.09.30.5025.04.001.sensor.h5
+
+`recover` copies every readable group, attribute and dataset into a new,
+cleanly closed file (default: <name>.recovered.h5). Limb datasets are cut
+to the row counts published by the writer (or, without counts, to the
+last row with a non-zero timestamp), so the over-allocated tail left by a
+crash is not mistaken for data.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import h5py
+import numpy as np
+
+ROW_COUNTER_NAME = 'rows_written'
+
+
+def open_for_reading(fname):
+    """Open a session file read-only, also when it was left open by a crashed writer."""
+    try:
+        return h5py.File(fname, 'r', libver='latest', swmr=True)
+    except OSError:
+        # not a latest-format file, or the consistency flags block SWMR reading
+        return h5py.File(fname, 'r')
+
+
+def valid_row_counts(h5file):
+    """Map dataset name -> number of valid rows, from every row counter in the file."""
+    counts = {}
+
+    def visit(name, obj):
+        if isinstance(obj, h5py.Dataset) and name.split('/')[-1] == ROW_COUNTER_NAME and 'streams' in obj.attrs:
+            if h5file.swmr_mode:
+                obj.refresh()
+            for stream, rows in zip(obj.attrs['streams'], obj[:]):
+                stream = stream.decode() if isinstance(stream, bytes) else str(stream)
+                counts[stream] = int(rows)
+    h5file.visititems(visit)
+    return counts
+
+
+def last_nonzero_time_row(dataset):
+    """Number of rows up to the last row whose timestamp ('time' field or first column) is non-zero."""
+    if dataset.shape[0] == 0:
+        return 0
+    if dataset.dtype.names is None:
+        times = dataset[:, 0]
+    else:
+        times = dataset['time' if 'time' in dataset.dtype.names else dataset.dtype.names[0]]
+    nonzero = np.flatnonzero(times)
+    return int(nonzero[-1]) + 1 if len(nonzero) else 0
+
+
+def tail(fname, interval):
+    h5file = h5py.File(fname, 'r', libver='latest', swmr=True)
+    print(f"following {fname}, ctrl+c to stop")
+    previous = {}
+    try:
+        while True:
+            counts = valid_row_counts(h5file)
+            line = []
+            for name, rows in sorted(counts.items()):
+                rate = (rows - previous.get(name, rows)) / interval
+                line.append(f"{name.split('/')[-1]}: {rows} rows ({rate:.0f}/s)")
+            previous = counts
+            print(time.strftime("%H:%M:%S"), " | ".join(line) if line else "no row counters yet")
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        h5file.close()
+
+
+def copy_attrs(src, dst):
+    for key in src.attrs:
+        try:
+            dst.attrs[key] = src.attrs[key]
+        except (OSError, KeyError, TypeError) as err:
+            print(f"  skipped attribute {src.name}@{key}: {err}")
+
+
+def recover(fname, out_fname):
+    report = []
+    with open_for_reading(fname) as src, h5py.File(out_fname, 'w') as dst:
+        counts = valid_row_counts(src)
+        copy_attrs(src, dst)
+
+        def visit(name, obj):
+            try:
+                if isinstance(obj, h5py.Group):
+                    copy_attrs(obj, dst.require_group(name))
+                    return
+                rows = obj.shape[0] if obj.shape else None
+                if obj.name in counts:
+                    rows = min(rows, counts[obj.name])
+                elif obj.maxshape and obj.maxshape[0] is None and obj.dtype.kind in 'fiV':
+                    rows = last_nonzero_time_row(obj)
+                data = obj[()] if rows is None else obj[:rows]
+                out = dst.create_dataset(name, data=data, maxshape=obj.maxshape, chunks=obj.chunks,
+                                         compression=obj.compression, compression_opts=obj.compression_opts,
+                                         shuffle=obj.shuffle)
+                copy_attrs(obj, out)
+                report.append(f"  {name}: {obj.shape} -> {out.shape}")
+            except (OSError, KeyError, ValueError) as err:
+                report.append(f"  {name}: unreadable, skipped ({err})")
+        src.visititems(visit)
+
+    print(f"recovered {fname} -> {out_fname}")
+    print("\n".join(report))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_tail = sub.add_parser('tail', help='print row counts and rates of a file being written')
+    p_tail.add_argument('fname')
+    p_tail.add_argument('--interval', type=float, default=1.0, help='seconds between updates')
+    p_recover = sub.add_parser('recover', help='salvage a partially written file')
+    p_recover.add_argument('fname')
+    p_recover.add_argument('-o', '--output', help='output file (default: <name>.recovered.h5)')
+    args = parser.parse_args()
+
+    if args.command == 'tail':
+        tail(args.fname, args.interval)
+    else:
+        out_fname = args.output or os.path.splitext(args.fname)[0] + '.recovered.h5'
+        recover(args.fname, out_fname)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""
+End-to-end load test of the sensor -> queue -> h5 writer pipeline without BLE.
+
+Runs N simulated MetaMotionRL streams (HW_MetaMotionRL_Sim) on their own
+threads, feeds every sample through the same path as MetaWearUI
+(SampleBatcher blocks -> plot RingBuffer + SampleQueue) and writes the queues to a
+.sensor.h5 file with H5SessionWriter, then checks that every emitted sample
+reached the file.
+
+    python Utils/stress_test_pipeline.py --sensors 16 --rate 200 --seconds 60
+    python Utils/stress_test_pipeline.py --replay data/session.sensor.h5 --speed 4
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import h5py
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from HW_MetaMotionRL_Sim import SyntheticSource, ReplaySource, SimulatedStream
+from h5_storage import STORAGE_PROFILES, DEFAULT_STORAGE_PROFILE, LIMB_DATASETS, TIMED_SAMPLE_COLUMNS, read_samples
+from h5_writer import H5SessionWriter, create_row_counter
+from sensor_buffers import RingBuffer, SampleQueue, SampleBatcher, BLOCK_COLUMNS
+from clock_sync import ClockAligner
+
+SAVED_BLOCK_COLUMNS = [BLOCK_COLUMNS.index(col) for col in TIMED_SAMPLE_COLUMNS]
+
+
+class SensorSink(object):
+    """What the hardware component and MetaWearUI do with the samples of one limb."""
+
+    def __init__(self, window, history_length=500):
+        self.history = RingBuffer(history_length, width=2)
+        self.queue = SampleQueue(width=len(TIMED_SAMPLE_COLUMNS))
+        self.batcher = SampleBatcher(self.add_block, window=window, aligner=ClockAligner())
+
+    def __call__(self, acc_x, acc_y, acc_z, t, device_time):
+        self.batcher.add(t, acc_x, acc_y, acc_z, device_time=device_time)
+
+    def add_block(self, block):
+        self.history.extend(block[:, (0, 4)].T)
+        self.queue.push_block(block[:, SAVED_BLOCK_COLUMNS])
+
+
+def make_source(args, i):
+    if args.replay:
+        return ReplaySource(args.replay, LIMB_DATASETS[i % len(LIMB_DATASETS)], args.speed)
+    return SyntheticSource(args.rate, args.jitter, args.dropout_probability, args.dropout_length, seed=i)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sensors', type=int, default=4, help='number of simulated sensors')
+    parser.add_argument('--rate', type=float, default=200, help='samples per second per sensor')
+    parser.add_argument('--seconds', type=float, default=30, help='test duration')
+    parser.add_argument('--jitter', type=float, default=0.002, help='std of the sample interval [s]')
+    parser.add_argument('--dropout-probability', type=float, default=0.0, help='probability a dropout starts at a sample')
+    parser.add_argument('--dropout-length', type=int, default=10, help='mean dropout length [samples]')
+    parser.add_argument('--replay', help='replay the limbs of this .sensor.h5 file instead of synthetic data')
+    parser.add_argument('--speed', type=float, default=1.0, help='replay speed factor')
+    parser.add_argument('--profile', default=DEFAULT_STORAGE_PROFILE, choices=list(STORAGE_PROFILES))
+    parser.add_argument('--window-ms', type=float, default=10, help='sample delivery window')
+    parser.add_argument('--keep', help='keep the written file at this path')
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp()
+    fname = args.keep or os.path.join(folder, 'stress.sensor.h5')
+    profile = STORAGE_PROFILES[args.profile]
+    sinks = [SensorSink(args.window_ms / 1000) for _ in range(args.sensors)]
+    streams = [SimulatedStream(make_source(args, i), sink, name=f"sensor_{i}") for i, sink in enumerate(sinks)]
+
+    with h5py.File(fname, 'w') as h5file:
+        writer = H5SessionWriter(period=0.1, h5file=h5file)
+        datasets = [profile.create_dataset(h5file, f"sensor_{i}", TIMED_SAMPLE_COLUMNS) for i in range(args.sensors)]
+        for dataset, sink in zip(datasets, sinks):
+            writer.add_stream(dataset, sink.queue, profile.encoder(TIMED_SAMPLE_COLUMNS))
+        writer.set_row_counter(create_row_counter(h5file, datasets))
+
+        cpu0, t0 = time.process_time(), time.perf_counter()
+        writer.start()
+        for stream in streams:
+            stream.start()
+            stream.streaming.set()
+        lags = []
+        while time.perf_counter() - t0 < args.seconds:
+            time.sleep(1.0)
+            lags.append(writer.lag())
+            print(f"{time.perf_counter() - t0:5.0f} s  write rate {writer.write_rate:8.0f} rows/s  "
+                  f"lag {lags[-1] * 1e3:6.0f} ms  backlog {writer.backlog_rows():6d} rows")
+        for stream in streams:
+            stream.stop()
+        for sink in sinks:
+            sink.batcher.flush()
+        writer.stop()
+        elapsed, cpu = time.perf_counter() - t0, time.process_time() - cpu0
+
+        emitted = np.array([stream.samples_emitted for stream in streams])
+        written = np.array([dataset.shape[0] for dataset in datasets])
+        dropped = np.array([sink.queue.rows_dropped for sink in sinks])
+        # timing quality of one sensor: receive times are bursty, aligned device times are not
+        samples = read_samples(datasets[0])
+        host_jitter = np.std(np.diff(samples[:, TIMED_SAMPLE_COLUMNS.index('host_time')]))
+        aligned_jitter = np.std(np.diff(samples[:, 0]))
+
+    print(f"\n{args.sensors} sensors, {elapsed:.1f} s, profile {args.profile}")
+    print(f"delivered rate per sensor: {emitted.min() / elapsed:.1f} - {emitted.max() / elapsed:.1f} Hz")
+    print(f"samples emitted {emitted.sum()}, written {written.sum()}, dropped by queues {dropped.sum()}")
+    print(f"writer lag: median {np.median(lags) * 1e3:.0f} ms, max {np.max(lags) * 1e3:.0f} ms")
+    print(f"sample interval std: host time {host_jitter * 1e3:.2f} ms, aligned time {aligned_jitter * 1e3:.2f} ms")
+    print(f"process CPU: {100 * cpu / elapsed:.0f}% of one core")
+    if writer.error is not None or not np.array_equal(emitted, written + dropped):
+        print("FAILED: samples missing from the file")
+        return 1
+    print("OK: every emitted sample reached the file")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
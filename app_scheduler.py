@@ -0,0 +1,204 @@
+"""
+App Timer Service
+One worker thread running every timer of the app on monotonic-clock deadlines
+"""
+
+import collections
+import heapq
+import itertools
+import threading
+import time
+import logging
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+
+class TimerHandle(object):
+    """
+    A scheduled call, returned by TimerService.call_later/call_every.
+
+    ``cancel`` removes it, ``pause`` freezes the time remaining until the next
+    call and ``resume`` continues from there (a paused step timer keeps its
+    remaining duration).
+    """
+
+    def __init__(self, service, func, args, deadline, interval, name):
+        self.service = service
+        self.func = func
+        self.args = args
+        self.deadline = deadline
+        self.interval = interval
+        self.name = name
+        self.cancelled = False
+        self.paused = False
+        self.fired = 0
+        self._remaining = None
+        self._generation = 0
+
+    @property
+    def active(self):
+        """True while the timer will still fire (a paused timer is active)."""
+        return not self.cancelled
+
+    def remaining(self):
+        """Seconds until the next call, frozen while paused, None once done or cancelled."""
+        if self.cancelled:
+            return None
+        if self.paused:
+            return self._remaining
+        return max(0.0, self.deadline - time.monotonic())
+
+    def cancel(self):
+        self.service._cancel(self)
+
+    def pause(self):
+        self.service._pause(self)
+
+    def resume(self):
+        self.service._resume(self)
+
+    def __repr__(self):
+        state = 'cancelled' if self.cancelled else 'paused' if self.paused else f"in {self.remaining():.3f} s"
+        return f"TimerHandle({self.name!r}, {state})"
+
+
+class TimerService(threading.Thread):
+    """
+    Runs timed calls for the whole app on a single daemon thread.
+
+    Deadlines are on ``time.monotonic()``, so wall clock changes do not move
+    them. Periodic timers are fixed rate: the next deadline is the previous
+    one plus the interval, calls that are more than a whole interval late are
+    skipped rather than run back to back. Callbacks run on the worker thread
+    and should return quickly, an exception is logged and does not stop the
+    service or a periodic timer.
+
+    For every timer name the service keeps how late the calls fired relative
+    to their deadline, see ``stats``.
+
+    Usage::
+
+        timers = TimerService()
+        timers.start()
+        handle = timers.call_every(1.0, read_battery, name='battery')
+        ...
+        handle.cancel()
+    """
+
+    def __init__(self, lateness_history=1000, name='TimerService'):
+        threading.Thread.__init__(self, name=name, daemon=True)
+        self._heap = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._stopping = False
+        self.lateness_history = lateness_history
+        self._lateness = {}
+        self._fired = collections.Counter()
+
+    def call_later(self, delay, func, *args, name=None):
+        """Call ``func(*args)`` once after ``delay`` seconds."""
+        return self._add(delay, func, args, None, name)
+
+    def call_every(self, interval, func, *args, name=None, first_delay=None):
+        """Call ``func(*args)`` every ``interval`` seconds, first after ``first_delay`` (default one interval)."""
+        if interval <= 0:
+            raise ValueError(f"interval must be positive, got {interval}")
+        return self._add(interval if first_delay is None else first_delay, func, args, interval, name)
+
+    def _add(self, delay, func, args, interval, name):
+        name = name or getattr(func, '__qualname__', repr(func))
+        handle = TimerHandle(self, func, args, time.monotonic() + delay, interval, name)
+        with self._condition:
+            self._push(handle)
+        return handle
+
+    def _push(self, handle):
+        # caller holds the condition; stale heap entries are recognized by their generation
+        heapq.heappush(self._heap, (handle.deadline, next(self._sequence), handle._generation, handle))
+        self._condition.notify()
+
+    def _cancel(self, handle):
+        with self._condition:
+            handle.cancelled = True
+            handle._generation += 1
+
+    def _pause(self, handle):
+        with self._condition:
+            if handle.cancelled or handle.paused:
+                return
+            handle._remaining = max(0.0, handle.deadline - time.monotonic())
+            handle.paused = True
+            handle._generation += 1
+
+    def _resume(self, handle):
+        with self._condition:
+            if handle.cancelled or not handle.paused:
+                return
+            handle.paused = False
+            handle.deadline = time.monotonic() + handle._remaining
+            handle._remaining = None
+            handle._generation += 1
+            self._push(handle)
+
+    def run(self):
+        while True:
+            with self._condition:
+                handle = None
+                while handle is None:
+                    if self._stopping:
+                        return
+                    if not self._heap:
+                        self._condition.wait()
+                        continue
+                    deadline, _, generation, candidate = self._heap[0]
+                    if generation != candidate._generation:
+                        heapq.heappop(self._heap)
+                        continue
+                    wait = deadline - time.monotonic()
+                    if wait > 0:
+                        self._condition.wait(wait)
+                        continue
+                    heapq.heappop(self._heap)
+                    handle = candidate
+                fired_at = time.monotonic()
+                self._record(handle.name, fired_at - handle.deadline)
+                handle.fired += 1
+                if handle.interval is None:
+                    handle.cancelled = True
+                else:
+                    # fixed rate, skipping whole intervals that were missed
+                    missed = int((fired_at - handle.deadline) // handle.interval)
+                    handle.deadline += (missed + 1) * handle.interval
+                    self._push(handle)
+            try:
+                handle.func(*handle.args)
+            except Exception as err:
+                log.error("timer %s failed: %s", handle.name, err)
+
+    def _record(self, name, lateness):
+        history = self._lateness.get(name)
+        if history is None:
+            history = self._lateness[name] = collections.deque(maxlen=self.lateness_history)
+        history.append(lateness)
+        self._fired[name] += 1
+
+    def stats(self):
+        """{timer name: {'fired', 'late_mean', 'late_p99', 'late_max'}}, lateness in seconds over the recent calls."""
+        with self._condition:
+            lateness = {name: np.array(history) for name, history in self._lateness.items()}
+            fired = dict(self._fired)
+        return {name: {'fired': fired[name], 'late_mean': late.mean(), 'late_p99': np.percentile(late, 99),
+                       'late_max': late.max()} for name, late in lateness.items()}
+
+    def pending(self):
+        """Number of timers waiting to fire (paused ones not included)."""
+        with self._condition:
+            return sum(generation == handle._generation for _, _, generation, handle in self._heap)
+
+    def stop(self, timeout=1.0):
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        if self.is_alive():
+            self.join(timeout)
@@ -0,0 +1,140 @@
+"""
+Sensor Battery Monitor
+Adaptive, staggered battery polling of the MetaWear sensors with a read/stream-gap correlation check
+"""
+
+import threading
+import time
+import numpy as np
+from h5_storage import BATTERY_COLUMNS
+
+
+class BatteryMonitor(object):
+    """
+    Polls the battery state of several sensors on the app TimerService.
+
+    Every read is a request/response on the BLE link that carries the fusion
+    data, so a sensor is read every ``streaming_interval`` seconds while it
+    streams and every ``idle_interval`` seconds while it is only connected.
+    The monitor ticks every ``tick`` seconds and issues at most one read per
+    tick, the most overdue sensor first, and the first reads are spread over
+    one interval, so reads of different sensors never share a connection
+    interval.
+
+    Sensors are hardware components with ``read_battery_charge_thread()``
+    (sends the read), a ``battery_listener`` attribute that is called with
+    ``(charge, voltage)`` when the response arrives, and a ``telemetry``
+    (sensor_telemetry.SensorTelemetry).
+
+    To see whether reads disturb the stream, each read made while streaming
+    is compared with the sample stream once the telemetry covers ``settle``
+    seconds after it: the longest host arrival interval in that time against
+    the baseline, the 95th percentile of the longest interval of every
+    ``settle`` long stretch in the telemetry window. Without an effect about
+    5% of the reads are followed by a longer interval than the baseline.
+    Completed rows (BATTERY_COLUMNS) are passed to ``record(row)``.
+    """
+
+    def __init__(self, timers, sensors, record=None, streaming_interval=60.0, idle_interval=5.0, tick=1.0,
+                 settle=1.0):
+        self.timers = timers
+        self.sensors = list(sensors)
+        self.record = record
+        self.streaming_interval = streaming_interval
+        self.idle_interval = idle_interval
+        self.tick = tick
+        self.settle = settle
+        self.lock = threading.Lock()
+        self.reads = 0
+        self._pending = []
+        self._due = [0.0] * len(self.sensors)
+        self._handle = None
+        for limb, sensor in enumerate(self.sensors):
+            sensor.battery_listener = lambda charge, voltage, limb=limb: self.on_battery(limb, charge, voltage)
+        # (interval after read, baseline interval) of the reads made while streaming
+        self.read_intervals = []
+
+    def start(self):
+        now = time.monotonic()
+        # spread the first reads over one idle interval
+        self._due = [now + i * self.idle_interval / len(self.sensors) for i in range(len(self.sensors))]
+        self._handle = self.timers.call_every(self.tick, self.poll, name='battery monitor')
+
+    def stop(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def interval(self, sensor):
+        return self.streaming_interval if sensor.settings['start_streaming'] else self.idle_interval
+
+    def poll(self, now=None, wall_time=None):
+        """One tick: finish settled rows and read the most overdue connected sensor."""
+        now = time.monotonic() if now is None else now
+        wall_time = time.time() if wall_time is None else wall_time
+        self.finish_rows(wall_time)
+        due = [(self._due[i], i) for i, sensor in enumerate(self.sensors)
+               if sensor.settings['connected'] and self._due[i] <= now]
+        if not due:
+            return None
+        _, limb = min(due)
+        sensor = self.sensors[limb]
+        streaming = bool(sensor.settings['start_streaming'])
+        self._due[limb] = now + self.interval(sensor)
+        row = dict(time=wall_time, limb=limb, charge=np.nan, voltage=np.nan, streaming=float(streaming),
+                   interval_after_read=np.nan, baseline_interval=np.nan)
+        with self.lock:
+            self._pending.append(row)
+        self.reads += 1
+        sensor.read_battery_charge_thread()
+        return limb
+
+    def on_battery(self, limb, charge, voltage):
+        """Response of a read, from the BLE thread."""
+        with self.lock:
+            for row in reversed(self._pending):
+                if row['limb'] == limb:
+                    row['charge'], row['voltage'] = charge, voltage
+                    break
+
+    def finish_rows(self, wall_time):
+        """Compare settled reads with the stream and pass them to ``record``."""
+        with self.lock:
+            pending, self._pending = self._pending, []
+        waiting = []
+        for row in pending:
+            telemetry = self.sensors[row['limb']].telemetry
+            age = wall_time - row['time']
+            # wait until the telemetry has the samples after the read, unless they are not coming
+            covered = telemetry.last_time() >= row['time'] + self.settle
+            if age < self.settle or (row['streaming'] and not covered and age < telemetry.window):
+                waiting.append(row)
+                continue
+            if row['streaming'] and covered:
+                row['interval_after_read'] = telemetry.max_interval(row['time'], row['time'] + self.settle)
+                baseline = telemetry.window_max_intervals(self.settle)
+                if len(baseline):
+                    row['baseline_interval'] = np.percentile(baseline, 95)
+                if np.isfinite(row['interval_after_read']) and np.isfinite(row['baseline_interval']):
+                    self.read_intervals.append((row['interval_after_read'], row['baseline_interval']))
+            if self.record is not None:
+                self.record(np.array([row[col] for col in BATTERY_COLUMNS], dtype=np.float64))
+        with self.lock:
+            self._pending = waiting + self._pending
+
+    def correlation(self):
+        """
+        (reads compared, share of them followed by an interval above the baseline, mean longest interval
+        after a read, mean baseline). A share well above 5% means battery reads delay the stream.
+        """
+        if not self.read_intervals:
+            return 0, np.nan, np.nan, np.nan
+        after, baseline = np.array(self.read_intervals).T
+        return len(after), float(np.mean(after > baseline)), float(after.mean()), float(baseline.mean())
+
+    def summary(self):
+        n, above, after, baseline = self.correlation()
+        if n == 0:
+            return f"battery reads: {self.reads}, none compared with streaming yet"
+        return (f"battery reads: {self.reads}, {n} while streaming, {above:.0%} followed by a longer interval "
+                f"than the baseline (5% expected): {after * 1e3:.1f} ms after reads vs {baseline * 1e3:.1f} ms")
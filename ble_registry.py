@@ -0,0 +1,176 @@
+"""
+BLE Device Registry
+Background BLE scanning and a time-to-live cache of the MetaWear devices seen recently
+"""
+
+import threading
+import time
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class DeviceSighting(object):
+    """Last advertisement seen from one device."""
+
+    def __init__(self, mac, name, rssi, now):
+        self.mac = mac
+        self.name = name
+        self.rssi = rssi
+        self.first_seen = now
+        self.last_seen = now
+        self.count = 1
+
+    def age(self, now=None):
+        return (time.monotonic() if now is None else now) - self.last_seen
+
+    def __repr__(self):
+        return f"DeviceSighting({self.mac!r}, rssi={self.rssi}, age={self.age():.1f}s)"
+
+
+class DeviceRegistry(object):
+    """
+    Devices discovered by the scanner, keyed by upper-case MAC address.
+
+    A device counts as in range for ``ttl`` seconds after its last
+    advertisement. Threads can wait for a device to show up with ``wait_for``.
+    """
+
+    def __init__(self, ttl=30.0):
+        self.ttl = ttl
+        self._devices = {}
+        self._changed = threading.Condition()
+
+    def update(self, mac, name='', rssi=0, now=None):
+        now = time.monotonic() if now is None else now
+        mac = mac.upper()
+        with self._changed:
+            sighting = self._devices.get(mac)
+            if sighting is None:
+                self._devices[mac] = DeviceSighting(mac, name, rssi, now)
+            else:
+                sighting.name = name or sighting.name
+                sighting.rssi = rssi
+                sighting.last_seen = now
+                sighting.count += 1
+            self._changed.notify_all()
+
+    def get(self, mac, now=None):
+        """The sighting of ``mac`` if it was seen within the ttl, otherwise None."""
+        with self._changed:
+            sighting = self._devices.get(mac.upper())
+        if sighting is None or sighting.age(now) > self.ttl:
+            return None
+        return sighting
+
+    def devices(self, now=None):
+        """All devices seen within the ttl, strongest signal first."""
+        with self._changed:
+            sightings = list(self._devices.values())
+        fresh = [s for s in sightings if s.age(now) <= self.ttl]
+        return sorted(fresh, key=lambda s: -s.rssi)
+
+    def in_range(self, macs, now=None):
+        """{mac: sighting or None} for the given MAC addresses."""
+        return {mac: self.get(mac, now) for mac in macs}
+
+    def wait_for(self, mac, timeout):
+        """Block until ``mac`` is in range or ``timeout`` passes, returns the sighting or None."""
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while True:
+                sighting = self.get(mac)
+                remaining = deadline - time.monotonic()
+                if sighting is not None or remaining <= 0:
+                    return sighting
+                self._changed.wait(remaining)
+
+
+class BleScannerService(object):
+    """
+    Runs BLE scans in the background and records MetaWear advertisements in a DeviceRegistry.
+
+    ``scanner`` is the warble ``BleScanner`` class (set_handler/start/stop),
+    ``service_uuid`` the GATT service that identifies MetaWear boards. Scans
+    are time boxed: ``scan(duration)`` starts one, or extends the running one,
+    and returns immediately. Scanning is kept short because it competes with
+    open BLE connections for the radio.
+    """
+
+    def __init__(self, scanner, registry=None, service_uuid=None):
+        self.scanner = scanner
+        self.registry = DeviceRegistry() if registry is None else registry
+        self.service_uuid = service_uuid
+        self.lock = threading.Lock()
+        self._scan_until = 0.0
+        self._thread = None
+        self.scans = 0
+
+    def _handle(self, result):
+        # called by warble for every advertisement
+        if self.service_uuid is not None and not result.has_service_uuid(self.service_uuid):
+            return
+        self.registry.update(result.mac, result.name, result.rssi)
+
+    @property
+    def scanning(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def scan(self, duration=10.0):
+        """Scan for ``duration`` seconds in the background (extends a running scan)."""
+        with self.lock:
+            self._scan_until = max(self._scan_until, time.monotonic() + duration)
+            if self.scanning:
+                return
+            self._thread = threading.Thread(target=self._run, name='BleScanner', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        self.scans += 1
+        log.info("BLE scan started")
+        self.scanner.set_handler(self._handle)
+        self.scanner.start()
+        try:
+            while True:
+                with self.lock:
+                    remaining = self._scan_until - time.monotonic()
+                    if remaining <= 0:
+                        break
+                time.sleep(min(remaining, 0.2))
+        finally:
+            self.scanner.stop()
+            log.info("BLE scan stopped, %d devices in range", len(self.registry.devices()))
+
+    def stop(self):
+        with self.lock:
+            self._scan_until = 0.0
+        if self._thread is not None:
+            self._thread.join(1.0)
+
+    def find(self, mac, timeout=10.0):
+        """
+        The registry entry of ``mac``, scanning for up to ``timeout`` seconds when
+        it has not been seen within the ttl. Returns None when it is not found.
+        """
+        sighting = self.registry.get(mac)
+        if sighting is not None:
+            return sighting
+        self.scan(timeout)
+        return self.registry.wait_for(mac, timeout)
+
+
+def describe_in_range(registry, configured, now=None):
+    """
+    One line per sensor set, e.g. 'shiba: LeftHandMeta -61 dBm, RightHandMeta -, ... (1/4 in range)'.
+
+    ``configured`` maps a set name to {sensor name: MAC}, as the hardware_shiba
+    and hardware_hebrew lists in config.yaml.
+    """
+    lines = []
+    for set_name, sensors in configured.items():
+        found = registry.in_range(sensors.values(), now)
+        parts = [f"{name} {found[mac].rssi} dBm" if found[mac] is not None else f"{name} -"
+                 for name, mac in sensors.items()]
+        in_range = sum(s is not None for s in found.values())
+        lines.append(f"{set_name}: {', '.join(parts)} ({in_range}/{len(sensors)} in range)")
+    return "\n".join(lines)
@@ -0,0 +1,116 @@
+"""
+Sensor Clock Alignment
+Maps MetaWear device timestamps onto the host clock with an online offset/drift estimate
+"""
+
+import collections
+import logging
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+
+class ClockAligner(object):
+    """
+    Online estimate of ``host_time = device_time + offset + drift * (device_time - reference)``.
+
+    The host receive time of a sample is its device time plus a clock offset
+    plus a transport delay that is never negative (BLE connection interval
+    batching, radio retries, callback scheduling). The smallest
+    ``host_time - device_time`` seen in a window is therefore the sample that
+    was delayed least, and a straight line through these window minima (the
+    lower envelope) gives the offset and the relative drift of the two clocks.
+
+    Aligned timestamps keep the even spacing of the device clock, so the
+    bursts of the BLE transport disappear, and all sensors aligned this way
+    share the host timeline.
+    """
+
+    def __init__(self, window=1.0, history=120, min_windows=5, reset_threshold=1.0):
+        """
+        Args:
+            window (float): length [s] of the windows whose minimum delay is used
+            history (int): number of window minima in the drift fit (120 = two minutes)
+            min_windows (int): minima needed before drift is estimated, until then only the offset is
+            reset_threshold (float): a jump [s] of the device clock against the estimate that restarts
+                the estimator, e.g. after the sensor was reset
+        """
+        self.window = window
+        self.min_windows = min_windows
+        self.reset_threshold = reset_threshold
+        self.minima = collections.deque(maxlen=history)
+        self.resets = 0
+        self._clear()
+
+    def _clear(self):
+        self.minima.clear()
+        self.reference = None
+        self.offset = None
+        self.drift = 0.0
+        self._window_index = None
+        self._window_min = np.inf
+        self._window_device_time = 0.0
+
+    @property
+    def ready(self):
+        """True once the drift is estimated from enough windows."""
+        return len(self.minima) >= self.min_windows
+
+    def update(self, device_times, host_times):
+        """Add samples, arrays of device and host times in seconds, in order of arrival."""
+        device_times = np.asarray(device_times, dtype=np.float64)
+        delays = np.asarray(host_times, dtype=np.float64) - device_times
+        if len(delays) == 0:
+            return
+        if self.offset is not None and abs(delays.min() - self.predict_delay(device_times[0])) > self.reset_threshold:
+            log.warning("device clock jumped by %.3f s, restarting clock alignment",
+                        delays.min() - self.predict_delay(device_times[0]))
+            self.resets += 1
+            self._clear()
+        if self.reference is None:
+            self.reference = device_times[0]
+
+        windows = np.floor(device_times / self.window)
+        # split the block where the window changes, usually the whole block is in one window
+        starts = np.flatnonzero(np.diff(windows)) + 1
+        for part in np.split(np.arange(len(delays)), starts):
+            index = windows[part[0]]
+            if self._window_index is not None and index != self._window_index:
+                self.minima.append((self._window_device_time, self._window_min))
+                self._window_min = np.inf
+                self._fit()
+            self._window_index = index
+            j = part[np.argmin(delays[part])]
+            if delays[j] < self._window_min:
+                self._window_min = delays[j]
+                self._window_device_time = device_times[j]
+        if not self.ready:
+            # offset only: the smallest delay seen so far
+            current = min([self._window_min] + [d for _, d in self.minima])
+            self.offset = current
+
+    def _fit(self):
+        if not self.ready:
+            return
+        t, d = np.array(self.minima).T
+        t = t - self.reference
+        self.drift, self.offset = np.polyfit(t, d, 1)
+
+    def predict_delay(self, device_times):
+        """Estimated ``host - device`` offset at the given device times."""
+        return self.offset + self.drift * (np.asarray(device_times) - self.reference)
+
+    def align(self, device_times):
+        """Map device times [s] to the host timeline."""
+        device_times = np.asarray(device_times, dtype=np.float64)
+        if self.offset is None:
+            return device_times.copy()
+        return device_times + self.predict_delay(device_times)
+
+    def stats(self):
+        return {
+            'offset': self.offset,
+            'drift_ppm': self.drift * 1e6,
+            'windows': len(self.minima),
+            'resets': self.resets,
+        }
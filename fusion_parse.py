@@ -0,0 +1,107 @@
+"""
+Fusion Data Fast Path
+Copies LINEAR_ACC callback payloads straight into preallocated numpy records, bypassing parse_value
+"""
+
+import ctypes
+import time
+import numpy as np
+from sensor_buffers import SampleBatcher, BLOCK_COLUMNS, HOST_TIME, DEVICE_TIME
+
+# one record per sample: host receive time, device epoch [ms] and the CartesianFloat payload
+# packed, so x, y, z are 12 contiguous bytes with the layout of the C struct
+FUSION_RECORD_DTYPE = np.dtype([('time', '<f8'), ('epoch', '<i8'), ('x', '<f4'), ('y', '<f4'), ('z', '<f4')])
+CARTESIAN_OFFSET = FUSION_RECORD_DTYPE.fields['x'][1]
+CARTESIAN_SIZE = 3 * ctypes.sizeof(ctypes.c_float)
+
+
+class CartesianFloat(ctypes.Structure):
+    """Same layout as mbientlab.metawear.cbindings.CartesianFloat."""
+    _fields_ = [("x", ctypes.c_float), ("y", ctypes.c_float), ("z", ctypes.c_float)]
+
+
+class Data(ctypes.Structure):
+    """Same layout as mbientlab.metawear.cbindings.Data, used to feed the fast path without a device."""
+    _fields_ = [
+        ("epoch", ctypes.c_longlong),
+        ("extra", ctypes.c_void_p),
+        ("value", ctypes.c_void_p),
+        ("type_id", ctypes.c_int),
+        ("length", ctypes.c_ubyte),
+    ]
+
+
+class FusionBatcher(SampleBatcher):
+    """
+    SampleBatcher fed directly with libmetawear ``Data`` pointers.
+
+    ``add_data`` checks the payload type, copies the 12 payload bytes with one
+    memmove into a preallocated record array (FUSION_RECORD_DTYPE) and stores
+    the host time and device epoch [ms] next to them. The float64 block handed to
+    ``emit`` is built once per delivery window with vectorized casts, so no
+    Python float objects are created per sample. Completed blocks go out
+    through ``flush`` like those of SampleBatcher.add, so they stay in order
+    when the watchdog or a stream stop flushes from another thread.
+    """
+
+    def __init__(self, emit, cartesian_type_id, window=0.01, max_rows=256, aligner=None):
+        SampleBatcher.__init__(self, emit, window=window, max_rows=max_rows, aligner=aligner)
+        self.cartesian_type_id = cartesian_type_id
+        self.records = np.zeros(max_rows, dtype=FUSION_RECORD_DTYPE)
+        self._time = self.records['time']
+        self._epoch = self.records['epoch']
+        self._payload_address = self.records.ctypes.data + CARTESIAN_OFFSET
+        self.last_epoch = 0
+        self._last_row = 0
+
+    def add_data(self, data, t, now=None):
+        """
+        Add one callback payload. Returns False (and stores nothing) when it is
+        not a CartesianFloat, the caller then falls back to parse_value.
+        """
+        contents = data.contents
+        if contents.type_id != self.cartesian_type_id:
+            return False
+        if now is None:
+            now = time.monotonic()
+        with self.lock:
+            i = self._open_row(now)
+            ctypes.memmove(self._payload_address + i * FUSION_RECORD_DTYPE.itemsize, contents.value, CARTESIAN_SIZE)
+            self._time[i] = t
+            self._epoch[i] = contents.epoch
+            self._last_row = i
+            complete = self._close_row(now)
+        if complete:
+            self.flush()
+        return True
+
+    def add(self, t, acc_x, acc_y, acc_z, now=None, device_time=None):
+        """Add a sample that was parsed elsewhere (parse_value fallback)."""
+        if now is None:
+            now = time.monotonic()
+        epoch = round((t if device_time is None else device_time) * 1000)
+        with self.lock:
+            i = self._open_row(now)
+            self.records[i] = (t, epoch, acc_x, acc_y, acc_z)
+            self._last_row = i
+            complete = self._close_row(now)
+        if complete:
+            self.flush()
+
+    def last_sample(self):
+        """(acc_x, acc_y, acc_z) of the most recent record, for per-sample consumers."""
+        row = self.records[self._last_row]
+        return float(row['x']), float(row['y']), float(row['z'])
+
+    def _take(self):
+        n = self._rows
+        records = self.records[:n]
+        block = np.empty((n, len(BLOCK_COLUMNS)), dtype=np.float64)
+        block[:, HOST_TIME] = records['time']
+        block[:, DEVICE_TIME] = records['epoch'] / 1000
+        block[:, 1] = records['x']
+        block[:, 2] = records['y']
+        block[:, 3] = records['z']
+        self.last_epoch = int(records['epoch'][-1])
+        self._rows = 0
+        return block
@@ -0,0 +1,105 @@
+"""
+Task Event Log
+Compound events dataset of the task .h5 file and a buffered writer for it
+"""
+
+import threading
+import time
+from datetime import datetime
+import numpy as np
+import h5py
+
+# event names, step descriptions that are not listed here are stored as 'Step'
+# (the step_number field tells which step it was)
+EVENT_CODES = {
+    'Task': 0,
+    'Pause': 1,
+    'Fixation': 2,
+    'Baseline': 3,
+    'Connect': 4,
+    'Disconnect': 5,
+    'Reconnect': 6,
+    'Step': 7,
+}
+EVENT_ALIASES = {'Base Line': 'Baseline'}
+
+EVENT_TYPES = {'Start': 0, 'End': 1}
+
+EVENT_DTYPE = np.dtype([
+    ('event', h5py.enum_dtype(EVENT_CODES, basetype='u1')),
+    ('event_type', h5py.enum_dtype(EVENT_TYPES, basetype='u1')),
+    ('time', '<f8'),            # epoch seconds, time.time()
+    ('monotonic_ns', '<i8'),    # time.monotonic_ns(), for exact intervals between events
+    ('step_number', '<i4'),     # -1 for task level events
+])
+
+
+def event_code(event_name):
+    """Enum value stored for an event name or step description."""
+    event_name = EVENT_ALIASES.get(event_name, event_name)
+    return EVENT_CODES.get(event_name, EVENT_CODES['Step'])
+
+
+def create_event_dataset(group, name='events', chunk_rows=64):
+    """Create an empty, resizable compound events dataset in the given h5 group."""
+    dataset = group.create_dataset(name=name, shape=(0,), maxshape=(None,), chunks=(chunk_rows,), dtype=EVENT_DTYPE)
+    dataset.attrs['columns'] = list(EVENT_DTYPE.names)
+    return dataset
+
+
+class EventLog(object):
+    """
+    Buffered writer for the events dataset.
+
+    ``append`` only stores the event in memory and may be called from any
+    thread (the pause button runs in the GUI thread). Pending events are
+    written with one resize + one write by ``flush``, which the task loop
+    calls through ``flush_if_due`` at most every ``flush_period`` seconds.
+    """
+
+    def __init__(self, dataset, flush_period=1.0):
+        self.dataset = dataset
+        self.flush_period = flush_period
+        self.lock = threading.Lock()
+        self.pending = []
+        self.events_written = 0
+        self.last_flush = time.monotonic()
+
+    def append(self, event_name, event_type, step_number=-1):
+        row = (event_code(event_name), EVENT_TYPES[event_type], time.time(), time.monotonic_ns(), step_number)
+        with self.lock:
+            self.pending.append(row)
+
+    def flush(self):
+        with self.lock:
+            rows, self.pending = self.pending, []
+        self.last_flush = time.monotonic()
+        if not rows:
+            return
+        n = self.dataset.shape[0]
+        self.dataset.resize((n + len(rows),))
+        self.dataset[n:] = np.array(rows, dtype=EVENT_DTYPE)
+        self.dataset.flush()
+        self.events_written += len(rows)
+
+    def flush_if_due(self):
+        if self.pending and time.monotonic() - self.last_flush >= self.flush_period:
+            self.flush()
+
+
+def read_events(dataset):
+    """
+    Read an events dataset as a structured numpy array with EVENT_DTYPE fields.
+
+    Files written before the compound layout hold (N, 3) byte strings
+    (name, type, ISO local time); they are converted, with monotonic_ns and
+    step_number set to -1.
+    """
+    if dataset.dtype.names is not None:
+        return dataset[()]
+    rows = dataset[()]
+    events = np.empty(len(rows), dtype=EVENT_DTYPE)
+    for i, row in enumerate(rows):
+        name, event_type, timestamp = [x.decode('utf-8') if isinstance(x, bytes) else str(x) for x in row]
+        events[i] = (event_code(name), EVENT_TYPES[event_type], datetime.fromisoformat(timestamp).timestamp(), -1, -1)
+    return events
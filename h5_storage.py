@@ -0,0 +1,287 @@
+"""
+Sensor HDF5 Storage Profiles
+Dataset layouts, compression filters and timestamp encodings for .sensor.h5 limb data
+"""
+
+import numpy as np
+
+# column order of the float64 rows produced by the sample queues
+SAMPLE_COLUMNS = ('time', 'acc_x', 'acc_y', 'acc_z')
+
+# rows with the raw clocks next to the aligned 'time': host receive time and sensor device time
+TIMED_SAMPLE_COLUMNS = SAMPLE_COLUMNS + ('host_time', 'device_time')
+
+# columns holding epoch seconds, these are subject to the profile time encoding
+TIME_COLUMNS = ('time', 'host_time', 'device_time')
+
+TIME_ENCODINGS = ('float', 'ns', 'delta_ns')
+
+
+class StorageProfile(object):
+    """
+    Describes how limb samples are laid out on disk.
+
+    Profiles that keep float64 time and float64 accelerations store a plain
+    (N, width) 'f8' dataset, exactly like files written before profiles
+    existed. All other profiles store a compound dataset with one named field
+    per column: accelerations as ``acc_dtype`` and timestamps as int64
+    nanoseconds (``'ns'``) or as int64 nanosecond differences to the previous
+    sample (``'delta_ns'``, first row absolute). Use :func:`read_samples` to
+    get float64 rows back independently of the profile.
+    """
+
+    def __init__(self, name, acc_dtype='f8', time_encoding='float', compression=None,
+                 compression_opts=None, shuffle=False, chunk_rows=1000, description=''):
+        if time_encoding not in TIME_ENCODINGS:
+            raise ValueError(f"time_encoding must be one of {TIME_ENCODINGS}, got {time_encoding!r}")
+        self.name = name
+        self.acc_dtype = np.dtype(acc_dtype)
+        self.time_encoding = time_encoding
+        self.compression = compression
+        self.compression_opts = compression_opts
+        self.shuffle = shuffle
+        self.chunk_rows = chunk_rows
+        self.description = description
+
+    def __repr__(self):
+        return f"StorageProfile({self.name!r})"
+
+    @property
+    def is_plain(self):
+        """True when rows are stored as a plain 2-D float64 array."""
+        return self.time_encoding == 'float' and self.acc_dtype == np.float64
+
+    def dtype(self, columns=SAMPLE_COLUMNS):
+        """Compound dtype used for the given columns (None for plain profiles)."""
+        if self.is_plain:
+            return None
+        fields = []
+        for col in columns:
+            if col in TIME_COLUMNS:
+                fields.append((col, '<f8' if self.time_encoding == 'float' else '<i8'))
+            else:
+                fields.append((col, self.acc_dtype.str))
+        return np.dtype(fields)
+
+    def create_dataset(self, group, name, columns=SAMPLE_COLUMNS):
+        """Create an empty, resizable dataset for this profile in the given h5 group."""
+        width = len(columns)
+        kwargs = dict(compression=self.compression, compression_opts=self.compression_opts, shuffle=self.shuffle)
+        if self.is_plain:
+            dataset = group.create_dataset(name=name, shape=(0, width), maxshape=(None, width),
+                                           chunks=(self.chunk_rows, width), dtype='f8', **kwargs)
+        else:
+            dataset = group.create_dataset(name=name, shape=(0,), maxshape=(None,),
+                                           chunks=(self.chunk_rows,), dtype=self.dtype(columns), **kwargs)
+        dataset.attrs['storage_profile'] = self.name
+        dataset.attrs['columns'] = list(columns)
+        dataset.attrs['time_encoding'] = self.time_encoding
+        return dataset
+
+    def encoder(self, columns=SAMPLE_COLUMNS):
+        """Return a stateful callable converting (n, width) float64 blocks to the on-disk layout."""
+        return SampleEncoder(self, columns)
+
+
+class SampleEncoder(object):
+    """Converts float64 sample blocks to a profile's layout, carrying delta state between blocks."""
+
+    def __init__(self, profile, columns=SAMPLE_COLUMNS):
+        self.profile = profile
+        self.columns = tuple(columns)
+        self.dtype = profile.dtype(self.columns)
+        self._last_ns = {col: 0 for col in self.columns if col in TIME_COLUMNS}
+
+    def __call__(self, block):
+        if self.dtype is None:
+            return block
+        out = np.empty(len(block), dtype=self.dtype)
+        for j, col in enumerate(self.columns):
+            values = block[:, j]
+            if col not in TIME_COLUMNS:
+                out[col] = values
+            elif self.profile.time_encoding == 'float':
+                out[col] = values
+            else:
+                ns = np.round(values * 1e9).astype(np.int64)
+                if self.profile.time_encoding == 'delta_ns' and len(ns):
+                    last = ns[-1]
+                    ns[1:] = np.diff(ns)
+                    ns[0] -= self._last_ns[col]
+                    self._last_ns[col] = last
+                out[col] = ns
+        return out
+
+
+def read_samples(dataset, start=0, stop=None):
+    """
+    Read limb samples from any storage profile as an (n, width) float64 array
+    with epoch seconds in the time columns.
+
+    Slicing is O(stop - start) for every profile except ``'delta_ns'``, which
+    has to integrate the deltas from the first row.
+    """
+    if dataset.dtype.names is None:
+        return dataset[start:stop]
+    columns = [c.decode() if isinstance(c, bytes) else str(c) for c in dataset.attrs.get('columns', dataset.dtype.names)]
+    encoding = dataset.attrs.get('time_encoding', 'float')
+    if isinstance(encoding, bytes):
+        encoding = encoding.decode()
+    read_from = 0 if encoding == 'delta_ns' else start
+    raw = dataset[read_from:stop]
+    out = np.empty((len(raw), len(columns)), dtype=np.float64)
+    for j, col in enumerate(columns):
+        values = raw[col]
+        if col in TIME_COLUMNS and encoding == 'ns':
+            out[:, j] = values / 1e9
+        elif col in TIME_COLUMNS and encoding == 'delta_ns':
+            out[:, j] = np.cumsum(values) / 1e9
+        else:
+            out[:, j] = values
+    return out[start - read_from:]
+
+
+STORAGE_PROFILES = {
+    'f8_legacy': StorageProfile(
+        'f8_legacy', chunk_rows=1000,
+        description="uncompressed float64, the layout used before storage profiles"),
+    'f8_shuffle_gzip': StorageProfile(
+        'f8_shuffle_gzip', compression='gzip', compression_opts=4, shuffle=True, chunk_rows=4096,
+        description="float64 with shuffle + gzip, readable by existing analysis code"),
+    'f4_ns_lzf': StorageProfile(
+        'f4_ns_lzf', acc_dtype='f4', time_encoding='ns', compression='lzf', shuffle=True, chunk_rows=4096,
+        description="float32 accelerations, int64 ns timestamps, shuffle + lzf (fast)"),
+    'f4_delta_gzip': StorageProfile(
+        'f4_delta_gzip', acc_dtype='f4', time_encoding='delta_ns', compression='gzip', compression_opts=4,
+        shuffle=True, chunk_rows=8192,
+        description="float32 accelerations, delta-encoded ns timestamps, shuffle + gzip (smallest)"),
+}
+
+DEFAULT_STORAGE_PROFILE = 'f8_shuffle_gzip'
+
+
+# limb datasets of the MetaWear measurement, in the order used by the step index
+LIMB_DATASETS = ('left_hand_data', 'right_hand_data', 'left_leg_data', 'right_leg_data')
+SENSOR_GROUP = 'measurement/MetaWear Sensors Control'
+
+# one row per task step: the row offsets of each limb dataset when the step started and ended
+STEP_INDEX_DTYPE = np.dtype([
+    ('step_number', '<i4'),
+    ('step_description', 'S32'),
+    ('start_time', '<f8'),
+    ('end_time', '<f8'),
+    ('start_row', '<i8', (len(LIMB_DATASETS),)),
+    ('end_row', '<i8', (len(LIMB_DATASETS),)),
+])
+
+
+def create_step_index(group, steps, sensor_file):
+    """
+    Create the step index table of a task file, one row per step, with rows
+    set to -1 until the step starts/ends.
+
+    Args:
+        group: h5 group of the task measurement
+        steps: list of (step_number, step_description, ...) rows of the task structure
+        sensor_file (str): file name of the .sensor.h5 file the row offsets refer to
+    """
+    table = np.zeros(len(steps), dtype=STEP_INDEX_DTYPE)
+    table['step_number'] = [step[0] for step in steps]
+    table['step_description'] = [str(step[1]).encode('utf-8') for step in steps]
+    table['start_time'] = np.nan
+    table['end_time'] = np.nan
+    table['start_row'] = -1
+    table['end_row'] = -1
+    dataset = group.create_dataset(name='step_index', data=table, dtype=STEP_INDEX_DTYPE)
+    dataset.attrs['sensor_file'] = sensor_file
+    dataset.attrs['sensor_group'] = SENSOR_GROUP
+    dataset.attrs['limb_datasets'] = list(LIMB_DATASETS)
+    return dataset
+
+
+def read_step_samples(step_index, sensor_file, step, limb):
+    """
+    Read the samples of one limb during one task step with a single hyperslab.
+
+    Args:
+        step_index: the 'step_index' dataset of a task file (or its contents)
+        sensor_file: open h5py file of the matching .sensor.h5
+        step: step number (int) or step description (str), e.g. "Connect"
+        limb (str): one of LIMB_DATASETS, e.g. 'right_hand_data'
+
+    Returns:
+        (n, width) float64 array, see read_samples
+    """
+    table = step_index[()]
+    if isinstance(step, str):
+        matches = np.flatnonzero(table['step_description'] == step.encode('utf-8'))
+    else:
+        matches = np.flatnonzero(table['step_number'] == step)
+    if len(matches) == 0:
+        raise KeyError(f"step {step!r} not found in step index")
+    row = table[matches[0]]
+    j = LIMB_DATASETS.index(limb)
+    start, stop = int(row['start_row'][j]), int(row['end_row'][j])
+    if start < 0 or stop < 0:
+        raise ValueError(f"step {step!r} did not run to completion, no row range recorded")
+    return read_samples(sensor_file[SENSOR_GROUP][limb], start, stop)
+
+
+# stream gaps of the MetaWear measurement: a sensor stalled after start_time and streamed again from end_time
+# rows are queued as float64 (start_time, end_time, limb index, reconnects) and stored with GAP_DTYPE,
+# time first like the sample rows, so the writer lag report works for this stream too
+GAP_COLUMNS = ('start_time', 'end_time', 'limb', 'reconnects')
+GAP_DTYPE = np.dtype([
+    ('start_time', '<f8'),      # time of the last sample before the gap
+    ('end_time', '<f8'),        # time of the first sample after it
+    ('limb', 'u1'),             # index into the 'limb_datasets' attribute
+    ('reconnects', '<i4'),      # reconnect attempts it took to resume streaming
+])
+
+
+def create_gap_dataset(group, name='gaps', chunk_rows=64):
+    """Create an empty, resizable gaps dataset in the given h5 group."""
+    dataset = group.create_dataset(name=name, shape=(0,), maxshape=(None,), chunks=(chunk_rows,), dtype=GAP_DTYPE)
+    dataset.attrs['columns'] = list(GAP_COLUMNS)
+    dataset.attrs['limb_datasets'] = list(LIMB_DATASETS)
+    return dataset
+
+
+def encode_gaps(block):
+    """Convert (n, 4) float64 gap rows in GAP_COLUMNS order to GAP_DTYPE records."""
+    records = np.empty(len(block), dtype=GAP_DTYPE)
+    for i, name in enumerate(GAP_COLUMNS):
+        records[name] = block[:, i]
+    return records
+
+
+# stream telemetry of the MetaWear measurement, one row per limb about once a second (see sensor_telemetry):
+# rate [Hz], host arrival interval percentiles [s], dropped samples since connecting and data callback time [s]
+TELEMETRY_COLUMNS = ('time', 'limb', 'rate', 'interval_p50', 'interval_p95', 'interval_p99', 'interval_max',
+                     'dropped', 'callback_mean', 'callback_p99', 'callback_max')
+
+
+def create_telemetry_dataset(group, name='telemetry', chunk_rows=256):
+    """Create an empty, resizable (N, len(TELEMETRY_COLUMNS)) float64 telemetry dataset in the given h5 group."""
+    width = len(TELEMETRY_COLUMNS)
+    dataset = group.create_dataset(name=name, shape=(0, width), maxshape=(None, width), chunks=(chunk_rows, width),
+                                   dtype='f8', compression='gzip', shuffle=True)
+    dataset.attrs['columns'] = list(TELEMETRY_COLUMNS)
+    dataset.attrs['limb_datasets'] = list(LIMB_DATASETS)
+    return dataset
+
+
+# battery history of the MetaWear measurement, one row per battery read (see battery_monitor):
+# request time, limb index, charge [%], voltage [V], whether the sensor was streaming, and the longest
+# sample interval right after the read with the same measure for stretches without a read [s]
+BATTERY_COLUMNS = ('time', 'limb', 'charge', 'voltage', 'streaming', 'interval_after_read', 'baseline_interval')
+
+
+def create_battery_dataset(group, name='battery', chunk_rows=64):
+    """Create an empty, resizable (N, len(BATTERY_COLUMNS)) float64 battery history dataset in the given h5 group."""
+    width = len(BATTERY_COLUMNS)
+    dataset = group.create_dataset(name=name, shape=(0, width), maxshape=(None, width), chunks=(chunk_rows, width),
+                                   dtype='f8')
+    dataset.attrs['columns'] = list(BATTERY_COLUMNS)
+    dataset.attrs['limb_datasets'] = list(LIMB_DATASETS)
+    return dataset
@@ -0,0 +1,284 @@
+"""
+HDF5 Session Writer
+Background thread that moves queued sensor samples into resizable h5 datasets
+"""
+
+import os
+import threading
+import time
+import logging
+import h5py
+
+log = logging.getLogger(__name__)
+
+
+def start_swmr(h5file):
+    """
+    Switch an open h5 file to single-writer/multi-reader mode.
+
+    SWMR needs the latest file format, which ScopeFoundry's h5_base_file does
+    not request, so the file is reopened with ``libver='latest'``; files that
+    were created with an older superblock are first rewritten in the new
+    format. All datasets and attributes must exist before this is called.
+    Returns the new file handle - dataset objects of the old handle must be
+    looked up again by name.
+
+    Readers open the file with ``h5py.File(fname, 'r', libver='latest', swmr=True)``
+    and call ``dataset.refresh()`` to see new rows.
+    """
+    fname = h5file.filename
+    h5file.close()
+    h5file = h5py.File(fname, 'r+', libver='latest')
+    try:
+        h5file.swmr_mode = True
+    except RuntimeError:
+        # superblock too old for SWMR, copy everything into a latest-format file
+        h5file.close()
+        _rewrite_latest_format(fname)
+        h5file = h5py.File(fname, 'r+', libver='latest')
+        h5file.swmr_mode = True
+    return h5file
+
+
+def _rewrite_latest_format(fname):
+    tmp_fname = fname + '.tmp'
+    os.replace(fname, tmp_fname)
+    with h5py.File(tmp_fname, 'r') as src, h5py.File(fname, 'w', libver='latest') as dst:
+        for key, value in src.attrs.items():
+            dst.attrs[key] = value
+        for name in src:
+            src.copy(src[name], dst, name=name)
+    os.remove(tmp_fname)
+
+
+def create_latest_format_file(fname):
+    """
+    Create an empty latest-format h5 file, so that ScopeFoundry's h5_base_file
+    (which opens in append mode) produces a file that can go straight to SWMR.
+    Existing files are left untouched.
+    """
+    try:
+        h5py.File(fname, 'w-', libver='latest').close()
+    except (OSError, FileExistsError):
+        pass
+
+
+def create_row_counter(group, datasets, name='rows_written'):
+    """
+    Create the int64 dataset holding the number of valid rows of each dataset.
+
+    Datasets are over-allocated while they grow, so live (SWMR) readers and
+    the recovery tool use these counts instead of the dataset shapes. The
+    dataset names are stored in the 'streams' attribute.
+    """
+    counter = group.create_dataset(name=name, shape=(len(datasets),), dtype='i8')
+    counter.attrs['streams'] = [dataset.name for dataset in datasets]
+    return counter
+
+
+class H5Stream(object):
+    """
+    One resizable dataset fed from one sample source.
+
+    The dataset is grown geometrically, so the number of resize calls over a
+    session is logarithmic in its length, and is trimmed to the exact number
+    of written rows by :meth:`trim`.
+    """
+
+    def __init__(self, dataset, source, growth_factor=1.5, min_growth_rows=4096, encoder=None):
+        """
+        Args:
+            dataset: h5py dataset with an unlimited first axis
+            source: object with a ``drain()`` method returning an (n, ...) array
+                    and ``__len__`` returning the number of pending rows
+            growth_factor (float): Capacity multiplier applied when the dataset is full
+            min_growth_rows (int): Minimum number of rows added per resize
+            encoder: Optional callable converting drained blocks to the dataset layout
+                     (see h5_storage.StorageProfile.encoder)
+        """
+        self.dataset = dataset
+        self.source = source
+        self.encoder = encoder
+        self.growth_factor = growth_factor
+        self.min_growth_rows = min_growth_rows
+        self.rows = dataset.shape[0]
+        # uncompressed size of one stored row
+        self.row_nbytes = dataset.dtype.itemsize
+        for dim in dataset.shape[1:]:
+            self.row_nbytes *= dim
+        self.resize_count = 0
+        self.last_row = None
+
+    @property
+    def name(self):
+        return self.dataset.name
+
+    def append(self, data):
+        """Write a block of rows with a single dataset write."""
+        n = len(data)
+        if n == 0:
+            return 0
+        needed = self.rows + n
+        capacity = self.dataset.shape[0]
+        if needed > capacity:
+            capacity = max(needed, int(capacity * self.growth_factor), self.rows + self.min_growth_rows)
+            self.dataset.resize(capacity, axis=0)
+            self.resize_count += 1
+        self.last_row = data[-1].copy()
+        if self.encoder is not None:
+            data = self.encoder(data)
+        self.dataset[self.rows:needed] = data
+        self.rows = needed
+        return n
+
+    def trim(self):
+        """Shrink the dataset to the number of rows actually written."""
+        if self.dataset.shape[0] != self.rows:
+            self.dataset.resize(self.rows, axis=0)
+
+
+class H5SessionWriter(threading.Thread):
+    """
+    Writer service that periodically drains every registered source into its
+    dataset on a dedicated thread, so acquisition never waits on disk I/O.
+
+    Usage::
+
+        writer = H5SessionWriter(period=0.1)
+        writer.add_stream(dataset, sample_queue)
+        writer.start()
+        ...
+        writer.stop()   # writes what is left and trims every dataset
+    """
+
+    def __init__(self, period=0.1, growth_factor=1.5, min_growth_rows=4096, time_column=0,
+                 h5file=None, flush_period=1.0, name='H5SessionWriter'):
+        """
+        Args:
+            period (float): Seconds between write passes
+            growth_factor (float): Dataset capacity multiplier, see H5Stream
+            min_growth_rows (int): Minimum rows added per resize, see H5Stream
+            time_column (int): Column holding the epoch timestamp, used for lag reporting
+            h5file: Optional h5py file flushed every ``flush_period`` seconds, which makes
+                    the written rows visible to SWMR readers and bounds what a crash can lose
+            flush_period (float): Maximum seconds between flushes
+            name (str): Thread name
+        """
+        threading.Thread.__init__(self, name=name, daemon=True)
+        self.period = period
+        self.h5file = h5file
+        self.flush_period = flush_period
+        self.row_counter = None
+        self._last_flush = time.monotonic()
+        self.growth_factor = growth_factor
+        self.min_growth_rows = min_growth_rows
+        self.time_column = time_column
+        self.streams = []
+        self.error = None
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+
+        # statistics
+        self.rows_written = 0
+        self.bytes_written = 0
+        self.write_passes = 0
+        self.last_pass_duration = 0.0
+        self.max_pass_duration = 0.0
+        self.write_rate = 0.0  # rows per second, averaged over the last pass interval
+        self._rate_t0 = None
+        self._rate_rows0 = 0
+
+    def add_stream(self, dataset, source, encoder=None):
+        """Register a dataset and the source it is filled from. Returns the H5Stream."""
+        stream = H5Stream(dataset, source, self.growth_factor, self.min_growth_rows, encoder)
+        with self._lock:
+            self.streams.append(stream)
+        return stream
+
+    def set_row_counter(self, dataset):
+        """
+        Publish the number of valid rows of every stream, in registration
+        order, into a dataset made by :func:`create_row_counter`.
+        """
+        self.row_counter = dataset
+
+    def flush(self):
+        """Publish the row counts and flush the file to disk."""
+        with self._lock:
+            if self.row_counter is not None:
+                self.row_counter[:] = [stream.rows for stream in self.streams]
+            if self.h5file is not None:
+                self.h5file.flush()
+        self._last_flush = time.monotonic()
+
+    def run(self):
+        self._rate_t0 = time.monotonic()
+        try:
+            while not self._stop_event.wait(self.period):
+                self.write_pending()
+        except Exception as err:
+            self.error = err
+            log.error(f"H5SessionWriter: write failed: {err}")
+
+    def write_pending(self):
+        """Drain every source and write its rows, one dataset write per stream."""
+        t0 = time.monotonic()
+        rows = 0
+        with self._lock:
+            for stream in self.streams:
+                data = stream.source.drain()
+                if len(data):
+                    rows += stream.append(data)
+                    self.bytes_written += len(data) * stream.row_nbytes
+        duration = time.monotonic() - t0
+        self.rows_written += rows
+        self.write_passes += 1
+        self.last_pass_duration = duration
+        self.max_pass_duration = max(self.max_pass_duration, duration)
+
+        if self.h5file is not None and t0 - self._last_flush >= self.flush_period:
+            self.flush()
+
+        elapsed = t0 - self._rate_t0 if self._rate_t0 is not None else 0
+        if elapsed >= 1.0:
+            self.write_rate = (self.rows_written - self._rate_rows0) / elapsed
+            self._rate_t0 = t0
+            self._rate_rows0 = self.rows_written
+        return rows
+
+    def backlog_rows(self):
+        """Number of rows waiting in the sources."""
+        return sum(len(stream.source) for stream in self.streams)
+
+    def lag(self):
+        """Seconds between now and the newest sample already on disk (0 when nothing was written)."""
+        last_times = [stream.last_row[self.time_column] for stream in self.streams if stream.last_row is not None]
+        if not last_times:
+            return 0.0
+        return max(0.0, time.time() - max(last_times))
+
+    def stats(self):
+        """Return the writer statistics as a dict."""
+        return {
+            'rows_written': self.rows_written,
+            'bytes_written': self.bytes_written,
+            'write_rate': self.write_rate,
+            'backlog_rows': self.backlog_rows(),
+            'lag': self.lag(),
+            'last_pass_duration': self.last_pass_duration,
+            'max_pass_duration': self.max_pass_duration,
+            'resize_count': sum(stream.resize_count for stream in self.streams),
+        }
+
+    def stop(self, timeout=None):
+        """Stop the thread, write the remaining rows and trim every dataset."""
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
+        if self.error is None:
+            self.write_pending()
+        with self._lock:
+            for stream in self.streams:
+                stream.trim()
+        if self.error is None:
+            self.flush()
@@ -0,0 +1,373 @@
+"""
+Sensor Sample Buffers
+Preallocated numpy containers used between the MetaWear callbacks, the GUI and the HDF5 writer
+"""
+
+import collections
+import threading
+import time
+import logging
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+
+class RingBuffer(object):
+    """
+    Fixed-capacity ring buffer with O(1) appends and zero-copy ordered views.
+
+    Columns are stored column-major and every sample is written twice, at
+    ``cursor`` and at ``cursor + capacity``. The most recent ``capacity``
+    samples are therefore always one contiguous slice of the backing array,
+    in chronological order, and can be handed to pyqtgraph without copying.
+    """
+
+    def __init__(self, capacity, width=1, dtype=float):
+        """
+        Args:
+            capacity (int): Number of samples kept in history
+            width (int): Number of columns stored per sample
+            dtype: numpy dtype of the backing array
+        """
+        if capacity < 1:
+            raise ValueError(f"RingBuffer capacity must be >= 1, got {capacity}")
+        self.capacity = int(capacity)
+        self.width = int(width)
+        self._data = np.zeros((self.width, 2 * self.capacity), dtype=dtype)
+        self._cursor = 0  # index of the next write, in [0, capacity)
+        self._count = 0   # number of valid samples, saturates at capacity
+        self.total_appended = 0  # monotonically increasing, usable as a change counter
+
+    def __len__(self):
+        return self._count
+
+    def append(self, *values):
+        """Append one sample, given as one value per column."""
+        i = self._cursor
+        self._data[:, i] = values
+        self._data[:, i + self.capacity] = values
+        i += 1
+        self._cursor = 0 if i == self.capacity else i
+        if self._count < self.capacity:
+            self._count += 1
+        self.total_appended += 1
+
+    def extend(self, block):
+        """
+        Append a block of samples.
+
+        Args:
+            block: array of shape (width, n) - one row per column
+        """
+        block = np.asarray(block)
+        n = block.shape[-1]
+        if n == 0:
+            return
+        self.total_appended += n
+        if n > self.capacity:
+            block = block[..., -self.capacity:]
+            n = self.capacity
+        cap = self.capacity
+        start = self._cursor
+        first = min(n, cap - start)
+        self._data[:, start:start + first] = block[..., :first]
+        self._data[:, start + cap:start + cap + first] = block[..., :first]
+        rest = n - first
+        if rest:
+            self._data[:, 0:rest] = block[..., first:]
+            self._data[:, cap:cap + rest] = block[..., first:]
+        self._cursor = (start + n) % cap
+        self._count = min(self._count + n, cap)
+
+    def view(self, n=None):
+        """
+        Return the last ``n`` samples (all valid samples by default) in
+        chronological order as a (width, n) view into the backing array.
+
+        The view is not copied; it stays valid until ``capacity - n`` more
+        samples have been appended.
+        """
+        n = self._count if n is None else min(int(n), self._count)
+        end = self._cursor + self.capacity
+        return self._data[:, end - n:end]
+
+    def column(self, index, n=None):
+        """Contiguous 1-D view of a single column, see :meth:`view`."""
+        return self.view(n)[index]
+
+    def clear(self):
+        self._cursor = 0
+        self._count = 0
+
+
+class QueueOverflowError(RuntimeError):
+    """Raised by SampleQueue when full and the overflow policy is 'raise'."""
+
+
+class SampleQueue(object):
+    """
+    Bounded, chunked FIFO of fixed-width float64 sample rows.
+
+    Rows are written into preallocated chunks; full chunks are handed to the
+    consumer as-is, so draining costs one copy of the data at most. When the
+    queue reaches ``max_rows`` the ``overflow_policy`` decides what happens,
+    and every discarded row is counted - nothing is dropped silently:
+
+    - ``'drop_oldest'``: discard the oldest chunk to make room
+    - ``'drop_newest'``: discard the incoming rows
+    - ``'raise'``: raise :class:`QueueOverflowError`
+
+    The queue is safe for one producer and one consumer thread. The counters
+    always satisfy ``rows_in == rows_out + rows_dropped + len(queue)``.
+    """
+
+    OVERFLOW_POLICIES = ('drop_oldest', 'drop_newest', 'raise')
+
+    def __init__(self, width=4, chunk_rows=1024, max_rows=2**17, overflow_policy='drop_oldest'):
+        """
+        Args:
+            width (int): Number of float64 columns per row
+            chunk_rows (int): Rows per preallocated chunk
+            max_rows (int): Upper bound on queued rows
+            overflow_policy (str): One of OVERFLOW_POLICIES
+        """
+        if overflow_policy not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"overflow_policy must be one of {self.OVERFLOW_POLICIES}, got {overflow_policy!r}")
+        self.width = int(width)
+        self.chunk_rows = int(chunk_rows)
+        self.max_rows = max(int(max_rows), self.chunk_rows)
+        self.overflow_policy = overflow_policy
+        self._lock = threading.Lock()
+        self._full_chunks = collections.deque()
+        self._spare_chunks = []
+        self._head = self._new_chunk()
+        self._head_rows = 0
+        self._queued_rows = 0
+
+        # counters
+        self.rows_in = 0        # rows offered to the queue
+        self.rows_out = 0       # rows handed to the consumer
+        self.rows_dropped = 0   # rows discarded because of overflow
+        self.overflow_events = 0
+        self.peak_rows = 0
+
+    def _new_chunk(self):
+        if self._spare_chunks:
+            return self._spare_chunks.pop()
+        return np.empty((self.chunk_rows, self.width), dtype=np.float64)
+
+    def __len__(self):
+        return self._queued_rows
+
+    def _make_room(self, n):
+        """Apply the overflow policy so that n more rows fit. Returns False to discard them."""
+        if self._queued_rows + n <= self.max_rows:
+            return True
+        self.overflow_events += 1
+        if self.overflow_events == 1:
+            log.warning(f"SampleQueue: overflow ({self._queued_rows} rows queued, max {self.max_rows}), "
+                        f"policy '{self.overflow_policy}'")
+        if self.overflow_policy == 'raise':
+            raise QueueOverflowError(f"SampleQueue full ({self._queued_rows} rows queued, max {self.max_rows})")
+        if self.overflow_policy == 'drop_newest':
+            self.rows_dropped += n
+            return False
+        # drop_oldest: release whole chunks until the new rows fit
+        while self._queued_rows + n > self.max_rows and self._full_chunks:
+            self._spare_chunks.append(self._full_chunks.popleft())
+            self._queued_rows -= self.chunk_rows
+            self.rows_dropped += self.chunk_rows
+        if self._queued_rows + n > self.max_rows:
+            # only the partially filled head is left
+            self.rows_dropped += self._head_rows
+            self._queued_rows -= self._head_rows
+            self._head_rows = 0
+        return True
+
+    def push(self, *row):
+        """Append a single row, given as one value per column."""
+        with self._lock:
+            if not self._make_room(1):
+                self.rows_in += 1
+                return
+            self._head[self._head_rows] = row
+            self._head_rows += 1
+            self._queued_rows += 1
+            self.rows_in += 1
+            if self._head_rows == self.chunk_rows:
+                self._full_chunks.append(self._head)
+                self._head = self._new_chunk()
+                self._head_rows = 0
+            if self._queued_rows > self.peak_rows:
+                self.peak_rows = self._queued_rows
+
+    def push_block(self, block):
+        """
+        Append a block of rows.
+
+        Args:
+            block: array of shape (n, width)
+        """
+        block = np.asarray(block, dtype=np.float64)
+        n = len(block)
+        if n == 0:
+            return
+        with self._lock:
+            if n > self.max_rows:
+                # keep the policy semantics for blocks larger than the whole queue
+                if self.overflow_policy == 'drop_oldest':
+                    self.rows_in += n - self.max_rows
+                    self.rows_dropped += n - self.max_rows
+                    block = block[-self.max_rows:]
+                    n = len(block)
+            if not self._make_room(n):
+                self.rows_in += n
+                return
+            written = 0
+            while written < n:
+                take = min(n - written, self.chunk_rows - self._head_rows)
+                self._head[self._head_rows:self._head_rows + take] = block[written:written + take]
+                self._head_rows += take
+                written += take
+                if self._head_rows == self.chunk_rows:
+                    self._full_chunks.append(self._head)
+                    self._head = self._new_chunk()
+                    self._head_rows = 0
+            self._queued_rows += n
+            self.rows_in += n
+            if self._queued_rows > self.peak_rows:
+                self.peak_rows = self._queued_rows
+
+    def drain_blocks(self):
+        """
+        Remove and return all queued rows as a list of contiguous (n, width)
+        float64 arrays in FIFO order. Full chunks are returned without copying.
+        """
+        with self._lock:
+            blocks = list(self._full_chunks)
+            self._full_chunks.clear()
+            if self._head_rows:
+                blocks.append(self._head[:self._head_rows].copy())
+                self._head_rows = 0
+            self.rows_out += self._queued_rows
+            self._queued_rows = 0
+        return blocks
+
+    def drain(self):
+        """Remove and return all queued rows as one contiguous (n, width) float64 array."""
+        blocks = self.drain_blocks()
+        if not blocks:
+            return np.empty((0, self.width), dtype=np.float64)
+        if len(blocks) == 1:
+            return blocks[0]
+        return np.concatenate(blocks)
+
+    def stats(self):
+        """Return the queue counters as a dict."""
+        return {
+            'queued_rows': self._queued_rows,
+            'peak_rows': self.peak_rows,
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'rows_dropped': self.rows_dropped,
+            'overflow_events': self.overflow_events,
+        }
+
+
+# columns of the blocks emitted by SampleBatcher
+# 'time' is the aligned timeline, 'host_time' the receive time and 'device_time' the sensor clock
+BLOCK_COLUMNS = ('time', 'acc_x', 'acc_y', 'acc_z', 'acceleration', 'host_time', 'device_time')
+HOST_TIME = BLOCK_COLUMNS.index('host_time')
+DEVICE_TIME = BLOCK_COLUMNS.index('device_time')
+
+
+class SampleBatcher(object):
+    """
+    Collects single samples from a sensor callback into numpy blocks.
+
+    Samples (host time, device time, acc_x, acc_y, acc_z) are written into a
+    preallocated block. Once the first row of a block is ``window`` seconds
+    old (or the block is full) the block is completed with the vector
+    magnitude of the acceleration and the aligned time, and handed to
+    ``emit`` as an (n, 7) float64 array, see BLOCK_COLUMNS. ``window=0``
+    emits every sample as a 1-row block.
+
+    The aligned time comes from ``aligner`` (a clock_sync.ClockAligner) when
+    given, otherwise it is the host time.
+
+    ``flush`` may run on another thread than ``add``: a block is cut and
+    emitted under ``emit_lock``, so blocks reach ``emit`` (and the aligner)
+    in sample order, while ``add`` keeps collecting the next block.
+    """
+
+    def __init__(self, emit, window=0.01, max_rows=256, aligner=None):
+        self.emit = emit
+        self.window = window
+        self.max_rows = max_rows
+        self.aligner = aligner
+        self.lock = threading.Lock()
+        self.emit_lock = threading.Lock()
+        self._block = np.empty((max_rows, len(BLOCK_COLUMNS)), dtype=np.float64)
+        self._rows = 0
+        self._block_start = 0.0
+        self.blocks_emitted = 0
+        self.rows_emitted = 0
+
+    def add(self, t, acc_x, acc_y, acc_z, now=None, device_time=None):
+        """
+        Add one sample received at host time ``t``. ``device_time`` is the sensor
+        clock [s] (the host time for sources without one), ``now`` the monotonic
+        clock (time.monotonic() when omitted).
+        """
+        if now is None:
+            now = time.monotonic()
+        with self.lock:
+            row = self._block[self._open_row(now)]
+            row[HOST_TIME] = t
+            row[DEVICE_TIME] = t if device_time is None else device_time
+            row[1] = acc_x
+            row[2] = acc_y
+            row[3] = acc_z
+            complete = self._close_row(now)
+        if complete:
+            self.flush()
+
+    def _open_row(self, now):
+        # under self.lock: index of the row the next sample goes to
+        if self._rows == 0:
+            self._block_start = now
+        return self._rows
+
+    def _close_row(self, now):
+        # under self.lock, after the row was written: whether the block is complete, the caller
+        # then emits it with flush after releasing the lock
+        self._rows += 1
+        return self._rows >= self.max_rows or now - self._block_start >= self.window
+
+    def flush(self):
+        """
+        Emit the samples collected so far, e.g. when streaming stops. Also the
+        path of every completed block, so all blocks are cut and emitted in order.
+        """
+        with self.emit_lock:
+            with self.lock:
+                block = self._take() if self._rows else None
+            if block is not None:
+                self._emit(block)
+
+    def _take(self):
+        block = self._block[:self._rows].copy()
+        self._rows = 0
+        return block
+
+    def _emit(self, block):
+        acc = block[:, 1:4]
+        block[:, 4] = np.sqrt(np.einsum('ij,ij->i', acc, acc))
+        if self.aligner is not None:
+            self.aligner.update(block[:, DEVICE_TIME], block[:, HOST_TIME])
+            block[:, 0] = self.aligner.align(block[:, DEVICE_TIME])
+        else:
+            block[:, 0] = block[:, HOST_TIME]
+        self.blocks_emitted += 1
+        self.rows_emitted += len(block)
+        self.emit(block)
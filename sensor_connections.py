@@ -0,0 +1,100 @@
+"""
+Sensor Connection Orchestrator
+Brings several hardware components up and down concurrently, with per-device timeouts
+"""
+
+import concurrent.futures
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+
+def mark_connected(hw, value):
+    """
+    Set the 'connected' setting of a hardware component whose connect()/disconnect()
+    already ran, without running them again through enable_connection.
+    """
+    lq = hw.settings.connected
+    lq.updated_value[bool].disconnect(hw.enable_connection)
+    try:
+        lq.update_value(value)
+    finally:
+        lq.updated_value[bool].connect(hw.enable_connection)
+    if value:
+        hw.connection_succeeded.emit()
+
+
+class ConnectionOrchestrator(object):
+    """
+    Runs ``connect()`` or ``disconnect()`` of several hardware components on a
+    thread pool, so bringing up N sensors takes about as long as the slowest one.
+
+    Every device gets ``timeout`` seconds. A device that does not finish in time
+    is reported as 'timeout' and left running on its worker thread (a blocked
+    BLE call cannot be cancelled), the others are not held up by it.
+
+    ``progress(name, state, done, total)`` is called from the worker threads
+    whenever a device changes state ('connecting', 'connected', 'failed',
+    'timeout', 'disconnecting', 'disconnected').
+    """
+
+    def __init__(self, hardware, timeout=30.0, progress=None):
+        self.hardware = list(hardware)
+        self.timeout = timeout
+        self.progress = progress
+        self.results = {}
+        self.elapsed = 0.0
+        self.lock = threading.Lock()
+
+    def _report(self, name, state):
+        with self.lock:
+            self.results[name] = state
+            done = sum(s not in ('connecting', 'disconnecting') for s in self.results.values())
+        if self.progress is not None:
+            self.progress(name, state, done, len(self.hardware))
+
+    def _connect_one(self, hw):
+        self._report(hw.name, 'connecting')
+        try:
+            hw.connect()
+        except Exception as err:
+            log.error("%s failed to connect: %s", hw.name, err)
+            self._report(hw.name, f"failed: {err}")
+            return
+        mark_connected(hw, True)
+        self._report(hw.name, 'connected')
+
+    def _disconnect_one(self, hw):
+        self._report(hw.name, 'disconnecting')
+        try:
+            hw.disconnect()
+        except Exception as err:
+            log.error("%s failed to disconnect cleanly: %s", hw.name, err)
+        mark_connected(hw, False)
+        self._report(hw.name, 'disconnected')
+
+    def _run(self, func, hardware, action):
+        self.results = {}
+        t0 = time.monotonic()
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, len(hardware)),
+                                                         thread_name_prefix='SensorConnection')
+        futures = {executor.submit(func, hw): hw for hw in hardware}
+        concurrent.futures.wait(futures, timeout=self.timeout)
+        for future, hw in futures.items():
+            if not future.done():
+                log.error("%s did not %s within %.0f s", hw.name, action, self.timeout)
+                self._report(hw.name, 'timeout')
+        # do not wait for workers stuck in a blocking call
+        executor.shutdown(wait=False)
+        self.elapsed = time.monotonic() - t0
+        return dict(self.results)
+
+    def connect_all(self):
+        """Connect all components that are not connected yet, returns {name: state}."""
+        return self._run(self._connect_one, [hw for hw in self.hardware if not hw.settings['connected']], 'connect')
+
+    def disconnect_all(self):
+        """Disconnect all connected components, returns {name: state}."""
+        return self._run(self._disconnect_one, [hw for hw in self.hardware if hw.settings['connected']], 'disconnect')
@@ -0,0 +1,18 @@
+"""
+Sensor Data Types
+Sample objects emitted by the MetaMotionRL hardware components (real and simulated)
+"""
+
+import numpy as np
+
+
+class AccelerationData:
+    def __init__(self, acc_x, acc_y, acc_z, time):
+        self.acc_x = acc_x
+        self.acc_y = acc_y
+        self.acc_z = acc_z
+        self.time = time  # QTime object for time
+        self.acceleration = np.sqrt(acc_x**2 + acc_y**2 + acc_z**2)
+
+    def __repr__(self):
+        return f"AccelerationData(acc_x={self.acc_x}, acc_y={self.acc_y}, acc_z={self.acc_z}, time={self.time.toString('HH:mm:ss')})"
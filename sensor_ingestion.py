@@ -0,0 +1,122 @@
+"""
+Sensor Ingestion Workers
+Worker threads that run the sensor data consumers off the BLE callback thread and the Qt GUI thread
+"""
+
+import collections
+import threading
+import time
+import logging
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+
+class IngestionWorker(threading.Thread):
+    """
+    Runs submitted calls in submission order on its own daemon thread.
+
+    The hardware components hand their samples and blocks to listeners on the
+    sensor callback thread, where ``submit(func, *args)`` costs a deque append.
+    The consumers (plot buffers and save queues, the mobile and sound models)
+    then run here rather than as Qt slots on the GUI event loop, so a slow
+    repaint or table edit does not delay them.
+
+    The queue is bounded by ``max_items``: beyond it the oldest calls are
+    discarded and counted in ``dropped``. For every call the time from
+    ``submit`` until it returned is kept, see ``stats``. ``stop`` runs the
+    calls still queued before the thread ends.
+
+    Usage::
+
+        control = IngestionWorker('mobile control')
+        control.start()
+        hw.sample_listeners.append(lambda sample: control.submit(update_mobile, sample))
+    """
+
+    def __init__(self, name='IngestionWorker', max_items=4096, latency_ring=4096):
+        threading.Thread.__init__(self, name=name, daemon=True)
+        self.max_items = max_items
+        self._items = collections.deque()
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._latency = np.zeros(latency_ring)
+        self.submitted = 0
+        self.done = 0
+        self.dropped = 0
+        self.errors = 0
+
+    def submit(self, func, *args):
+        """Queue ``func(*args)``, from any thread."""
+        with self._condition:
+            if len(self._items) >= self.max_items:
+                self._items.popleft()
+                self.dropped += 1
+                if self.dropped == 1:
+                    log.warning("%s: more than %d calls queued, dropping the oldest", self.name, self.max_items)
+            self._items.append((time.perf_counter(), func, args))
+            self.submitted += 1
+            self._condition.notify_all()
+
+    def run(self):
+        while True:
+            with self._condition:
+                while not self._items:
+                    if self._stopping:
+                        return
+                    self._condition.wait()
+                items = list(self._items)
+                self._items.clear()
+            for submitted, func, args in items:
+                try:
+                    func(*args)
+                except Exception as err:
+                    self.errors += 1
+                    log.error("%s: %s failed: %s", self.name, getattr(func, '__qualname__', func), err)
+                self._latency[self.done % len(self._latency)] = time.perf_counter() - submitted
+                self.done += 1
+            with self._condition:
+                self._condition.notify_all()
+
+    def backlog(self):
+        """Calls queued or running."""
+        with self._condition:
+            return self.submitted - self.dropped - self.done
+
+    def wait_idle(self, timeout=1.0):
+        """Block until every submitted call has run, returns False on timeout."""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while self.submitted - self.dropped - self.done > 0:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def stats(self):
+        """Counters and the submit-to-done latency [s] of the recent calls, nan before the first one."""
+        n = min(self.done, len(self._latency))
+        latency = self._latency[:n] if self.done <= len(self._latency) else self._latency.copy()
+        return {
+            'submitted': self.submitted,
+            'done': self.done,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'backlog': self.backlog(),
+            'latency_p50': np.percentile(latency, 50) if n else np.nan,
+            'latency_p99': np.percentile(latency, 99) if n else np.nan,
+            'latency_max': latency.max() if n else np.nan,
+        }
+
+    def summary(self):
+        s = self.stats()
+        return (f"{self.name}: latency p50 {s['latency_p50'] * 1e3:.2f} / p99 {s['latency_p99'] * 1e3:.2f} / "
+                f"max {s['latency_max'] * 1e3:.2f} ms, backlog {s['backlog']}, dropped {s['dropped']}")
+
+    def stop(self, timeout=1.0):
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if self.is_alive() and self is not threading.current_thread():
+            self.join(timeout)
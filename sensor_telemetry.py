@@ -0,0 +1,145 @@
+"""
+Sensor Stream Telemetry
+Per-sensor sample rate, arrival intervals, loss estimate and callback cost, computed off the callback thread
+"""
+
+import collections
+import threading
+import time
+import numpy as np
+from sensor_buffers import HOST_TIME, DEVICE_TIME
+from h5_storage import TELEMETRY_COLUMNS
+
+
+class SensorTelemetry(object):
+    """
+    Telemetry of one sensor stream.
+
+    The callback thread only does constant-time bookkeeping: ``add_block``
+    keeps a reference to each delivered sample block and ``record_callback``
+    writes one duration into a preallocated ring. ``update`` does the
+    statistics and is called from another thread, usually once a second from
+    the app timer service.
+
+    Over the last ``window`` seconds it reports the sample rate, percentiles
+    of the host arrival intervals (BLE delivery jitter) and the callback
+    execution time. Dropped samples are counted for the whole session from the
+    device clock: a device interval of k sample periods means k - 1 samples
+    never arrived.
+    """
+
+    def __init__(self, name, data_rate=100.0, window=10.0, callback_ring=4096):
+        self.name = name
+        self.data_rate = data_rate
+        self.window = window
+        self._blocks = collections.deque()
+        self._durations = np.zeros(callback_ring)
+        self._callbacks = 0
+        self._callbacks_seen = 0
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Start a new session, e.g. after reconnecting."""
+        with self._lock:
+            self._blocks.clear()
+            self._host = np.empty(0)
+            self._last_device_time = None
+            self.samples = 0
+            self.dropped = 0
+            self.stats = None
+
+    def add_block(self, block):
+        """Called for every delivered block in sensor_buffers.BLOCK_COLUMNS layout, from the callback thread."""
+        self._blocks.append(block)
+
+    def record_callback(self, seconds):
+        """Execution time of one data callback, from the callback thread."""
+        self._durations[self._callbacks % len(self._durations)] = seconds
+        self._callbacks += 1
+
+    def _callback_times(self):
+        # durations recorded since the last update, at most the ring size
+        count = self._callbacks
+        n = min(count - self._callbacks_seen, len(self._durations))
+        self._callbacks_seen = count
+        if n <= 0:
+            return np.empty(0)
+        idx = np.arange(count - n, count) % len(self._durations)
+        return self._durations[idx]
+
+    def update(self, now=None):
+        """Consume the blocks delivered since the last call and return the stats dict."""
+        now = time.time() if now is None else now
+        with self._lock:
+            blocks = []
+            while self._blocks:
+                blocks.append(self._blocks.popleft())
+            if blocks:
+                host = np.concatenate([block[:, HOST_TIME] for block in blocks])
+                device = np.concatenate([block[:, DEVICE_TIME] for block in blocks])
+                if self._last_device_time is not None:
+                    device = np.concatenate([[self._last_device_time], device])
+                periods = np.rint(np.diff(device) * self.data_rate)
+                self.dropped += int(np.sum(np.maximum(periods - 1, 0)))
+                self._last_device_time = device[-1]
+                self.samples += len(host)
+                self._host = np.concatenate([self._host, host])
+            self._host = self._host[self._host >= now - self.window]
+
+            intervals = np.diff(self._host)
+            callbacks = self._callback_times()
+            span = min(self.window, now - self._host[0]) if len(self._host) else 0.0
+            self.stats = {
+                'time': now,
+                'rate': len(self._host) / span if span > 0 else 0.0,
+                'interval_p50': np.percentile(intervals, 50) if len(intervals) else np.nan,
+                'interval_p95': np.percentile(intervals, 95) if len(intervals) else np.nan,
+                'interval_p99': np.percentile(intervals, 99) if len(intervals) else np.nan,
+                'interval_max': intervals.max() if len(intervals) else np.nan,
+                'dropped': self.dropped,
+                'callback_mean': callbacks.mean() if len(callbacks) else np.nan,
+                'callback_p99': np.percentile(callbacks, 99) if len(callbacks) else np.nan,
+                'callback_max': callbacks.max() if len(callbacks) else np.nan,
+            }
+            return self.stats
+
+    def last_time(self):
+        """Host time of the newest sample in the window, -inf when there is none."""
+        with self._lock:
+            return self._host[-1] if len(self._host) else -np.inf
+
+    def max_interval(self, start, stop):
+        """Longest host arrival interval overlapping ``start`` to ``stop``, nan without samples there."""
+        with self._lock:
+            i0 = max(0, np.searchsorted(self._host, start) - 1)
+            i1 = np.searchsorted(self._host, stop, side='right') + 1
+            times = self._host[i0:i1]
+        return np.diff(times).max() if len(times) > 1 else np.nan
+
+    def window_max_intervals(self, length):
+        """Longest host arrival interval of each ``length`` seconds stretch of the window."""
+        with self._lock:
+            host = self._host
+        if len(host) < 2:
+            return np.empty(0)
+        intervals = np.diff(host)
+        stretch = np.floor((host[1:] - host[0]) / length)
+        starts = np.flatnonzero(np.r_[True, np.diff(stretch) > 0])
+        return np.maximum.reduceat(intervals, starts)
+
+    def row(self, limb):
+        """The last stats as a float64 row in TELEMETRY_COLUMNS order."""
+        values = dict(self.stats, limb=limb)
+        return np.array([values[col] for col in TELEMETRY_COLUMNS], dtype=np.float64)
+
+    def summary(self):
+        """One line for the panel."""
+        s = self.stats
+        if s is None:
+            return f"{self.name}: -"
+        return (f"{self.name}: {s['rate']:.1f} Hz, interval p50 {s['interval_p50'] * 1e3:.1f} / "
+                f"p99 {s['interval_p99'] * 1e3:.1f} / max {s['interval_max'] * 1e3:.1f} ms, "
+                f"dropped {s['dropped']}, callback {s['callback_mean'] * 1e6:.0f} / "
+                f"p99 {s['callback_p99'] * 1e6:.0f} us")
+
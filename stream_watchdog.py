@@ -0,0 +1,153 @@
+"""
+Sensor Stream Watchdog
+Detects stalled sensor streams, reconnects them with backoff and reports the gaps
+"""
+
+import threading
+import time
+import logging
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+
+class StreamGap(object):
+    """A stretch without samples: ``start_time`` is the last sample before it, ``end_time`` the first after it."""
+
+    def __init__(self, start_time, end_time, reconnects):
+        self.start_time = start_time
+        self.end_time = end_time
+        self.reconnects = reconnects
+
+    @property
+    def duration(self):
+        return self.end_time - self.start_time
+
+    def __repr__(self):
+        return f"StreamGap({self.duration:.2f} s, reconnects={self.reconnects})"
+
+
+class StreamWatchdog(object):
+    """
+    Watches the sample flow of one sensor while it streams.
+
+    The data path calls ``feed(times)`` with the sample times of every
+    delivered block. When no block arrives for ``stall_periods`` sample periods of the
+    expected data rate (and at least ``min_stall`` seconds) the stream counts as
+    stalled and ``recover()`` is called, again after 1, 2, 4, ... seconds (at most
+    ``max_backoff``) until samples flow again. The first block after the stall
+    closes the gap, which is passed to ``on_gap(StreamGap)``. That block can
+    still hold samples from before the stall (delivery blocks are only emitted
+    when the next sample arrives), so the gap is the longest interval between
+    the samples seen last and those in the block.
+
+    ``check(now)`` does one step of this and can be driven directly, ``arm()``
+    starts a daemon thread that calls it every ``check_period`` seconds.
+    Recovery runs on that thread, so a blocking reconnect delays nothing else.
+    """
+
+    def __init__(self, recover, data_rate=100.0, on_gap=None, stall_periods=100, min_stall=1.0,
+                 initial_backoff=1.0, max_backoff=30.0, check_period=0.25, name='StreamWatchdog'):
+        self.recover = recover
+        self.on_gap = on_gap
+        self.data_rate = data_rate
+        self.stall_periods = stall_periods
+        self.min_stall = min_stall
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.check_period = check_period
+        self.name = name
+        self.lock = threading.Lock()
+        self.armed = False
+        self.state = 'idle'
+        self.gaps = 0
+        self.reconnects = 0
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._reset(time.monotonic())
+
+    def _reset(self, now):
+        self._last_feed = now
+        self._last_time = None
+        self._attempts = 0
+        self._next_attempt = 0.0
+
+    @property
+    def stall_timeout(self):
+        return max(self.min_stall, self.stall_periods / self.data_rate)
+
+    def feed(self, times, now=None):
+        """A block of samples arrived, ``times`` is the array of their sample times."""
+        now = time.monotonic() if now is None else now
+        gap = None
+        with self.lock:
+            if self.state == 'stalled':
+                log.info("%s: streaming again after %d reconnect attempts", self.name, self._attempts)
+                if self._last_time is not None:
+                    times = np.concatenate([[self._last_time], times])
+                if len(times) > 1:
+                    j = int(np.argmax(np.diff(times)))
+                    gap = StreamGap(times[j], times[j + 1], self._attempts)
+                    self.gaps += 1
+                self.state = 'streaming'
+            self._last_feed = now
+            self._last_time = times[-1]
+            self._attempts = 0
+        if gap is not None and self.on_gap is not None:
+            self.on_gap(gap)
+
+    def check(self, now=None):
+        """Detect a stall and run a due recovery attempt. Returns the state."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            if not self.armed:
+                return self.state
+            if self.state == 'streaming' and now - self._last_feed > self.stall_timeout:
+                log.warning("%s: no samples for %.1f s, reconnecting", self.name, now - self._last_feed)
+                self.state = 'stalled'
+                self._next_attempt = now
+            if self.state != 'stalled' or now < self._next_attempt:
+                return self.state
+            self._attempts += 1
+            attempt = self._attempts
+            # no other attempt while this one runs
+            self._next_attempt = float('inf')
+        self.reconnects += 1
+        t0 = time.monotonic()
+        try:
+            self.recover()
+        except Exception as err:
+            log.error("%s: reconnect attempt %d failed: %s", self.name, attempt, err)
+        # the backoff counts from the end of the attempt, a BLE connect can take many seconds
+        backoff = min(self.max_backoff, self.initial_backoff * 2 ** (attempt - 1))
+        with self.lock:
+            self._next_attempt = now + (time.monotonic() - t0) + backoff
+        return self.state
+
+    def arm(self):
+        """Start watching, called when streaming starts (no effect while armed, e.g. from a recovery)."""
+        with self.lock:
+            if not self.armed:
+                self._reset(time.monotonic())
+                self.armed = True
+                self.state = 'streaming'
+        if self._thread is None or not self._thread.is_alive():
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+
+    def disarm(self):
+        """Stop watching, called when streaming is stopped on purpose."""
+        with self.lock:
+            self.armed = False
+            self.state = 'idle'
+
+    def _run(self):
+        while not self._stop_event.wait(self.check_period):
+            self.check()
+
+    def stop(self):
+        self.disarm()
+        self._stop_event.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(1.0)
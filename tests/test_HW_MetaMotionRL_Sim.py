@@ -0,0 +1,45 @@
+import time
+import h5py
+import numpy as np
+from HW_MetaMotionRL_Sim import SyntheticSource, ReplaySource, SimulatedStream
+from h5_storage import SENSOR_GROUP, LIMB_DATASETS
+
+
+def test_synthetic_source_rate_and_dropouts():
+    """Intervals average 1/data_rate and dropouts remove about the configured share of samples"""
+    source = SyntheticSource(data_rate=200, jitter=0.001, dropout_probability=0.01, dropout_length=10, seed=0)
+    intervals = [source.next_interval() for _ in range(5000)]
+    samples = [source.next_sample() for _ in range(20000)]
+    assert abs(np.mean(intervals) - 0.005) < 1e-4
+    dropped = sum(sample is None for sample in samples) / len(samples)
+    assert 0.03 < dropped < 0.15
+
+
+def test_replay_source_keeps_spacing_and_loops(tmp_path):
+    """Replay returns the recorded accelerations with intervals divided by the speed factor"""
+    fname = tmp_path / "session.sensor.h5"
+    data = np.column_stack([1.7e9 + np.arange(5) * 0.01, np.arange(15).reshape(5, 3)])
+    with h5py.File(fname, "w") as h5file:
+        h5file.create_group(SENSOR_GROUP).create_dataset(LIMB_DATASETS[1], data=data)
+
+    source = ReplaySource(fname, LIMB_DATASETS[1], speed=2.0)
+    rows = []
+    for _ in range(6):
+        rows.append(source.next_sample())
+        assert abs(source.next_interval() - 0.005) < 1e-6
+    assert rows[1] == (3.0, 4.0, 5.0)
+    assert rows[5] == rows[0]
+
+
+def test_simulated_stream_emits_only_while_streaming():
+    """The stream thread emits at the source rate when streaming is set and stops cleanly"""
+    received = []
+    stream = SimulatedStream(SyntheticSource(data_rate=200, seed=1), lambda x, y, z, t, device_time: received.append(t))
+    stream.start()
+    time.sleep(0.1)
+    assert received == []
+    stream.streaming.set()
+    time.sleep(0.5)
+    stream.stop()
+    assert 60 < len(received) < 140
+    assert stream.samples_emitted == len(received)
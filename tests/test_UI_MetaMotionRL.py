@@ -0,0 +1,81 @@
+import os
+import threading
+import time
+import pytest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+from PyQt5 import QtWidgets
+from ScopeFoundry import BaseMicroscopeApp, Measurement
+from app_scheduler import TimerService
+from HW_MetaMotionRL_Sim import MetaMotionRLSimHW
+from UI_MetaMotionRL import MetaWearUI
+
+SENSOR_NAMES = ['LeftHandMeta', 'RightHandMeta', 'LeftLegMeta', 'RightLegMeta']
+
+
+class TaskManagement(Measurement):
+    """Stand-in for the experiment control, MetaWearUI names its session file after the task ID"""
+    name = "Task Management"
+
+    def setup(self):
+        self.settings.New('task_ID', dtype=str, initial='run_test')
+
+
+class SimSensorApp(BaseMicroscopeApp):
+    name = 'sim sensor test'
+
+    def __init__(self, argv):
+        self.timers = TimerService()
+        self.timers.start()
+        BaseMicroscopeApp.__init__(self, argv)
+
+    def setup(self):
+        for i, name in enumerate(SENSOR_NAMES):
+            self.add_hardware(MetaMotionRLSimHW(self, name=name, MAC=f"SIM:00:00:00:00:0{i}"))
+        self.add_measurement(TaskManagement(self))
+        self.add_measurement(MetaWearUI(self))
+
+
+@pytest.fixture
+def sim_app(tmp_path, monkeypatch):
+    # ScopeFoundry writes its log and data folders to the working directory
+    monkeypatch.chdir(tmp_path)
+    app = SimSensorApp([])
+    app.settings['save_dir'] = str(tmp_path)
+    sensors = [app.hardware[name] for name in SENSOR_NAMES]
+    for hw in sensors:
+        hw.settings['connected'] = True
+    yield app
+    for hw in sensors:
+        hw.settings['connected'] = False
+        hw.watchdog.stop()
+    app.measurements['MetaWear Sensors Control'].ingestion.stop()
+    app.timers.stop()
+    # the in-process IPython kernel of the app console, left running it crashes the interpreter exit
+    app.kernel_client.stop_channels()
+    app.kernel_manager.shutdown_kernel()
+
+
+def test_run_streams_saves_and_stops(sim_app):
+    """A run against the simulated sensors records all four limbs and stops the streams when interrupted"""
+    measure = sim_app.measurements['MetaWear Sensors Control']
+    errors = []
+
+    def run():
+        try:
+            measure.run()
+        except Exception as err:
+            errors.append(err)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    time.sleep(1.0)
+    measure.interrupt_measurement_called = True
+    thread.join(10)
+
+    assert not thread.is_alive()
+    assert errors == []
+    assert [sim_app.hardware[name].settings['start_streaming'] for name in SENSOR_NAMES] == [False] * 4
+    buffers = [measure.lefthand_data, measure.righthand_data, measure.leftleg_data, measure.rightleg_data]
+    assert all(buf.queue.rows_in > 0 for buf in buffers)
+    assert not measure.h5file
@@ -0,0 +1,65 @@
+import threading
+import time
+
+import pytest
+from app_scheduler import TimerService
+
+
+@pytest.fixture
+def timers():
+    service = TimerService()
+    service.start()
+    yield service
+    service.stop()
+
+
+def test_one_shot_and_periodic_timers_fire_on_time(timers):
+    """One-shot timers fire once, periodic ones at a fixed rate, and the lateness is recorded per name"""
+    fired = threading.Event()
+    ticks = []
+    once = timers.call_later(0.05, fired.set, name='once')
+    every = timers.call_every(0.02, lambda: ticks.append(time.monotonic()), name='tick')
+    assert fired.wait(1.0)
+    time.sleep(0.2)
+    every.cancel()
+    count = len(ticks)
+    time.sleep(0.1)
+
+    assert not once.active and once.remaining() is None
+    assert len(ticks) == count
+    assert 9 <= count <= 13
+    stats = timers.stats()
+    assert stats['once']['fired'] == 1
+    assert stats['tick']['fired'] == count
+    assert 0 <= stats['tick']['late_max'] < 0.05
+    assert timers.pending() == 0
+
+
+def test_paused_timer_keeps_remaining_time(timers):
+    """A paused timer does not fire, and after resume it fires once the time left at the pause has passed"""
+    fired = threading.Event()
+    handle = timers.call_later(0.2, fired.set)
+    time.sleep(0.1)
+    handle.pause()
+    left = handle.remaining()
+    time.sleep(0.3)
+    assert not fired.is_set()
+    assert handle.remaining() == left
+    assert 0.05 < left < 0.15
+
+    t0 = time.monotonic()
+    handle.resume()
+    assert fired.wait(1.0)
+    assert abs(time.monotonic() - t0 - left) < 0.05
+
+
+def test_failing_callback_does_not_stop_the_service(timers):
+    """An exception in a callback is logged and later timers still run"""
+    fired = threading.Event()
+
+    def fail():
+        raise RuntimeError("boom")
+
+    timers.call_later(0.01, fail)
+    timers.call_later(0.03, fired.set)
+    assert fired.wait(1.0)
@@ -0,0 +1,63 @@
+import numpy as np
+
+from battery_monitor import BatteryMonitor
+from sensor_buffers import BLOCK_COLUMNS, HOST_TIME, DEVICE_TIME
+from sensor_telemetry import SensorTelemetry
+from h5_storage import BATTERY_COLUMNS
+
+
+class FakeSensor(object):
+    """Answers battery reads at once, like the simulated hardware."""
+
+    def __init__(self, name, streaming):
+        self.settings = {'connected': True, 'start_streaming': streaming}
+        self.telemetry = SensorTelemetry(name, window=30.0)
+        self.battery_listener = None
+        self.reads = 0
+
+    def read_battery_charge_thread(self):
+        self.reads += 1
+        self.battery_listener(80 - self.reads, 4.1)
+
+
+def test_reads_are_staggered_and_rare_while_streaming():
+    """One read per tick at most, idle sensors every idle_interval, streaming ones every streaming_interval"""
+    sensors = [FakeSensor('idle', False), FakeSensor('streaming', True), FakeSensor('off', False)]
+    sensors[2].settings['connected'] = False
+    rows = []
+    monitor = BatteryMonitor(None, sensors, record=rows.append, streaming_interval=60, idle_interval=5)
+    monitor._due = [0.0, 0.0, 0.0]
+
+    polled = [monitor.poll(now=float(t), wall_time=1000.0 + t) for t in range(120)]
+    assert polled.count(0) == 24
+    assert polled.count(1) == 2
+    assert sensors[2].reads == 0
+    # both were due at t=0, the second read waited for the next tick
+    assert polled[:2] == [0, 1]
+
+    finished = np.array(rows)
+    idle = finished[finished[:, BATTERY_COLUMNS.index('limb')] == 0]
+    assert list(idle[:3, BATTERY_COLUMNS.index('charge')]) == [79, 78, 77]
+    assert np.all(np.isnan(idle[:, BATTERY_COLUMNS.index('interval_after_read')]))
+
+
+def test_read_followed_by_a_stall_is_counted():
+    """A read followed by a 100 ms delivery gap stands out against the 10 ms baseline of the stream"""
+    sensor = FakeSensor('streaming', True)
+    monitor = BatteryMonitor(None, [sensor], streaming_interval=60)
+    monitor._due = [5.0]
+
+    host = 1000.0 + np.arange(3000) * 0.01
+    host = host[(host < 1005.3) | (host > 1005.38)]
+    block = np.zeros((len(host), len(BLOCK_COLUMNS)))
+    block[:, HOST_TIME] = block[:, DEVICE_TIME] = host
+    sensor.telemetry.add_block(block)
+    sensor.telemetry.update(now=host[-1])
+
+    assert monitor.poll(now=5.0, wall_time=1005.0) == 0
+    monitor.poll(now=8.0, wall_time=1008.0)
+    n, above, after, baseline = monitor.correlation()
+    assert (n, above) == (1, 1.0)
+    assert abs(after - 0.1) < 1e-6
+    assert abs(baseline - 0.01) < 1e-6
+    assert 'while streaming' in monitor.summary()
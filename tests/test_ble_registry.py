@@ -0,0 +1,73 @@
+import threading
+import time
+
+from ble_registry import DeviceRegistry, BleScannerService, describe_in_range
+
+
+class FakeResult(object):
+    def __init__(self, mac, rssi, metawear=True):
+        self.mac = mac
+        self.name = 'MetaWear'
+        self.rssi = rssi
+        self.metawear = metawear
+
+    def has_service_uuid(self, uuid):
+        return self.metawear
+
+
+class FakeScanner(object):
+    """Stands in for warble's BleScanner, advertises the given results once scanning starts."""
+
+    def __init__(self, results):
+        self.results = results
+        self.handler = None
+        self.started = 0
+        self.stopped = threading.Event()
+
+    def set_handler(self, handler):
+        self.handler = handler
+
+    def start(self):
+        self.started += 1
+        for result in self.results:
+            self.handler(result)
+
+    def stop(self):
+        self.stopped.set()
+
+
+def test_registry_expires_devices_after_ttl():
+    """Devices are in range for ttl seconds after their last advertisement, MACs match case-insensitively."""
+    registry = DeviceRegistry(ttl=30)
+    registry.update('aa:bb:cc:dd:ee:01', 'MetaWear', -60, now=100.0)
+    registry.update('AA:BB:CC:DD:EE:02', 'MetaWear', -70, now=100.0)
+    registry.update('AA:BB:CC:DD:EE:02', 'MetaWear', -55, now=120.0)
+
+    assert registry.get('AA:BB:CC:DD:EE:01', now=125.0).rssi == -60
+    assert registry.get('AA:BB:CC:DD:EE:01', now=131.0) is None
+    assert [s.mac for s in registry.devices(now=125.0)] == ['AA:BB:CC:DD:EE:02', 'AA:BB:CC:DD:EE:01']
+    assert registry.get('aa:bb:cc:dd:ee:02', now=140.0).count == 2
+
+    text = describe_in_range(registry, {'shiba': {'LeftHandMeta': 'AA:BB:CC:DD:EE:02', 'RightHandMeta': 'FF:FF:FF:FF:FF:FF'}},
+                             now=140.0)
+    assert text == "shiba: LeftHandMeta -55 dBm, RightHandMeta - (1/2 in range)"
+
+
+def test_find_skips_scanning_for_cached_devices():
+    """find scans in the background only for devices missing from the registry, and ignores non MetaWear boards."""
+    scanner = FakeScanner([FakeResult('AA:BB:CC:DD:EE:01', -60), FakeResult('11:22:33:44:55:66', -40, metawear=False)])
+    service = BleScannerService(scanner, service_uuid='metawear')
+
+    t0 = time.monotonic()
+    assert service.find('AA:BB:CC:DD:EE:01', timeout=5.0).rssi == -60
+    assert time.monotonic() - t0 < 1.0
+    assert service.registry.get('11:22:33:44:55:66') is None
+    service.stop()
+    assert scanner.stopped.is_set()
+
+    # already in the registry, no new scan
+    assert service.find('AA:BB:CC:DD:EE:01', timeout=5.0) is not None
+    assert scanner.started == 1
+    # not advertising, gives up after the timeout
+    assert service.find('00:00:00:00:00:00', timeout=0.3) is None
+    service.stop()
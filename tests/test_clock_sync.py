@@ -0,0 +1,48 @@
+import numpy as np
+from clock_sync import ClockAligner
+from sensor_buffers import SampleBatcher, BLOCK_COLUMNS
+
+
+def simulated_clocks(seconds=60, rate=100, offset=3.2, drift=40e-6, seed=0):
+    """Evenly spaced device times and bursty host receive times with a drifting offset"""
+    rng = np.random.default_rng(seed)
+    device = 1.7e9 + np.arange(int(seconds * rate)) / rate
+    true_host = device + offset + drift * (device - device[0])
+    # connection interval batching: samples wait up to 30 ms, some packets much longer
+    delay = rng.uniform(0.001, 0.030, len(device)) + rng.exponential(0.005, len(device))
+    return device, true_host, true_host + delay
+
+
+def test_aligner_recovers_offset_and_drift():
+    """Aligned times follow the true host time within a few ms despite the transport delays"""
+    device, true_host, host = simulated_clocks()
+    aligner = ClockAligner()
+    for start in range(0, len(device), 7):
+        aligner.update(device[start:start + 7], host[start:start + 7])
+
+    assert aligner.ready
+    assert abs(aligner.drift - 40e-6) < 20e-6
+    aligned = aligner.align(device[-1000:])
+    assert np.max(np.abs(aligned - true_host[-1000:])) < 0.003
+    # aligned times keep the even device spacing
+    assert np.std(np.diff(aligned)) < 1e-6 < np.std(np.diff(host))
+
+
+def test_aligner_restarts_after_device_clock_jump():
+    """A sensor reset moves the device clock, the estimator starts over"""
+    device, _, host = simulated_clocks(seconds=10)
+    aligner = ClockAligner()
+    aligner.update(device, host)
+    aligner.update(device[:10] - 3600, host[:10] + 10)
+    assert aligner.resets == 1
+    assert abs(aligner.offset - 3610 - 3.2) < 0.05
+
+
+def test_batcher_fills_aligned_and_raw_time_columns():
+    """Blocks carry the aligned time plus the raw host and device times"""
+    blocks = []
+    batcher = SampleBatcher(blocks.append, window=0, aligner=ClockAligner())
+    batcher.add(105.020, 0.0, 0.0, 1.0, device_time=100.0)
+    row = dict(zip(BLOCK_COLUMNS, blocks[0][0]))
+    assert row['host_time'] == 105.020 and row['device_time'] == 100.0
+    assert row['time'] == 105.020  # first sample: offset only, no drift yet
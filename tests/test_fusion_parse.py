@@ -0,0 +1,77 @@
+import ctypes
+import threading
+import time
+import numpy as np
+from fusion_parse import Data, CartesianFloat, FusionBatcher
+from sensor_buffers import HOST_TIME
+
+CARTESIAN_FLOAT = 2
+
+
+def make_data(x, y, z, epoch, type_id=CARTESIAN_FLOAT):
+    value = CartesianFloat(x, y, z)
+    data = Data(epoch=epoch, value=ctypes.addressof(value), type_id=type_id, length=ctypes.sizeof(value))
+    return value, data, ctypes.pointer(data)
+
+
+def test_fusion_batcher_copies_payload_and_epoch():
+    """CartesianFloat payloads end up in the emitted block with their magnitudes"""
+    blocks = []
+    batcher = FusionBatcher(blocks.append, CARTESIAN_FLOAT, window=1.0)
+    keep = []
+    for i in range(5):
+        keep.append(make_data(3.0, 4.0, float(i), 1000 + i))
+        assert batcher.add_data(keep[-1][2], 10.0 + i, now=0)
+    assert batcher.last_sample() == (3.0, 4.0, 4.0)
+    assert batcher.records['epoch'][4] == 1004
+    batcher.flush()
+
+    block, = blocks
+    np.testing.assert_array_equal(block[:, 0], 10.0 + np.arange(5))
+    np.testing.assert_array_equal(block[:, 3], np.arange(5))
+    np.testing.assert_allclose(block[:, 4], np.sqrt(25.0 + np.arange(5) ** 2))
+    assert batcher.last_epoch == 1004
+
+
+def test_fusion_batcher_rejects_other_payloads_and_accepts_parsed_samples():
+    """Non-cartesian payloads are left to parse_value, parsed samples share the same blocks"""
+    blocks = []
+    batcher = FusionBatcher(blocks.append, CARTESIAN_FLOAT, window=0)
+    keep = make_data(1.0, 2.0, 3.0, 5, type_id=CARTESIAN_FLOAT + 1)
+    assert not batcher.add_data(keep[2], 1.0)
+    assert blocks == []
+
+    batcher.add(2.0, 0.0, 0.0, 2.0)
+    assert blocks[0].tolist() == [[2.0, 0.0, 0.0, 2.0, 2.0, 2.0, 2.0]]
+
+
+def test_fusion_batcher_flush_from_another_thread_keeps_block_order():
+    """Blocks cut by add_data and by a flush on another thread reach the listener in sample order"""
+    blocks = []
+
+    def slow_emit(block):
+        # the partial blocks of the flush thread take long to deliver, full blocks cut meanwhile must wait
+        if len(block) < 8:
+            time.sleep(0.001)
+        blocks.append(block)
+
+    batcher = FusionBatcher(slow_emit, CARTESIAN_FLOAT, window=10, max_rows=8)
+    stop = threading.Event()
+
+    def flusher():
+        while not stop.is_set():
+            batcher.flush()
+
+    thread = threading.Thread(target=flusher)
+    thread.start()
+    for i in range(2000):
+        keep = make_data(0.0, 0.0, 1.0, i)
+        assert batcher.add_data(keep[2], float(i), now=0)
+        # samples come one per callback, the flush thread runs in between
+        time.sleep(0)
+    stop.set()
+    thread.join()
+    batcher.flush()
+    merged = np.concatenate(blocks)
+    np.testing.assert_array_equal(merged[:, HOST_TIME], np.arange(2000))
+    assert all(len(block) <= 8 for block in blocks)
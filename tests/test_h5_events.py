@@ -0,0 +1,35 @@
+import h5py
+import numpy as np
+from h5_events import EventLog, create_event_dataset, read_events, EVENT_CODES, EVENT_TYPES
+
+
+def test_event_log_buffers_until_flush(tmp_path):
+    """Events are kept in memory until flush and load back as a numpy table"""
+    with h5py.File(tmp_path / "task.h5", "w") as h5file:
+        dataset = create_event_dataset(h5file)
+        log = EventLog(dataset, flush_period=60)
+        log.append("Task", "Start")
+        log.append("Base Line", "Start", 2)
+        log.append("Connect", "End", 3)
+        log.append("Stretch", "Start", 4)
+        log.flush_if_due()
+        assert dataset.shape == (0,)
+
+        log.flush()
+        events = read_events(dataset)
+        assert log.events_written == 4
+        assert list(events['event']) == [EVENT_CODES[name] for name in ('Task', 'Baseline', 'Connect', 'Step')]
+        assert list(events['event_type']) == [EVENT_TYPES['Start'], EVENT_TYPES['Start'], EVENT_TYPES['End'], EVENT_TYPES['Start']]
+        assert list(events['step_number']) == [-1, 2, 3, 4]
+        assert np.all(np.diff(events['monotonic_ns']) >= 0)
+
+
+def test_read_events_converts_legacy_string_rows(tmp_path):
+    """Old (N, 3) string event tables are returned in the compound layout"""
+    with h5py.File(tmp_path / "task.h5", "w") as h5file:
+        dataset = h5file.create_dataset('events', data=np.array(
+            [[b"Task", b"Start", b"2025-09-30T10:00:00.000000"],
+             [b"Connect", b"End", b"2025-09-30T10:03:00.500000"]]))
+        events = read_events(dataset)
+        assert list(events['event']) == [EVENT_CODES['Task'], EVENT_CODES['Connect']]
+        np.testing.assert_allclose(events['time'][1] - events['time'][0], 180.5)
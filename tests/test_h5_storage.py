@@ -0,0 +1,108 @@
+import h5py
+import numpy as np
+import pytest
+from h5_storage import (STORAGE_PROFILES, StorageProfile, read_samples, create_step_index, read_step_samples,
+                        LIMB_DATASETS, SENSOR_GROUP, TIMED_SAMPLE_COLUMNS, create_gap_dataset, encode_gaps)
+
+
+def sample_block(n, t0=1.7e9):
+    rng = np.random.default_rng(1)
+    times = t0 + np.cumsum(rng.uniform(0.005, 0.015, n))
+    return np.column_stack([times, rng.normal(0, 0.5, (n, 3))])
+
+
+@pytest.mark.parametrize("profile_name", list(STORAGE_PROFILES))
+def test_profiles_round_trip(tmp_path, profile_name):
+    """Every profile returns the written samples through read_samples"""
+    profile = STORAGE_PROFILES[profile_name]
+    block = sample_block(300)
+    with h5py.File(tmp_path / "limb.h5", "w") as h5file:
+        dataset = profile.create_dataset(h5file, "left_hand_data")
+        encoder = profile.encoder()
+        # write in several blocks to exercise the delta state between blocks
+        for start in range(0, 300, 70):
+            part = block[start:start + 70]
+            dataset.resize(start + len(part), axis=0)
+            dataset[start:start + len(part)] = encoder(part)
+
+        data = read_samples(dataset)
+        acc_tol = 1e-6 if profile.acc_dtype == np.float32 else 0
+        np.testing.assert_allclose(data[:, 0], block[:, 0], rtol=0, atol=1e-6)
+        np.testing.assert_allclose(data[:, 1:], block[:, 1:], rtol=acc_tol, atol=acc_tol)
+
+        # partial reads match the full read
+        np.testing.assert_allclose(read_samples(dataset, 100, 150), data[100:150])
+
+
+def test_timed_columns_round_trip_with_delta_encoding(tmp_path):
+    """Aligned, host and device time columns are delta encoded independently"""
+    profile = STORAGE_PROFILES['f4_delta_gzip']
+    block = sample_block(200)
+    block = np.column_stack([block, block[:, 0] + 0.012, block[:, 0] - 3.5])
+    with h5py.File(tmp_path / "limb.h5", "w") as h5file:
+        dataset = profile.create_dataset(h5file, "left_hand_data", TIMED_SAMPLE_COLUMNS)
+        encoder = profile.encoder(TIMED_SAMPLE_COLUMNS)
+        for start in range(0, 200, 64):
+            part = block[start:start + 64]
+            dataset.resize(start + len(part), axis=0)
+            dataset[start:start + len(part)] = encoder(part)
+        data = read_samples(dataset)
+        for col in ('time', 'host_time', 'device_time'):
+            j = TIMED_SAMPLE_COLUMNS.index(col)
+            np.testing.assert_allclose(data[:, j], block[:, j], rtol=0, atol=1e-6)
+
+
+def test_plain_profile_keeps_legacy_layout(tmp_path):
+    """f8 profiles store a (N, 4) float64 array readable with dataset[:]"""
+    with h5py.File(tmp_path / "limb.h5", "w") as h5file:
+        dataset = STORAGE_PROFILES['f8_shuffle_gzip'].create_dataset(h5file, "left_hand_data")
+        assert dataset.shape == (0, 4)
+        assert dataset.dtype == np.float64
+        assert dataset.compression == 'gzip'
+
+
+def test_unknown_time_encoding_rejected():
+    with pytest.raises(ValueError):
+        StorageProfile('bad', time_encoding='ms')
+
+
+def test_step_index_slices_step_segments(tmp_path):
+    """Row offsets stored per step select exactly the samples of that step"""
+    profile = STORAGE_PROFILES['f4_ns_lzf']
+    block = sample_block(100)
+    with h5py.File(tmp_path / "task.sensor.h5", "w") as sensor_file:
+        group = sensor_file.create_group(SENSOR_GROUP)
+        for limb in LIMB_DATASETS:
+            dataset = profile.create_dataset(group, limb)
+            dataset.resize(100, axis=0)
+            dataset[:] = profile.encoder()(block)
+
+        with h5py.File(tmp_path / "task.h5", "w") as task_file:
+            steps = [[1, "Fixation", 30, "None", False], [2, "Baseline", 60, "None", True]]
+            step_index = create_step_index(task_file, steps, sensor_file="task.sensor.h5")
+            row = step_index[1]
+            row['start_row'] = [40] * 4
+            row['end_row'] = [40, 40, 40, 75]
+            step_index[1] = row
+
+            data = read_step_samples(step_index, sensor_file, "Baseline", 'right_leg_data')
+            np.testing.assert_allclose(data[:, 0], block[40:75, 0], rtol=0, atol=1e-6)
+            assert read_step_samples(step_index, sensor_file, 2, 'left_hand_data').shape == (0, 4)
+            with pytest.raises(ValueError):
+                read_step_samples(step_index, sensor_file, "Fixation", 'left_hand_data')
+            with pytest.raises(KeyError):
+                read_step_samples(step_index, sensor_file, "Reconnect", 'left_hand_data')
+
+
+def test_gap_rows_are_stored_as_records(tmp_path):
+    """Queued float64 gap rows are encoded into the compound gaps dataset"""
+    block = np.array([[1.7e9, 1.7e9 + 4.5, 2, 3], [1.7e9 + 60, 1.7e9 + 61, 0, 1]])
+    with h5py.File(tmp_path / "gaps.h5", "w") as h5file:
+        dataset = create_gap_dataset(h5file)
+        dataset.resize(2, axis=0)
+        dataset[:] = encode_gaps(block)
+        gaps = dataset[()]
+        assert list(dataset.attrs['limb_datasets']) == list(LIMB_DATASETS)
+    assert gaps['end_time'][0] - gaps['start_time'][0] == 4.5
+    assert [LIMB_DATASETS[i] for i in gaps['limb']] == ['left_leg_data', 'left_hand_data']
+    assert list(gaps['reconnects']) == [3, 1]
@@ -0,0 +1,86 @@
+import time
+import h5py
+import numpy as np
+from sensor_buffers import SampleQueue
+from h5_writer import H5SessionWriter, start_swmr, create_row_counter
+
+
+def make_dataset(h5file, name='left_hand_data'):
+    return h5file.create_dataset(name, shape=(0, 4), maxshape=(None, 4), chunks=(1000, 4), dtype='f8')
+
+
+def test_writer_grows_geometrically_and_trims_on_stop(tmp_path):
+    """Many small batches cause few resizes and the dataset ends at its exact length"""
+    with h5py.File(tmp_path / "session.h5", "w") as h5file:
+        dataset = make_dataset(h5file)
+        queue = SampleQueue(width=4, chunk_rows=64)
+        writer = H5SessionWriter(period=60, min_growth_rows=100)
+        writer.add_stream(dataset, queue)
+
+        expected = []
+        for batch in range(200):
+            block = np.full((7, 4), batch, dtype=float)
+            queue.push_block(block)
+            expected.append(block)
+            writer.write_pending()
+
+        assert writer.stats()['resize_count'] < 15
+        writer.stop()
+
+        assert dataset.shape == (1400, 4)
+        np.testing.assert_array_equal(dataset[:], np.concatenate(expected))
+        assert writer.rows_written == 1400
+
+
+def test_writer_thread_drains_sources_in_background(tmp_path):
+    """Rows pushed while the thread runs end up on disk after stop"""
+    with h5py.File(tmp_path / "session.h5", "w") as h5file:
+        queues = [SampleQueue(width=4) for _ in range(4)]
+        writer = H5SessionWriter(period=0.01)
+        for i, queue in enumerate(queues):
+            writer.add_stream(make_dataset(h5file, f"limb_{i}"), queue)
+        writer.start()
+
+        now = time.time()
+        for n in range(50):
+            for queue in queues:
+                queue.push(now + n, 0.1, 0.2, 0.3)
+        time.sleep(0.05)
+        writer.stop()
+
+        assert writer.error is None
+        for i in range(4):
+            assert h5file[f"limb_{i}"].shape == (50, 4)
+        assert writer.backlog_rows() == 0
+
+
+def test_start_swmr_upgrades_file_and_readers_see_flushed_rows(tmp_path):
+    """An old-format file is rewritten for SWMR and a reader follows the row counter"""
+    fname = str(tmp_path / "session.sensor.h5")
+    h5file = h5py.File(fname, "w")
+    h5file.attrs['app'] = 'Agency Sensor'
+    group = h5file.create_group("measurement/MetaWear Sensors Control")
+    dataset = make_dataset(group)
+    counter = create_row_counter(group, [dataset])
+    names = dataset.name, counter.name
+
+    h5file = start_swmr(h5file)
+    assert h5file.swmr_mode
+    assert h5file.attrs['app'] == 'Agency Sensor'
+
+    queue = SampleQueue(width=4)
+    writer = H5SessionWriter(period=60, h5file=h5file, flush_period=0)
+    writer.add_stream(h5file[names[0]], queue)
+    writer.set_row_counter(h5file[names[1]])
+    queue.push_block(np.ones((10, 4)))
+    writer.write_pending()
+
+    reader = h5py.File(fname, "r", libver='latest', swmr=True)
+    rows = reader[names[1]]
+    rows.refresh()
+    assert rows[0] == 10
+    assert reader[names[0]].shape[0] >= 10
+
+    reader.close()
+    writer.stop()
+    h5file.close()
@@ -0,0 +1,177 @@
+import threading
+import time
+import numpy as np
+import pytest
+from sensor_buffers import RingBuffer, SampleQueue, SampleBatcher, QueueOverflowError, BLOCK_COLUMNS
+
+
+def test_ring_buffer_append_keeps_chronological_order():
+    """Appends past capacity keep only the newest samples, oldest first"""
+    buf = RingBuffer(4, width=2)
+    for i in range(7):
+        buf.append(float(i), float(10 * i))
+
+    assert len(buf) == 4
+    np.testing.assert_array_equal(buf.column(0), [3, 4, 5, 6])
+    np.testing.assert_array_equal(buf.column(1), [30, 40, 50, 60])
+
+
+def test_ring_buffer_view_is_zero_copy():
+    """Views share memory with the backing array"""
+    buf = RingBuffer(8, width=1)
+    for i in range(10):
+        buf.append(i)
+
+    view = buf.column(0)
+    assert np.shares_memory(view, buf._data)
+    assert view.flags['C_CONTIGUOUS']
+
+
+def test_ring_buffer_partial_fill():
+    """Only valid samples are returned before the buffer fills up"""
+    buf = RingBuffer(5)
+    buf.append(1.0)
+    buf.append(2.0)
+
+    np.testing.assert_array_equal(buf.column(0), [1.0, 2.0])
+    np.testing.assert_array_equal(buf.column(0, n=1), [2.0])
+
+
+@pytest.mark.parametrize("block_size", [1, 3, 5, 12])
+def test_ring_buffer_extend_matches_append(block_size):
+    """Block appends produce the same history as per-sample appends"""
+    a = RingBuffer(5, width=2)
+    b = RingBuffer(5, width=2)
+    samples = np.arange(24, dtype=float).reshape(2, 12)
+
+    for i in range(samples.shape[1]):
+        a.append(*samples[:, i])
+    for start in range(0, samples.shape[1], block_size):
+        b.extend(samples[:, start:start + block_size])
+
+    np.testing.assert_array_equal(a.view(), b.view())
+    assert a.total_appended == b.total_appended == 12
+
+
+def test_ring_buffer_rejects_zero_capacity():
+    with pytest.raises(ValueError):
+        RingBuffer(0)
+
+
+def test_sample_queue_drain_returns_contiguous_float64_block():
+    """Rows come out in FIFO order as one float64 array"""
+    q = SampleQueue(width=4, chunk_rows=3)
+    for i in range(7):
+        q.push(i, i + 0.1, i + 0.2, i + 0.3)
+
+    data = q.drain()
+    assert data.dtype == np.float64
+    assert data.shape == (7, 4)
+    np.testing.assert_array_equal(data[:, 0], np.arange(7))
+    assert len(q) == 0
+    assert q.drain().shape == (0, 4)
+
+
+def test_sample_queue_push_block_spans_chunks():
+    """Blocks larger than a chunk are split across chunks without loss"""
+    q = SampleQueue(width=2, chunk_rows=4)
+    block = np.arange(22, dtype=float).reshape(11, 2)
+    q.push_block(block[:5])
+    q.push_block(block[5:])
+
+    np.testing.assert_array_equal(q.drain(), block)
+    assert q.rows_in == q.rows_out == 11
+
+
+def test_sample_queue_drop_oldest_counts_dropped_rows():
+    """Overflow discards the oldest chunk and counts every dropped row"""
+    q = SampleQueue(width=1, chunk_rows=2, max_rows=4, overflow_policy='drop_oldest')
+    for i in range(6):
+        q.push(i)
+
+    data = q.drain()
+    np.testing.assert_array_equal(data[:, 0], [2, 3, 4, 5])
+    assert q.rows_dropped == 2
+    assert q.overflow_events >= 1
+    assert q.rows_in == q.rows_out + q.rows_dropped
+
+
+def test_sample_queue_drop_newest_keeps_queued_rows():
+    q = SampleQueue(width=1, chunk_rows=2, max_rows=4, overflow_policy='drop_newest')
+    for i in range(6):
+        q.push(i)
+
+    np.testing.assert_array_equal(q.drain()[:, 0], [0, 1, 2, 3])
+    assert q.rows_dropped == 2
+    assert q.rows_in == q.rows_out + q.rows_dropped
+
+
+def test_sample_queue_raise_policy():
+    q = SampleQueue(width=1, chunk_rows=2, max_rows=2, overflow_policy='raise')
+    q.push(0)
+    q.push(1)
+    with pytest.raises(QueueOverflowError):
+        q.push(2)
+
+
+def test_sample_queue_rejects_unknown_policy():
+    with pytest.raises(ValueError):
+        SampleQueue(overflow_policy='ignore')
+
+
+def test_sample_batcher_emits_blocks_per_window():
+    """Samples are grouped by the delivery window and come with their magnitudes"""
+    blocks = []
+    batcher = SampleBatcher(blocks.append, window=0.01)
+    for i in range(10):
+        batcher.add(100.0 + i, 3.0, 4.0, 0.0, now=i * 0.004)
+    batcher.flush()
+
+    # the first sample at or past the window closes the block
+    assert [len(block) for block in blocks] == [4, 4, 2]
+    merged = np.concatenate(blocks)
+    np.testing.assert_array_equal(merged[:, 0], 100.0 + np.arange(10))
+    np.testing.assert_allclose(merged[:, 4], 5.0)
+    assert batcher.rows_emitted == 10
+
+
+def test_sample_batcher_zero_window_and_full_block():
+    """window=0 delivers every sample, a full block is emitted before the window ends"""
+    blocks = []
+    SampleBatcher(blocks.append, window=0).add(1.0, 0.0, 0.0, 1.0, now=0)
+    assert len(blocks) == 1 and blocks[0].shape == (1, len(BLOCK_COLUMNS))
+
+    blocks = []
+    batcher = SampleBatcher(blocks.append, window=10, max_rows=4)
+    for i in range(9):
+        batcher.add(float(i), 0.0, 0.0, 0.0, now=0)
+    assert [len(block) for block in blocks] == [4, 4]
+
+
+def test_sample_batcher_flush_from_another_thread_keeps_block_order():
+    """Blocks cut by a timer thread flush and by the callback thread reach the listener in sample order"""
+    blocks = []
+
+    def slow_emit(block):
+        # the partial blocks of the flush thread take long to deliver, full blocks cut meanwhile must wait
+        if len(block) < 8:
+            time.sleep(0.001)
+        blocks.append(block)
+
+    batcher = SampleBatcher(slow_emit, window=10, max_rows=8)
+    stop = threading.Event()
+
+    def flusher():
+        while not stop.is_set():
+            batcher.flush()
+
+    thread = threading.Thread(target=flusher)
+    thread.start()
+    for i in range(2000):
+        batcher.add(float(i), 0.0, 0.0, 0.0, now=0)
+        # samples come one per callback, the flush thread runs in between
+        time.sleep(0)
+    stop.set()
+    thread.join()
+    batcher.flush()
+    np.testing.assert_array_equal(np.concatenate(blocks)[:, 0], np.arange(2000))
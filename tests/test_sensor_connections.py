@@ -0,0 +1,62 @@
+import time
+from PyQt5.QtCore import QObject, pyqtSignal
+from ScopeFoundry.logged_quantity import LQCollection
+from sensor_connections import ConnectionOrchestrator
+
+
+class FakeSensor(QObject):
+    """Hardware component stand-in whose connect/disconnect block like BLE calls"""
+    connection_succeeded = pyqtSignal()
+
+    def __init__(self, name, delay, fail=False):
+        QObject.__init__(self)
+        self.name = name
+        self.delay = delay
+        self.fail = fail
+        self.connect_calls = 0
+        self.settings = LQCollection()
+        self.settings.New('connected', dtype=bool, initial=False)
+        self.settings.connected.updated_value[bool].connect(self.enable_connection)
+
+    def enable_connection(self, enable):
+        # what ScopeFoundry does when the checkbox is toggled, must not run again
+        raise AssertionError("connect() must not be called a second time")
+
+    def connect(self):
+        self.connect_calls += 1
+        time.sleep(self.delay)
+        if self.fail:
+            raise IOError("device not found")
+
+    def disconnect(self):
+        time.sleep(self.delay)
+
+
+def test_sensors_connect_concurrently_with_timeouts():
+    """Total time is that of the slowest device and slow or failing devices are reported"""
+    sensors = [FakeSensor('LeftHandMeta', 0.2), FakeSensor('RightHandMeta', 0.2),
+               FakeSensor('LeftLegMeta', 0.1, fail=True), FakeSensor('RightLegMeta', 1.5)]
+    progress = []
+    orchestrator = ConnectionOrchestrator(sensors, timeout=0.5, progress=lambda *args: progress.append(args))
+    results = orchestrator.connect_all()
+
+    assert orchestrator.elapsed < 1.0
+    assert results['LeftHandMeta'] == results['RightHandMeta'] == 'connected'
+    assert results['LeftLegMeta'].startswith('failed')
+    assert results['RightLegMeta'] == 'timeout'
+    assert sensors[0].settings['connected'] and not sensors[2].settings['connected']
+    assert all(sensor.connect_calls == 1 for sensor in sensors)
+    assert ('LeftHandMeta', 'connecting', 0, 4) in progress
+
+
+def test_disconnect_only_touches_connected_sensors():
+    sensors = [FakeSensor('LeftHandMeta', 0.2), FakeSensor('RightHandMeta', 0.2), FakeSensor('LeftLegMeta', 0)]
+    orchestrator = ConnectionOrchestrator(sensors, timeout=2)
+    orchestrator.connect_all()
+    sensors[2].settings.connected.updated_value[bool].disconnect(sensors[2].enable_connection)
+    sensors[2].settings['connected'] = False
+
+    results = orchestrator.disconnect_all()
+    assert results == {'LeftHandMeta': 'disconnected', 'RightHandMeta': 'disconnected'}
+    assert orchestrator.elapsed < 0.35
+    assert not any(sensor.settings['connected'] for sensor in sensors)
@@ -0,0 +1,33 @@
+import threading
+import numpy as np
+from sensor_ingestion import IngestionWorker
+
+
+def test_worker_runs_calls_in_order_off_the_submitting_thread():
+    """Calls run in submission order on the worker thread, a failing call does not stop the worker"""
+    worker = IngestionWorker('test')
+    worker.start()
+    seen = []
+    worker.submit(lambda: 1 / 0)
+    for i in range(100):
+        worker.submit(lambda i: seen.append((i, threading.current_thread().name)), i)
+    assert worker.wait_idle(1.0)
+    worker.stop()
+    assert [i for i, _ in seen] == list(range(100))
+    assert {name for _, name in seen} == {'test'}
+    stats = worker.stats()
+    assert stats['done'] == 101 and stats['errors'] == 1 and stats['backlog'] == 0
+    assert 0 <= stats['latency_p50'] <= stats['latency_p99'] <= stats['latency_max'] < 1.0
+
+
+def test_worker_bound_drops_oldest_and_stop_runs_queued_calls():
+    """Beyond max_items the oldest calls are dropped and counted, stop still runs what is queued"""
+    worker = IngestionWorker('test', max_items=10)
+    seen = []
+    for i in range(25):
+        worker.submit(seen.append, i)
+    assert worker.dropped == 15
+    worker.start()
+    worker.stop()
+    assert seen == list(range(15, 25))
+    assert np.isfinite(worker.stats()['latency_max'])
@@ -0,0 +1,42 @@
+import numpy as np
+
+from sensor_buffers import BLOCK_COLUMNS, HOST_TIME, DEVICE_TIME
+from sensor_telemetry import SensorTelemetry
+from h5_storage import TELEMETRY_COLUMNS
+
+
+def make_block(device_times, delay=0.02):
+    block = np.zeros((len(device_times), len(BLOCK_COLUMNS)))
+    block[:, 0] = block[:, DEVICE_TIME] = device_times
+    block[:, HOST_TIME] = np.asarray(device_times) + delay
+    return block
+
+
+def test_rate_intervals_and_dropped_samples():
+    """10 s at 100 Hz with 7 samples missing: rate, interval percentiles, loss count and callback times"""
+    device = 1000.0 + np.arange(1000) * 0.01
+    kept = np.delete(device, [100, 101, 102, 500, 501, 502, 503])
+    telemetry = SensorTelemetry('LeftHandMeta', data_rate=100, window=10.0)
+    for part in np.array_split(kept, 100):
+        telemetry.add_block(make_block(part))
+    for seconds in (10e-6, 20e-6, 30e-6):
+        telemetry.record_callback(seconds)
+
+    stats = telemetry.update(now=kept[-1] + 0.02)
+    assert stats['dropped'] == 7
+    assert abs(stats['rate'] - 99.3) < 0.5
+    assert abs(stats['interval_p50'] - 0.01) < 1e-9
+    assert abs(stats['interval_max'] - 0.05) < 1e-9
+    assert abs(stats['callback_mean'] - 20e-6) < 1e-12
+    assert stats['callback_max'] == 30e-6
+
+    row = telemetry.row(limb=2)
+    assert row[TELEMETRY_COLUMNS.index('limb')] == 2
+    assert row[TELEMETRY_COLUMNS.index('dropped')] == 7
+
+    # loss counting continues across blocks, callbacks are only reported once
+    telemetry.add_block(make_block([device[-1] + 0.03]))
+    stats = telemetry.update(now=device[-1] + 0.05)
+    assert stats['dropped'] == 9
+    assert np.isnan(stats['callback_mean'])
+
@@ -0,0 +1,63 @@
+import time
+import numpy as np
+
+from stream_watchdog import StreamWatchdog
+from sensor_buffers import SampleBatcher
+from HW_MetaMotionRL_Sim import SyntheticSource, SimulatedStream
+
+
+def test_stall_reconnects_with_backoff_and_reports_gap():
+    """A stall starts reconnect attempts 1, 2, 4 s apart, the next block closes the gap with the attempt count"""
+    attempts = []
+    gaps = []
+    watchdog = StreamWatchdog(lambda: attempts.append(1), data_rate=100, on_gap=gaps.append, stall_periods=100)
+    watchdog.armed, watchdog.state = True, 'streaming'
+    watchdog.feed(np.array([10.0, 10.5]), now=0.0)
+
+    assert watchdog.check(now=0.9) == 'streaming'
+    assert watchdog.check(now=1.1) == 'stalled'
+    for now in (1.5, 2.0, 2.2, 3.9, 4.3, 7.0, 8.4):
+        watchdog.check(now=now)
+    # attempts at 1.1, 2.2 (1 s later), 4.3 (2 s later), 8.4 (4 s later)
+    assert len(attempts) == 4
+
+    watchdog.feed(np.array([18.0, 18.2]), now=9.0)
+    assert watchdog.state == 'streaming'
+    assert len(gaps) == 1
+    assert (gaps[0].start_time, gaps[0].end_time, gaps[0].reconnects) == (10.5, 18.0, 4)
+    assert abs(gaps[0].duration - 7.5) < 1e-9
+
+    # stopped on purpose, no reconnects
+    watchdog.disarm()
+    assert watchdog.check(now=100.0) == 'idle'
+    assert len(attempts) == 4
+
+
+def test_watchdog_restarts_a_dead_simulated_stream():
+    """A simulated stream whose thread died is replaced by the recover callback and the gap is reported"""
+    gaps = []
+    batcher = SampleBatcher(lambda block: watchdog.feed(block[:, 0]), window=0.01)
+    streams = []
+
+    def start_stream():
+        stream = SimulatedStream(SyntheticSource(data_rate=200, seed=len(streams)),
+                                 lambda x, y, z, t, device_time: batcher.add(t, x, y, z))
+        stream.streaming.set()
+        stream.start()
+        streams.append(stream)
+
+    watchdog = StreamWatchdog(start_stream, data_rate=200, on_gap=gaps.append, stall_periods=20, min_stall=0.2,
+                              initial_backoff=0.2, check_period=0.05)
+    start_stream()
+    watchdog.arm()
+    time.sleep(0.3)
+    streams[0].stop()
+    time.sleep(1.0)
+    watchdog.stop()
+    for stream in streams:
+        stream.stop()
+
+    assert len(streams) == 2
+    assert len(gaps) == 1
+    assert 0.2 < gaps[0].duration < 0.6
+    assert gaps[0].reconnects == 1